@@ -0,0 +1,146 @@
+"""Microbenchmark of the per-row cost of suppressed debug logging
+
+    Times, at the default (ERROR) verbosity, the debug logging done for
+    every row: the JSON body logged before each POST, and the User
+    comparison with its per-role debug calls.  Each is timed the way
+    processor.py used to do it, serializing and logging whatever the log
+    level, and the way it does now (the User comparison through
+    processor._diff_user and a normalized reconcile.RemoteUser), so the
+    saving per row is visible.
+
+    Example:
+    $ python3 bench/bench_debug_logging.py --rows 20000
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config # pylint: disable=wrong-import-position
+import processor # pylint: disable=wrong-import-position
+import reconcile # pylint: disable=wrong-import-position
+
+Admin = collections.namedtuple('Admin', 'propertyName npId firstName lastName roles')
+
+ROLES = ('Group Supervisor', 'FS Property Admin', 'Standard User', 'Developer',
+         'Full Access User', 'Company Supervisor', 'Person Supervisor')
+
+def _user_payload(row: int) -> dict:
+    return {
+        'targetName': 'bench.%d' % row,
+        'site': '8a6e5fbb-5b1b-4e2b-9d6f-%012d' % row,
+        'supervisors': ['c4d2c1f0-2d4a-4a52-8d5f-%012d' % n for n in range(3)],
+        'properties': {'Property': 'Bench Property %d' % row},
+        'firstName': 'Admin',
+        'lastName': 'Property%d' % row,
+        'roles': list(ROLES[:3]),
+    }
+
+def _eager_post_debug(logger, data: dict):
+    """The debug call before a POST as it was: the body is always serialized"""
+    logger.debug('Attempting to create user "%s" via url: %s\njson body: %s',
+                 data['targetName'], 'https://example/api/xm/1/people', json.dumps(data))
+
+def _lazy_post_debug(logger, data: dict):
+    """The debug call before a POST as it is now"""
+    logger.debug('Attempting to create user "%s" via url: %s\njson body: %s',
+                 data['targetName'], 'https://example/api/xm/1/people',
+                 processor._LazyJson(data)) # pylint: disable=protected-access
+
+def _match_field(not_matching_values, value, prop_obj, field_name):
+    """processor._match_field as it was"""
+    if value != prop_obj[field_name]:
+        not_matching_values.append('%s:(cell=[%s],object=[%s])' % (
+            field_name, value, prop_obj[field_name]))
+
+def _eager_users_match(rec, user_obj: dict) -> bool:
+    """processor._users_match as it was: a debug call per pair of roles"""
+    logger = processor._logger # pylint: disable=protected-access
+    logger.debug('Comparing worksheet with xMatters for User "%s".', user_obj['targetName'])
+    not_matching_values = []
+    _match_field(not_matching_values, rec.propertyName, user_obj['properties'],
+                 config.udf_name)
+    _match_field(not_matching_values, rec.npId, user_obj, 'id')
+    _match_field(not_matching_values, rec.firstName, user_obj, 'firstName')
+    _match_field(not_matching_values, rec.lastName, user_obj, 'lastName')
+    ws_roles = rec.roles.split('|')
+    num_ws_roles = len(ws_roles)
+    logger.debug('Found %d ws_roles.', num_ws_roles)
+    ws_role_cnt = 0
+    for ws_role in ws_roles:
+        logger.debug('ws_role: %s', ws_role)
+        for user_role in user_obj['roles']['data']:
+            logger.debug("user_role['name']: %s", user_role['name'])
+            if ws_role == user_role['name']:
+                logger.debug('Matched %s', ws_role)
+                ws_role_cnt += 1
+                break
+    if ws_role_cnt != num_ws_roles:
+        not_matching_values.append('%s:(cell=[%s],site=[%s])' % (
+            'roles', rec.roles, user_obj['roles']['data']))
+    if not_matching_values:
+        logger.error('User "%s" DOES NOT MATCH the source worksheet.%s',
+                     user_obj['targetName'], ', '.join(not_matching_values))
+        return False
+    logger.info('User "%s" matches the source worksheet', user_obj['targetName'])
+    return True
+
+def _time_per_row(func, args_list: list, repeat: int) -> float:
+    """Returns the best time per call, in microseconds, over repeat passes"""
+    def _pass():
+        for args in args_list:
+            func(*args)
+    return min(timeit.repeat(_pass, number=1, repeat=repeat)) / len(args_list) * 1e6
+
+def main():
+    """Prints the per-row cost of each debug logging site, before and after"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='Rows per pass [default: %(default)s]')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Passes, of which the fastest is reported [default: %(default)s]')
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench_debug_logging')
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.ERROR)
+    logger.propagate = False
+    config.non_prod = True
+    config.udf_name = 'Property'
+    processor._logger = logger # pylint: disable=protected-access
+
+    payloads = [(logger, _user_payload(row)) for row in range(args.rows)]
+    user_obj = {
+        'id': None, 'firstName': 'Admin', 'lastName': 'Property',
+        'properties': {'Property': 'Bench Property'},
+        'targetName': 'bench',
+        'roles': {'data': [{'name': role} for role in reversed(ROLES)]},
+    }
+    remote_user = reconcile.RemoteUser(user_obj)
+    recs = [Admin('Bench Property', None, 'Admin', 'Property', '|'.join(ROLES[:3]))
+            for _ in range(args.rows)]
+
+    results = [
+        ('POST body debug', _time_per_row(_eager_post_debug, payloads, args.repeat),
+         _time_per_row(_lazy_post_debug, payloads, args.repeat)),
+        ('User comparison',
+         _time_per_row(_eager_users_match, [(rec, user_obj) for rec in recs], args.repeat),
+         _time_per_row(processor._diff_user, # pylint: disable=protected-access
+                       [(rec, remote_user) for rec in recs], args.repeat)),
+    ]
+    print('%-18s %12s %12s %8s' % ('per row', 'before_us', 'after_us', 'speedup'))
+    for name, before, after in results:
+        print('%-18s %12.2f %12.2f %7.1fx' % (name, before, after, before / after))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""Local stand-in for the xMatters REST endpoints used by new_property
+
+    Serves Sites, People, Devices, Groups, Default Shift members and
+    on-call from memory, so the utility can be run and measured without a
+    live instance.  Responses can be slowed down by a fixed latency, made
+    to fail at a given rate, and throttled with 429s above a given number
+    of requests per second, to mimic a busy instance.
+
+    Besides /api/xm/1/, two control endpoints are served:
+    GET /__stats returns the request counts, and POST /__reset drops
+    every object created since the server started.
+
+    Example:
+    $ python3 bench/fake_xmatters.py --port 8765 --latency 20 --rate-limit 100
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import argparse
+import collections
+import json
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = '/api/xm/1/'
+
+class FakeInstance(object):
+    """In-memory xMatters objects plus request accounting
+
+    Attributes:
+        latency (float): Seconds added to every API response
+        error_rate (float): Fraction of API requests answered with a 500
+        rate_limit (float): Requests per second above which 429 is
+            answered, 0 for no limit
+    """
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0,
+                 rate_limit: float = 0.0, supervisors: list = ()):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._supervisors = list(supervisors)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drops every object and count, then adds the supervisors again"""
+        with self._lock:
+            self.sites = collections.OrderedDict()
+            self.people = collections.OrderedDict()
+            self.groups = collections.OrderedDict()
+            self.members = {}
+            self.devices = collections.defaultdict(list)
+            self.counts = collections.Counter()
+            self._tokens = self.rate_limit
+            self._updated = time.monotonic()
+        for name in self._supervisors:
+            self.add_person({'targetName': name, 'firstName': name,
+                             'lastName': 'Supervisor', 'roles': [],
+                             'properties': {}})
+
+    def admit(self) -> str:
+        """Counts a request and decides whether it is throttled or failed
+
+        Returns:
+            str: 'ok', 'throttled' or 'error'
+        """
+        with self._lock:
+            self.counts['requests'] += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens +
+                                   (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    self.counts['throttled'] += 1
+                    return 'throttled'
+                self._tokens -= 1
+            if self.error_rate and random.random() < self.error_rate:
+                self.counts['errors'] += 1
+                return 'error'
+        return 'ok'
+
+    def stats(self) -> dict:
+        """Returns the request counts and the number of stored objects"""
+        with self._lock:
+            stats = dict(self.counts)
+            stats.update(sites=len(self.sites), people=len(self.people),
+                         groups=len(self.groups),
+                         devices=sum(len(devices) for devices in self.devices.values()))
+        return stats
+
+    def add_person(self, body: dict) -> dict:
+        """Stores a new person the way xMatters returns it with roles embedded"""
+        roles = body.get('roles', [])
+        person = dict(body, id=str(uuid.uuid4()), recipientType='PERSON',
+                      roles={'count': len(roles), 'total': len(roles),
+                             'data': [{'name': role} for role in roles]})
+        person['site'] = {'id': body.get('site')}
+        person['supervisors'] = _collection(
+            [{'id': supervisor} for supervisor in body.get('supervisors', [])])
+        with self._lock:
+            self.people[person['id']] = person
+        return person
+
+    def find(self, kind: str, key: str):
+        """Returns the object of kind whose name or ID is key, or None"""
+        objects = getattr(self, kind)
+        with self._lock:
+            if key in objects:
+                return objects[key]
+            name_field = 'name' if kind == 'sites' else 'targetName'
+            for obj in objects.values():
+                if obj[name_field] == key:
+                    return obj
+        return None
+
+def _collection(data: list, total: int = None, links: dict = None) -> dict:
+    """Wraps a list the way xMatters returns paged collections"""
+    page = {'count': len(data), 'total': len(data) if total is None else total,
+            'data': data}
+    if links:
+        page['links'] = links
+    return page
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves one keep-alive connection against the server's FakeInstance"""
+    protocol_version = 'HTTP/1.1'
+    # Send each response's headers and body in one segment, without delay
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+    @property
+    def instance(self) -> FakeInstance:
+        return self.server.instance
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _not_found(self):
+        self._send(404, {'code': 404, 'reason': 'Not Found',
+                         'message': 'Could not find ' + self.path})
+
+    def _body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def _route(self, method: str):
+        """Parses the request and returns (path parts, query), or None"""
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/__stats' and method == 'GET':
+            self._send(200, self.instance.stats())
+            return None
+        if url.path == '/__reset' and method == 'POST':
+            self._body()
+            self.instance.reset()
+            self._send(200, {})
+            return None
+        if not url.path.startswith(API_PREFIX):
+            self._not_found()
+            return None
+        body = self._body() if method == 'POST' else None
+        admitted = self.instance.admit()
+        if self.instance.latency:
+            time.sleep(self.instance.latency)
+        if admitted == 'throttled':
+            self._send(429, {'code': 429, 'reason': 'Too Many Requests',
+                             'message': 'Rate limit exceeded'},
+                       {'Retry-After': '1'})
+            return None
+        if admitted == 'error':
+            self._send(500, {'code': 500, 'reason': 'Internal Server Error',
+                             'message': 'Injected failure'})
+            return None
+        parts = [urllib.parse.unquote(part)
+                 for part in url.path[len(API_PREFIX):].split('/')]
+        return parts, urllib.parse.parse_qs(url.query), body
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Serves the listings, single objects, rosters, devices and on-call"""
+        route = self._route('GET')
+        if route is None:
+            return
+        parts, query, _ = route
+        instance = self.instance
+        kind = parts[0]
+        if kind == 'on-call':
+            return self._on_call(query)
+        if kind not in ('sites', 'people', 'groups'):
+            return self._not_found()
+        if len(parts) == 1:
+            return self._page(kind, query)
+        obj = instance.find(kind, parts[1])
+        if obj is None:
+            return self._not_found()
+        if len(parts) == 2:
+            return self._send(200, obj)
+        if kind == 'groups' and parts[2] == 'members':
+            return self._send(200, _collection([
+                {'group': {'id': obj['id'], 'targetName': obj['targetName']},
+                 'member': {'id': member, 'recipientType': 'PERSON'}}
+                for member in instance.members.get(obj['id'], [])]))
+        if kind == 'people' and parts[2] == 'devices':
+            return self._send(200, _collection(instance.devices.get(obj['id'], [])))
+        return self._not_found()
+
+    def _page(self, kind: str, query: dict):
+        objects = list(getattr(self.instance, kind).values())
+        offset = int(query.get('offset', ['0'])[0])
+        limit = int(query.get('limit', ['100'])[0])
+        data = objects[offset:offset + limit]
+        links = {'self': self.path}
+        if offset + limit < len(objects):
+            links['next'] = '%s%s?offset=%d&limit=%d' % (API_PREFIX, kind, offset + limit, limit)
+        self._send(200, _collection(data, len(objects), links))
+
+    def _on_call(self, query: dict):
+        entries = []
+        for group_id in query.get('groups', [''])[0].split(','):
+            group = self.instance.find('groups', group_id)
+            if group is None:
+                continue
+            members = [
+                {'position': position, 'delay': 0,
+                 'member': {'id': member,
+                            'targetName': self.instance.people[member]['targetName'],
+                            'recipientType': 'PERSON'}}
+                for position, member in enumerate(self.instance.members.get(group['id'], []), 1)
+                if member in self.instance.people]
+            entries.append({'group': {'id': group['id']},
+                            'shift': {'name': 'Default Shift'},
+                            'members': _collection(members)})
+        self._send(200, _collection(entries))
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Creates Sites, People, Devices, Groups and Default Shift members"""
+        route = self._route('POST')
+        if route is None:
+            return
+        parts, _, body = route
+        instance = self.instance
+        kind = parts[0]
+        if kind == 'sites' and len(parts) == 1:
+            site = dict(body, id=str(uuid.uuid4()))
+            site.setdefault('latitude', 0.0)
+            site.setdefault('longitude', 0.0)
+            instance.sites[site['id']] = site
+            return self._send(201, site)
+        if kind == 'people' and len(parts) == 1:
+            return self._send(201, instance.add_person(body))
+        if kind == 'devices' and len(parts) == 1:
+            device = dict(body, id=str(uuid.uuid4()))
+            instance.devices[body.get('owner')].append(device)
+            return self._send(201, device)
+        if kind == 'groups' and len(parts) == 1:
+            group = dict(body, id=str(uuid.uuid4()), site={'id': body.get('site')},
+                         supervisors=_collection(
+                             [{'id': supervisor} for supervisor in body.get('supervisors', [])]))
+            instance.groups[group['id']] = group
+            return self._send(201, group)
+        if kind == 'groups' and parts[2:4] == ['shifts', 'Default Shift']:
+            group = instance.find('groups', parts[1])
+            if group is None:
+                return self._not_found()
+            member = body['recipient']['id']
+            instance.members.setdefault(group['id'], []).append(member)
+            return self._send(200, {'recipient': {'id': member, 'recipientType': 'PERSON'},
+                                    'group': {'id': group['id']}})
+        return self._not_found()
+
+def serve(port: int, instance: FakeInstance) -> ThreadingHTTPServer:
+    """Returns a started server for instance on 127.0.0.1:port"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+    server.daemon_threads = True
+    server.instance = instance
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    """Runs the fake instance until interrupted"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port to listen on [default: %(default)s]')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Milliseconds added to every response [default: %(default)s]')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 500 [default: %(default)s]')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help=('Requests per second above which 429 is answered, '
+                              '0 for no limit [default: %(default)s]'))
+    parser.add_argument('--supervisors', default='boss',
+                        help='Comma separated Users that exist from the start [default: %(default)s]')
+    args = parser.parse_args()
+    instance = FakeInstance(args.latency / 1000.0, args.error_rate, args.rate_limit,
+                            args.supervisors.split(','))
+    server = serve(args.port, instance)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Generates input workbooks of any number of properties for benchmarking
+
+    Each property gets one Site, admins_per Admin Users (with an email and
+    an sms device) and one Security Group, laid out like
+    NEW-PROPERTY-INPUT-TEMPLATE.xlsx.
+
+    Example:
+    $ python3 bench/make_workbook.py 1000 /tmp/props-1000.xlsx --admins 2
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import argparse
+
+from openpyxl import Workbook
+
+SITES_HEADER = ('propertyName', 'prodId', 'npId', 'name', 'address1', 'address2',
+                'city', 'country', 'language', 'postalCode', 'state', 'timezone',
+                'latitude', 'longitude')
+ADMINS_HEADER = ('propertyName', 'prodId', 'npId', 'targetName', 'firstName',
+                 'lastName', 'roles', 'site', 'email', 'sms', 'voice')
+GROUPS_HEADER = ('propertyName', 'prodId', 'npId', 'targetName', 'site')
+
+def make_workbook(filename: str, properties: int, admins_per: int = 2):
+    """Writes a workbook of properties Sites, Admins and Groups to filename
+
+    Args:
+        filename (str): Location of the new .xlsx file
+        properties (int): Number of properties
+        admins_per (int): Number of Admin Users per property
+    """
+    book = Workbook(write_only=True)
+    sites = book.create_sheet('Sites')
+    admins = book.create_sheet('Admins')
+    groups = book.create_sheet('Groups')
+    sites.append(SITES_HEADER)
+    admins.append(ADMINS_HEADER)
+    groups.append(GROUPS_HEADER)
+    for prop in range(properties):
+        property_name = 'Bench Property %d' % prop
+        site_name = 'Bench Site %d' % prop
+        sites.append((property_name, None, None, site_name, '%d Main St' % prop,
+                      None, 'City', 'USA', 'en', '9%04d' % (prop % 10000), 'CA',
+                      'US/Pacific', None, None))
+        for admin in range(admins_per):
+            admins.append((property_name, None, None, 'bench.%d.%d' % (prop, admin),
+                           'Admin%d' % admin, 'Property%d' % prop,
+                           'Group Supervisor|FS Property Admin', site_name,
+                           'bench.%d.%d@example.com' % (prop, admin),
+                           '+1555%07d' % (prop * admins_per + admin), None))
+        groups.append((property_name, None, None, site_name + ' - Security', site_name))
+    book.save(filename)
+
+def main():
+    """Writes the workbook named on the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('properties', type=int, help='Number of properties')
+    parser.add_argument('filename', help='Location of the new .xlsx file')
+    parser.add_argument('--admins', type=int, default=2,
+                        help='Admin Users per property [default: %(default)s]')
+    args = parser.parse_args()
+    make_workbook(args.filename, args.properties, args.admins)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""End-to-end benchmark of new_property against the local fake instance
+
+    For each workbook size, starts a fresh fake_xmatters instance, runs
+    the sites, admins and groups commands in turn, then all and the report
+    against a clean instance, each as its own new_property.py process.
+    Every run's wall time, number of requests served and peak resident
+    set size are appended as one JSON object per line to the results file,
+    and printed as a table.
+
+    Example:
+    $ python3 bench/run_bench.py --sizes 10,100,1000 --latency 20 -- --workers 8
+
+    Anything after -- is passed on to new_property.py, e.g. --async.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import fake_xmatters
+import make_workbook
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, 'results.jsonl')
+COMMANDS = ('sites', 'admins', 'groups', 'all', 'report')
+SUPERVISOR = 'bench.supervisor'
+
+def _git_revision() -> str:
+    """Returns the short commit ID of the tree being measured, or ''"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def _server_stats(base_url: str) -> dict:
+    with urllib.request.urlopen(base_url + '/__stats') as response:
+        return json.loads(response.read())
+
+def _write_defaults(work_dir: str, base_url: str, workbook: str) -> str:
+    """Writes the defaults file for one size and returns its location"""
+    defaults = {
+        'xmodURL': base_url,
+        'user': 'bench',
+        'password': 'bench',
+        'outDirectory': work_dir,
+        'dirSep': os.sep,
+        'propertiesFilename': workbook,
+        'logFilename': 'bench',
+        'reportFilename': 'report.xlsx',
+        'instance': 'np',
+        'udfName': 'Property',
+        'supervisors': SUPERVISOR,
+        'verbosity': 0,
+    }
+    filename = os.path.join(work_dir, 'defaults.json')
+    with open(filename, 'w') as defaults_file:
+        json.dump(defaults, defaults_file, indent=4)
+    return filename
+
+def _run(command: str, defaults: str, extra_args: list, base_url: str) -> dict:
+    """Runs one new_property.py command and returns its measurements"""
+    argv = ([sys.executable, os.path.join(REPO_DIR, 'new_property.py'),
+             '-d', defaults, '--no-cache'] + extra_args + [command])
+    before = _server_stats(base_url).get('requests', 0)
+    started = time.monotonic()
+    process = subprocess.Popen(argv, cwd=REPO_DIR, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.monotonic() - started
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    if process.returncode:
+        sys.stderr.write(stderr.decode(errors='replace'))
+    return {
+        'wall_s': round(wall, 3),
+        'requests': _server_stats(base_url).get('requests', 0) - before,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_kb': usage.ru_maxrss,
+        'rc': process.returncode,
+    }
+
+def bench_size(size: int, args, revision: str) -> list:
+    """Benchmarks every command against a workbook of size properties
+
+    Returns:
+        list: One result dict per command run
+    """
+    instance = fake_xmatters.FakeInstance(args.latency / 1000.0, args.error_rate,
+                                          args.rate_limit, [SUPERVISOR])
+    server = fake_xmatters.serve(0, instance)
+    base_url = 'http://127.0.0.1:%d' % server.server_address[1]
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='np-bench-') as work_dir:
+            workbook = os.path.join(work_dir, 'properties.xlsx')
+            defaults = _write_defaults(work_dir, base_url, workbook)
+            for command in args.commands:
+                if command in ('sites', 'all'):
+                    # sites starts a step by step pass, all a one shot pass;
+                    # both begin from an empty instance and a fresh workbook
+                    instance.reset()
+                    make_workbook.make_workbook(workbook, size, args.admins)
+                result = {
+                    'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'revision': revision,
+                    'size': size,
+                    'command': command,
+                    'latency_ms': args.latency,
+                    'args': ' '.join(args.extra),
+                }
+                result.update(_run(command, defaults, args.extra, base_url))
+                results.append(result)
+                print('%7d  %-7s %9.2f %9d %11d %3d' % (
+                    size, command, result['wall_s'], result['requests'],
+                    result['peak_rss_kb'], result['rc']), flush=True)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+def main():
+    """Runs the benchmark described on the command line"""
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n')[0],
+        epilog='Arguments after -- are passed on to new_property.py')
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help=('Comma separated numbers of properties, e.g. '
+                              '10,100,1000,10000 [default: %(default)s]'))
+    parser.add_argument('--commands', default=','.join(COMMANDS),
+                        help='Comma separated commands to run [default: %(default)s]')
+    parser.add_argument('--admins', type=int, default=2,
+                        help='Admin Users per property [default: %(default)s]')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Milliseconds added to every response [default: %(default)s]')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 500 [default: %(default)s]')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help=('Requests per second above which 429 is answered, '
+                              '0 for no limit [default: %(default)s]'))
+    parser.add_argument('--results', default=DEFAULT_RESULTS,
+                        help='JSON Lines file the results are appended to [default: %(default)s]')
+    parser.add_argument('extra', nargs=argparse.REMAINDER,
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.extra and args.extra[0] == '--':
+        args.extra = args.extra[1:]
+    args.commands = [command for command in args.commands.split(',') if command]
+    for command in args.commands:
+        if command not in COMMANDS:
+            parser.error('unknown command %r, choose from %s' % (command, ', '.join(COMMANDS)))
+
+    revision = _git_revision()
+    print('%7s  %-7s %9s %9s %11s %3s' % ('size', 'command', 'wall_s', 'requests',
+                                          'peak_rss_kb', 'rc'))
+    with open(args.results, 'a') as results_file:
+        for size in (int(size) for size in args.sizes.split(',')):
+            for result in bench_size(size, args, revision):
+                results_file.write(json.dumps(result) + '\n')
+            results_file.flush()
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@
    http://google.github.io/styleguide/pyguide.htm
 """
 
+import os
 import sys
 import time
 import json
@@ -16,32 +17,68 @@ from requests import auth
 import config
 import np_logger
 import processor
+import report
+import xm_metrics
 
 
+def _process(objects_to_process: list):
+    """Runs the requested phases with threads, or with asyncio if --async"""
+    if config.use_async:
+        return processor.process_async(objects_to_process)
+    processor.process(objects_to_process)
+    return 0
+
 def process_sites(args):
     """Called when command line specifies sites"""
     np_logger.get_logger().debug('Processing Sites only')
-    processor.process(['sites'])
-    return
+    return _process(['sites'])
 
 def process_admins(args):
     """Called when command line specifies admins"""
     np_logger.get_logger().debug('Processing Admins only')
-    processor.process(['admins'])
-    return
+    return _process(['admins'])
 
 def process_groups(args):
     """Called when command line specifies groups"""
     np_logger.get_logger().debug('Processing Groups only')
-    processor.process(['groups'])
-    return
+    return _process(['groups'])
 
 def process_all(args):
     """Called when command line specifies all operations"""
     np_logger.get_logger().debug('Processing Sites, Admins, and Groups')
-    processor.process(['sites','admin','groups'])
+    return _process(['sites','admins','groups'])
+
+def process_verify(args):
+    """Called when command line specifies verify"""
+    np_logger.get_logger().debug('Verifying Sites, Admins, and Groups')
+    return processor.verify()
+
+def process_plan(args):
+    """Called when command line specifies plan"""
+    np_logger.get_logger().debug('Planning Sites, Admins, and Groups')
+    return processor.plan(config.plan_filename)
+
+def process_apply(args):
+    """Called when command line specifies apply"""
+    np_logger.get_logger().debug('Applying the plan in %s', config.plan_filename)
+    return processor.apply(config.plan_filename)
+
+def process_report(args):
+    """Called when command line specifies report"""
+    np_logger.get_logger().debug('Generating the Group on-call report')
+    report.generate(config.report_filename, config.report_format)
     return
 
+def finish_metrics():
+    """Logs the run's request and phase metrics, and writes them if asked"""
+    snapshot = xm_metrics.get_metrics().snapshot()
+    logger = np_logger.get_logger()
+    for line in xm_metrics.summary(snapshot):
+        logger.info(line)
+    if config.metrics_filename:
+        xm_metrics.write(config.metrics_filename, config.metrics_format)
+        logger.info('Wrote the run metrics to %s', config.metrics_filename)
+
 class _CLIError(Exception):
     """Generic exception to raise and log different fatal errors."""
     def __init__(self, msg, rc=config.ERR_CLI_EXCEPTION):
@@ -95,12 +132,33 @@ USAGE
             formatter_class=argparse.RawDescriptionHelpFormatter)
         subparsers = parser.add_subparsers(dest='command_name')
         # Add common arguments
+        parser.add_argument("--async", dest="use_async",
+                            action='store_true',
+                            help=(
+                                  "If specified, send the xmatters requests "
+                                  "from a single asyncio event loop, and "
+                                  "process every property (Site, Admins and "
+                                  "Groups) concurrently."))
+        parser.add_argument("--cachettl", dest="cache_ttl",
+                            type=int, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the number of seconds a cached "
+                                  "xmatters response stays valid. "
+                                  "[default: %d]" % config.DEFAULT_CACHE_TTL))
         parser.add_argument("-c", "--console", dest="noisy",
                             action='store_true',
                             help=(
                                 "If specified, will echo all log output to "
                                 "the console at the requested verbosity based "
                                 "on the -v option"))
+        parser.add_argument("--connecttimeout", dest="connect_timeout",
+                            type=float, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the number of seconds to wait for "
+                                  "a connection to the xmatters instance. "
+                                  "[default: %d]" % config.DEFAULT_CONNECT_TIMEOUT))
         parser.add_argument("-d", "--defaults", dest="defaults_filename",
                             default="defaults.json",
                             help=(
@@ -127,6 +185,40 @@ USAGE
                                 "-l to specify the base name of the log file. "
                                 "The name will have a timestamp and .log "
                                 "appended to the end."))
+        parser.add_argument("--logjson", dest="log_json",
+                            action='store_true',
+                            help=(
+                                  "If specified, also write every log record "
+                                  "as a JSON object per line to a .jsonl file "
+                                  "next to the log file, for machine parsing."))
+        parser.add_argument("--maxinflight", dest="max_in_flight",
+                            type=int, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the most requests waiting on the "
+                                  "xmatters instance at any one time; 0 means "
+                                  "the pool size. [default: the pool size]"))
+        parser.add_argument("--metrics", dest="metrics_filename",
+                            default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the file the run's request and "
+                                  "phase metrics are written to, in the output "
+                                  "directory unless it is an absolute path. "
+                                  "[default: not written]"))
+        parser.add_argument("--metricsformat", dest="metrics_format",
+                            choices=config.METRICS_FORMATS, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the format of the metrics file: "
+                                  "json, or prom for the Prometheus text "
+                                  "format. [default: prom if the file name "
+                                  "ends in .prom, else json]"))
+        parser.add_argument("--no-cache", dest="no_cache",
+                            action='store_true',
+                            help=(
+                                  "If specified, neither read nor write the "
+                                  "local cache of xmatters responses."))
         parser.add_argument("-o", "--odir", dest="out_directory",
                             default=None,
                             help=(
@@ -139,6 +231,55 @@ USAGE
                                   "If not specified in the defaults file, use -p"
                                   " to specify a password either on the command"
                                   " line, or be prompted"))
+        parser.add_argument("--prefetch", dest="prefetch",
+                            action='store_true',
+                            help=(
+                                  "If specified, read the existing xmatters "
+                                  "objects with paged listing requests up "
+                                  "front, instead of one request per "
+                                  "worksheet row."))
+        parser.add_argument("--poolsize", dest="pool_size",
+                            type=int, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the maximum number of keep-alive "
+                                  "connections held open to the xmatters "
+                                  "instance. [default: %d]" %
+                                  config.DEFAULT_POOL_SIZE))
+        parser.add_argument("--ratelimit", dest="rate_limit",
+                            type=float, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the most requests per second sent "
+                                  "to the xmatters instance; the rate backs "
+                                  "off while xmatters answers 429 and recovers "
+                                  "as requests succeed. 0 means no limit, and "
+                                  "429s are then only retried after a backoff, "
+                                  "so set this to the instance's limit. "
+                                  "[default: %d]" %
+                                  config.DEFAULT_RATE_LIMIT))
+        parser.add_argument("--readtimeout", dest="read_timeout",
+                            type=float, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the number of seconds to wait for "
+                                  "data from the xmatters instance before the "
+                                  "request is failed, or retried. "
+                                  "[default: %d]" % config.DEFAULT_READ_TIMEOUT))
+        parser.add_argument("--refresh-cache", dest="refresh_cache",
+                            action='store_true',
+                            help=(
+                                  "If specified, discard the local cache of "
+                                  "xmatters responses and build it again "
+                                  "during this run."))
+        parser.add_argument("--retries", dest="retries",
+                            type=int, default=None,
+                            help=(
+                                  "If not specified in the defaults file, use "
+                                  "this for the number of times a throttled "
+                                  "(429) or transiently failing request is "
+                                  "retried, with exponential backoff. "
+                                  "[default: %d]" % config.DEFAULT_RETRIES))
         parser.add_argument("-s", "--supervisors", dest="supervisors",
                             default=None,
                             help=(
@@ -170,6 +311,13 @@ USAGE
                                 "WARNING logging, a double v (-vv) means add "
                                 "INFO logging, and a tripple v (-vvv) means "
                                 "add DEBUG logging [default: %(default)s]"))
+        parser.add_argument("--workers", dest="workers",
+                            type=int, default=None,
+                            help=("If not specified in the defaults file, use "
+                                  "this for the number of worksheet rows "
+                                  "processed at the same time, or with --async "
+                                  "for the least number of connections to the "
+                                  "xmatters instance. [default: 1]"))
         parser.add_argument("-x", "--xmodurl", dest="xmod_url",
                             default=None,
                             help=("If not specified in the defaults file, use "
@@ -194,6 +342,61 @@ USAGE
             help=("Use this command in order to process all worksheets "
                   "from the infput file: Sites, Admins, Groups."))
         all_parser.set_defaults(func=process_all)
+        verify_parser = subparsers.add_parser(
+            'verify', description=("Compares Sites, Admins, and Groups with "
+                                   "xmatters, without changing either"),
+            help=("Use this command in order to only report differences "
+                  "between the input file and xmatters."))
+        verify_parser.set_defaults(func=process_verify)
+        plan_parser = subparsers.add_parser(
+            'plan', description=("Works out what 'all' would change in "
+                                 "xmatters and the input file, without "
+                                 "changing either"),
+            help=("Use this command in order to write the changes 'all' "
+                  "would make to a plan file, to be carried out by 'apply'."))
+        plan_parser.add_argument("--plan", dest="plan_filename",
+                                 default=None,
+                                 help=(
+                                     "Use --plan to specify the plan file to "
+                                     "write. [default: %s in the output "
+                                     "directory]" % config.DEFAULT_PLAN_FILENAME))
+        plan_parser.set_defaults(func=process_plan)
+        apply_parser = subparsers.add_parser(
+            'apply', description=("Carries out a plan written by 'plan'"),
+            help=("Use this command in order to make exactly the changes of "
+                  "a plan file, without reading xmatters again."))
+        apply_parser.add_argument("--plan", dest="plan_filename",
+                                  default=None,
+                                  help=(
+                                      "Use --plan to specify the plan file to "
+                                      "apply. [default: %s in the output "
+                                      "directory]" % config.DEFAULT_PLAN_FILENAME))
+        apply_parser.set_defaults(func=process_apply)
+        report_parser = subparsers.add_parser(
+            'report', description=("Writes today's on-call members of every "
+                                   "Group to an .xlsx report"),
+            help=("Use this command in order to generate the Group on-call "
+                  "report."))
+        report_parser.add_argument("-r", "--rfile", dest="report_filename",
+                                   default=None,
+                                   help=(
+                                       "If not specified in the defaults "
+                                       "file, use -r to specify the name of "
+                                       "the report file, written to the "
+                                       "output directory; a name without an "
+                                       "extension gets the format's. "
+                                       "[default: %s.<format>]" %
+                                       config.DEFAULT_REPORT_FILENAME))
+        report_parser.add_argument("-F", "--format", dest="report_format",
+                                   default=None,
+                                   choices=list(report.WRITERS),
+                                   help=(
+                                       "If not specified in the defaults "
+                                       "file, use -F to choose the report "
+                                       "format: xlsx for Excel, or csv or "
+                                       "jsonl for downstream processing. "
+                                       "[default: xlsx]"))
+        report_parser.set_defaults(func=process_report)
 
         # Process arguments
         args = parser.parse_args()
@@ -217,12 +420,47 @@ USAGE
             user = args.user
         if args.verbose > 0:
             config.verbosity = args.verbose
+        if args.log_json:
+            config.log_json = True
         if args.xmod_url:
             config.xmod_url = args.xmod_url
+        if getattr(args, 'report_filename', None):
+            config.report_filename = args.report_filename
+        if getattr(args, 'report_format', None):
+            config.report_format = args.report_format
+        if getattr(args, 'plan_filename', None):
+            config.plan_filename = args.plan_filename
         if args.udf_name:
             config.udf_name = args.udf_name
         if args.supervisors:
             config.supervisors = args.supervisors.split(',')
+        if args.pool_size:
+            config.pool_size = args.pool_size
+        workers = args.workers
+        if args.prefetch:
+            config.prefetch = True
+        if args.use_async:
+            config.use_async = True
+        if args.no_cache:
+            config.use_cache = False
+        if args.refresh_cache:
+            config.refresh_cache = True
+        if args.cache_ttl is not None:
+            config.cache_ttl = args.cache_ttl
+        if args.rate_limit is not None:
+            config.rate_limit = args.rate_limit
+        if args.max_in_flight is not None:
+            config.max_in_flight = args.max_in_flight
+        if args.retries is not None:
+            config.retries = args.retries
+        if args.connect_timeout:
+            config.connect_timeout = args.connect_timeout
+        if args.read_timeout:
+            config.read_timeout = args.read_timeout
+        if args.metrics_filename:
+            config.metrics_filename = args.metrics_filename
+        if args.metrics_format:
+            config.metrics_format = args.metrics_format
 
         # Try to read in the defaults from defaults.json
         try:
@@ -248,6 +486,8 @@ USAGE
             config.out_directory = cfg['outDirectory']
         if config.xmod_url is None and 'xmodURL' in cfg:
             config.xmod_url = cfg['xmodURL']
+        if not config.log_json and 'logJson' in cfg:
+            config.log_json = bool(cfg['logJson'])
         if config.verbosity == 0 and 'verbosity' in cfg:
             if cfg['verbosity'] in [1, 2, 3]:
                 config.verbosity = cfg['verbosity']
@@ -255,6 +495,40 @@ USAGE
             config.udf_name = cfg['udfName']
         if config.supervisors is None and 'supervisors' in cfg:
             config.supervisors = cfg['supervisors'].split(',')
+        if config.pool_size is None and 'poolSize' in cfg:
+            config.pool_size = cfg['poolSize']
+        if workers is None and 'workers' in cfg:
+            workers = cfg['workers']
+        if workers:
+            config.workers = workers
+        if not config.prefetch and 'prefetch' in cfg:
+            config.prefetch = bool(cfg['prefetch'])
+        if not config.use_async and 'async' in cfg:
+            config.use_async = bool(cfg['async'])
+        if config.report_filename is None and 'reportFilename' in cfg:
+            config.report_filename = cfg['reportFilename']
+        if config.report_format is None and 'reportFormat' in cfg:
+            config.report_format = cfg['reportFormat']
+        if 'reportDevices' in cfg:
+            config.report_devices = cfg['reportDevices']
+        if 'adminDevices' in cfg:
+            config.admin_devices = cfg['adminDevices']
+        if config.cache_ttl is None and 'cacheTTL' in cfg:
+            config.cache_ttl = cfg['cacheTTL']
+        if config.rate_limit is None and 'rateLimit' in cfg:
+            config.rate_limit = cfg['rateLimit']
+        if config.max_in_flight is None and 'maxInFlight' in cfg:
+            config.max_in_flight = cfg['maxInFlight']
+        if config.retries is None and 'retries' in cfg:
+            config.retries = cfg['retries']
+        if config.connect_timeout is None and 'connectTimeout' in cfg:
+            config.connect_timeout = cfg['connectTimeout']
+        if config.read_timeout is None and 'readTimeout' in cfg:
+            config.read_timeout = cfg['readTimeout']
+        if config.metrics_filename is None and 'metricsFilename' in cfg:
+            config.metrics_filename = cfg['metricsFilename']
+        if config.metrics_format is None and 'metricsFormat' in cfg:
+            config.metrics_format = cfg['metricsFormat']
         if 'instance' in cfg:
             config.non_prod = True if cfg['instance'] == 'np' else False
         config.command_name = args.command_name
@@ -265,9 +539,31 @@ USAGE
             config.log_filename = (
                 config.out_directory + config.dir_sep +
                 config.log_filename + time_str + '.log')
-
-        # Initialize logging
+        if config.plan_filename is None:
+            config.plan_filename = (
+                config.out_directory + config.dir_sep +
+                config.DEFAULT_PLAN_FILENAME)
+        if config.report_format not in report.WRITERS:
+            config.report_format = 'xlsx'
+        report_filename = config.report_filename or config.DEFAULT_REPORT_FILENAME
+        if not os.path.splitext(report_filename)[1]:
+            report_filename += '.' + config.report_format
+        config.report_filename = (
+            config.out_directory + config.dir_sep + report_filename)
+
+        if config.metrics_filename:
+            if not os.path.isabs(config.metrics_filename):
+                config.metrics_filename = (
+                    config.out_directory + config.dir_sep +
+                    config.metrics_filename)
+            if config.metrics_format not in config.METRICS_FORMATS:
+                config.metrics_format = (
+                    'prom' if config.metrics_filename.endswith('.prom')
+                    else 'json')
+
+        # Initialize logging and the run's metrics
         logger = np_logger.get_logger()
+        xm_metrics.get_metrics()
         logger.info("Four Seassons Property Processor Started.")
         logger.debug("After parser.parse_args(), command_name=%s",
                     args.command_name)
@@ -8,6 +8,7 @@
 
 import sys
 import os
+from collections import OrderedDict
 
 # Used by command line processor
 VERSION = 0.1
@@ -22,6 +23,46 @@ LICENSE_REF = 'http://www.apache.org/licenses/LICENSE-2.0'
 DEBUG = 0
 TESTRUN = 0
 PROFILE = 0
+DEFAULT_POOL_SIZE = 10
+PAGE_SIZE = 1000
+DEFAULT_CACHE_TTL = 3600
+# Requests per second to an instance, 0 for no limit
+DEFAULT_RATE_LIMIT = 0
+DEFAULT_RETRIES = 5
+# Seconds to wait for a connection to, and for data from, the instance
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+CACHE_FILENAME = 'new_property.cache.sqlite'
+JOURNAL_SUFFIX = '.journal.jsonl'
+DEFAULT_PLAN_FILENAME = 'new_property.plan.json'
+PLAN_VERSION = 2
+DEFAULT_REPORT_FILENAME = 'GroupReport'
+# Formats of the run metrics file: JSON, or the Prometheus text format
+METRICS_FORMATS = ('json', 'prom')
+# Admins column -> (device name, device type, device field) of the devices
+# added to a new User; columns missing from the worksheet or empty are skipped
+DEFAULT_ADMIN_DEVICES = OrderedDict([
+    ('email', ('Work Email', 'EMAIL', 'emailAddress')),
+    ('sms', ('SMS Phone', 'TEXT_PHONE', 'phoneNumber')),
+    ('voice', ('Work Phone', 'VOICE', 'phoneNumber')),
+])
+# Device name -> (report column, device field holding its address)
+DEFAULT_REPORT_DEVICES = OrderedDict([
+    ('Android phone', ('android_phone', 'description')),
+    ('Android tablet', ('android_tablet', 'description')),
+    ('Home Email', ('home_email', 'emailAddress')),
+    ('Home Phone', ('home_phone', 'phoneNumber')),
+    ('iPad', ('ipad', 'description')),
+    ('iPhone', ('iphone', 'description')),
+    ('Mobile Phone', ('mobile_phone', 'phoneNumber')),
+    ('Other Phone', ('other_phone', 'phoneNumber')),
+    ('SMS Phone', ('sms_phone', 'phoneNumber')),
+    ('Work Email', ('work_email', 'emailAddress')),
+    ('Work Phone', ('work_phone', 'phoneNumber')),
+    ('Q10', ('Q10', 'phoneNumber')),
+    ('Z10', ('Z10', 'phoneNumber')),
+    ('Z30', ('Z30', 'phoneNumber')),
+])
 
 """ Global Variables
     Defaults are set from configuration file via processArgs()
@@ -36,12 +77,29 @@ dir_sep = "/"
 basic_auth = None
 verbosity = 0
 noisy = False
+log_json = False
 non_prod = True
 supervisors = None
-supervisor_ids = []
-device_type = "EMAIL"
-device_name = "Work Email"
 udf_name = None
+pool_size = None
+workers = 1
+prefetch = False
+use_async = False
+use_cache = True
+refresh_cache = False
+cache_ttl = None
+rate_limit = None
+max_in_flight = None
+retries = None
+connect_timeout = None
+read_timeout = None
+report_filename = None
+report_format = None
+report_devices = None
+admin_devices = None
+plan_filename = None
+metrics_filename = None
+metrics_format = None
 
 # Error codes
 ERR_CLI_EXCEPTION = -1
@@ -64,7 +122,8 @@ ERR_CLI_MISSING_PROPERTIES_FILENAME_MSG = ("Properties information filename was
                                            "specified on the command line or via defaults")
 ERR_CLI_MISSING_COMMAND_CODE = -8
 ERR_CLI_MISSING_COMMAND_MSG = ("A command was not specified.  Must specify 'sites', "
-                               "'admins', 'groups', or 'all'")
+                               "'admins', 'groups', 'all', 'verify', 'plan', "
+                               "'apply', or 'report'")
 ERR_CLI_MISSING_SUPERVISORS_CODE = -9
 ERR_CLI_MISSING_SUPERVISORS_MSG = ("'supervisors' was not specified on the "
                                    "command line or via defaults")
@@ -75,6 +134,18 @@ ERR_REQUEST_NEXT_EXCEPTION_CODE = -11
 ERR_INITIAL_REQUEST_FAILED_CODE = -12
 ERR_INITIAL_REQUEST_FAILED_MSG = ("Error %d on initial request to %s.\nPlease "
                                   "verify instance address, user, and password")
+ERR_SCHEMA_MISSING_SHEET_CODE = -13
+ERR_SCHEMA_MISSING_SHEET_MSG = ("The properties file has no '%s' worksheet")
+ERR_SCHEMA_MISSING_FIELDS_CODE = -14
+ERR_SCHEMA_MISSING_FIELDS_MSG = ("The header row of the '%s' worksheet is "
+                                 "missing the field(s): %s")
+ERR_PLAN_MISMATCH_CODE = -15
+ERR_PLAN_MISMATCH_MSG = ("The plan %s was made for a different %s; run "
+                         "'plan' again")
+ERR_ASYNC_UNAVAILABLE_CODE = -16
+ERR_ASYNC_UNAVAILABLE_MSG = ("--async needs the aiohttp module; install it "
+                             "with 'pip install aiohttp' or run without "
+                             "--async\nException: %s")
 
 def main():
     """ To pass conventions, in case we need to execute main """
@@ -0,0 +1,85 @@
+"""Write-ahead journal of worksheet updates
+
+    Every ID written into the properties workbook is first appended to a
+    small JSONL file next to it.  The workbook itself is only saved once,
+    at the end of a run; if the run dies before that, the next run replays
+    the journal into the freshly loaded workbook so no created IDs are lost.
+    The same journal records which actions of a plan were applied.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import json
+import os
+
+class Journal(object):
+    """Append-only JSONL record of workbook writes not yet saved
+
+    Each line holds one write: {"sheet", "row", "field", "value"}.
+
+    Attributes:
+        filename (str): Location of the journal file
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = None
+
+    def entries(self):
+        """Returns the entries left behind by an unfinished run
+
+        A partially written line, as left by a crash, is ignored.
+
+        Returns:
+            list: The journaled entries as dicts, oldest first
+        """
+        entries = []
+        if not os.path.exists(self.filename):
+            return entries
+        with open(self.filename) as journal_file:
+            for line in journal_file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries
+
+    def append(self, sheet: str, row: int, field: str, value):
+        """Durably records one workbook write before it is applied"""
+        self.record({'sheet': sheet, 'row': row, 'field': field, 'value': value})
+
+    def record(self, entry: dict):
+        """Durably records one entry, e.g. the progress of a plan being applied"""
+        if self._file is None:
+            self._file = open(self.filename, 'a+')
+            # Never continue a line cut short by a crash
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != '\n':
+                    self._file.write('\n')
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        # Each entry follows a completed request, so the sync is cheap by
+        # comparison, and without it a power loss could still drop it
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """Closes the journal file, keeping its entries"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """Discards the journal once its writes are saved in the workbook"""
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,114 @@
 """Creates and manages a singleton logger instance.
 
+    Logging calls only put their record on a queue; a background listener
+    thread writes the records to the log file, the console and, if
+    requested, a JSON Lines file, so that no worker waits on file or
+    console I/O, or on another worker's write.
+
     Attributes:
         _logger (Logger): Holds the instance of the shared logger
+        _listener (QueueListener): Writes the queued records to the handlers
+        _buffers (local): Per-thread record buffers used by buffered()
 
 .. _Google Python Style Guide:
    http://google.github.io/styleguide/pyguide.html
 
 """
 
+import atexit
+import json
 import logging
-from logging import config as logging_config
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from logging import Logger
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 import config
 
 __logger = None
+__listener = None
+_buffers = threading.local()
+
+class _JsonLinesFormatter(logging.Formatter):
+    """Formats a record as one JSON object, for machine parsing"""
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) +
+                    '.%03d' % record.msecs,
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+            'module': record.module,
+            'function': record.funcName,
+            'line': record.lineno,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+class _BufferFilter(logging.Filter):
+    """Diverts records into the calling thread's buffer when one is active"""
+    def filter(self, record):
+        records = getattr(_buffers, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+@contextmanager
+def buffered():
+    """Captures log records emitted by the current thread
+
+    While the context is active, records logged by this thread are held
+    back instead of being written.  Worker threads use this so that the
+    main thread can later emit each unit of work's output in a stable
+    order via replay().
+
+    Yields:
+        list: The captured LogRecord objects
+    """
+    records = []
+    _buffers.records = records
+    try:
+        yield records
+    finally:
+        _buffers.records = None
+
+def replay(records: list):
+    """Writes previously buffered records through the shared logger
+
+    Args:
+        records (list): LogRecord objects captured by buffered()
+    """
+    logger = get_logger()
+    for record in records:
+        logger.handle(record)
+
+def stop():
+    """Writes out every queued record and stops the listener thread
+
+    Called at exit; logging after this point is not written.
+    """
+    global __listener # pylint: disable=global-statement
+    if __listener is not None:
+        __listener.stop()
+        __listener = None
 
 def get_logger() -> Logger:
     """Returns the existing logger or creates a new one if the first time
 
     Uses the values specified in the config module to determine the log
-    filename, log level (based on verbosity), and whether a console handler
-    should be included based on the noisy flag.
+    filename, log level (based on verbosity), whether a console handler
+    should be included based on the noisy flag, and whether records are
+    also written as JSON Lines based on the log_json flag.
     The method will only create a singleton logger that is requested by and
-    shared across modules.
+    shared across modules.  The logger itself only queues records; the
+    handlers run on the listener's thread.
 
     Attributes:
         verbosity (int): Used as subscript to deterimine log level.
@@ -39,6 +124,7 @@ def get_logger() -> Logger:
         Logger: __logger
     """
     global __logger# pylint: disable=global-statement
+    global __listener # pylint: disable=global-statement
     verbosity = config.verbosity
     log_path = config.log_filename
     noisy = config.noisy
@@ -47,40 +133,35 @@ def get_logger() -> Logger:
         log_levels = ['ERROR', 'WARNING', 'INFO', 'DEBUG']
         level = log_levels[verbosity]
         cLevel = log_levels[verbosity] if noisy else 'ERROR'
-        handlers = ['file', 'console']
-        logging_config.dictConfig({
-            'version': 1,
-            'formatters': {
-                'default': {
-                    'format': '%(asctime)s - %(levelname)s - %(message)s',
-                    'datefmt': '%Y-%m-%d %H:%M:%S'}
-            },
-            'handlers': {
-                'console': {
-                    'level': cLevel,
-                    'class': 'logging.StreamHandler',
-                    'formatter': 'default',
-                    'stream': 'ext://sys.stdout'
-                },
-                'file': {
-                    'level': level,
-                    'class': 'logging.handlers.RotatingFileHandler',
-                    'formatter': 'default',
-                    'filename': log_path,
-                    'maxBytes': (10*1024*1024),
-                    'backupCount': 3,
-                    'mode': 'a'
-                }
-            },
-            'loggers': {
-                'default': {
-                    'level': level,
-                    'handlers': handlers
-                }
-            },
-            'disable_existing_loggers': False
-        })
+        formatter = logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(message)s', '%Y-%m-%d %H:%M:%S')
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(cLevel)
+        console.setFormatter(formatter)
+        file_handler = RotatingFileHandler(
+            log_path, mode='a', maxBytes=(10*1024*1024), backupCount=3)
+        file_handler.setLevel(level)
+        file_handler.setFormatter(formatter)
+        handlers = [file_handler, console]
+        if config.log_json:
+            base_path = log_path[:-len('.log')] if log_path.endswith('.log') else log_path
+            json_handler = RotatingFileHandler(
+                base_path + '.jsonl', mode='a', maxBytes=(10*1024*1024), backupCount=3)
+            json_handler.setLevel(level)
+            json_handler.setFormatter(_JsonLinesFormatter())
+            handlers.append(json_handler)
+
+        records = queue.Queue()
+        __listener = QueueListener(records, *handlers, respect_handler_level=True)
+        __listener.start()
+        atexit.register(stop)
+
         __logger = logging.getLogger(name)
+        __logger.setLevel(level)
+        __logger.propagate = False
+        __logger.addHandler(QueueHandler(records))
+        __logger.addFilter(_BufferFilter())
     return __logger
 
 def main():
@@ -5,23 +5,150 @@
 
 """
 
+import asyncio
+import collections
+import hashlib
 import json
-import sys
-import pprint
-from io import TextIOBase
+import threading
+import time
 import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import requests
-from requests.auth import HTTPBasicAuth
 # Import `load_workbook` module from `openpyxl`
-from openpyxl import Workbook, load_workbook
-# Import relevant modules from `openpyxl.utils`
-from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl import load_workbook
 
 import config
+import journal
 import np_logger
+import reconcile
+import sheets
+import xm_client
+import xm_metrics
 
 _logger = None
+_client = None
+_site_index = None
+_user_index = None
+_group_index = None
+_workbook_index = None
+_supervisors = None
+_user_latencies = []
+# Jobs _map_buffered submits ahead per worker
+_LOOKAHEAD = 4
+
+class _NameLocks(object):
+    """One lock per object name, so that rows naming the same object never
+        look it up and create it at the same time.
+
+        The same Site, Admin or Group may be listed by more than one row,
+        or under more than one property; without the lock both rows could
+        find it missing and post it twice.  Lock objects are created on
+        first use and kept for the run.
+        """
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def hold(self, kind: str, name: str):
+        """Returns the lock of the named object of kind, to use with `with`"""
+        with self._lock:
+            return self._locks.setdefault((kind, name), threading.Lock())
+
+_name_locks = _NameLocks()
+# (kind, name) -> asyncio.Lock, the event loop version of _name_locks
+_async_name_locks = {}
+
+class _RemoteIndex(object):
+    """Local snapshot of an xMatters collection, keyed by name.
+
+        Built once from a paged listing so that lookups do not need a
+        request per worksheet row.  Names created during the run are not
+        part of the snapshot, so they are looked up remotely instead.
+
+        Attributes:
+        fetch_one: Callable retrieving a single object by name
+        normalize: Callable normalizing each listed object, see reconcile
+        """
+
+    def __init__(self, fetch_one, normalize):
+        self.fetch_one = fetch_one
+        self.normalize = normalize
+        self._objects = {}
+        self._created = set()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def load(self, objects, key: str):
+        """Adds objects to the index, keyed by their key field"""
+        for obj in objects:
+            self._objects[obj[key]] = self.normalize(obj)
+
+    def get(self, name: str):
+        """Returns the named object, or None if it does not exist"""
+        if self.stale(name):
+            return self.fetch_one(name)
+        return self._objects.get(name)
+
+    def stale(self, name: str):
+        """True if name was created during this run, so is not in the snapshot"""
+        return name in self._created
+
+    def created(self, name: str):
+        """Records that name was created during this run"""
+        self._created.add(name)
+
+class _WorkbookIndex(object):
+    """Site keyed lookups over the Sites and Admins worksheets.
+
+        Reads both worksheets once so that finding a Site's ID, or the
+        Admins (supervisors) of a Site, is a dict lookup instead of a scan
+        of the whole worksheet for every row.  IDs written back to the
+        worksheets during the run must be reported via set_site_id and
+        set_admin_id to keep the index current.  Only the IDs of the
+        environment being processed are held.
+        """
+
+    def __init__(self, book: sheets.PropertiesWorkbook):
+        id_field = sheets.id_field()
+        # name -> [row, ID] of the first row for that Site
+        self._sites = {}
+        # site name -> {row: ID} of its Admins, in row order
+        self._admins = {}
+        for rec in book.records('Sites'):
+            if rec.name not in self._sites:
+                self._sites[rec.name] = [rec.row, getattr(rec, id_field)]
+        if 'Admins' in book:
+            for rec in book.records('Admins'):
+                self._admins.setdefault(rec.site, {})[rec.row] = getattr(rec, id_field)
+
+    def site_id(self, site_name: str):
+        """Returns the ID of the named Site, or None"""
+        site = self._sites.get(site_name)
+        return site[1] if site is not None else None
+
+    def supervisors(self, site_name: str):
+        """Returns the IDs of the named Site's Admins"""
+        return list(self._admins.get(site_name, {}).values())
+
+    def set_site_id(self, row_num: int, site_name: str, site_id: str):
+        """Records the ID written back for the Site in row_num"""
+        site = self._sites.get(site_name)
+        if site is not None and site[0] == row_num:
+            site[1] = site_id
+
+    def set_admin_id(self, row_num: int, site_name: str, user_id: str):
+        """Records the ID written back for the Admin in row_num"""
+        admins = self._admins.get(site_name)
+        if admins is not None and row_num in admins:
+            admins[row_num] = user_id
+
+# Sites fields copied into a new Site, always or only when not empty
+_SITE_FIELDS = ('name', 'address1', 'city', 'country', 'language',
+                'postalCode', 'state', 'timezone')
+_OPTIONAL_SITE_FIELDS = ('address2', 'latitude', 'longitude')
 
 def _log_xm_error(url, response):
     """Captures and logs errors
@@ -44,69 +171,56 @@ def _log_xm_error(url, response):
                     str(body['reason']) if 'reason' in body else "none",
                     str(body['message']) if 'message' in body else "none")
 
-def _match_field(not_matching_values, cell, prop_obj, field_name):
-    """Compares source with existing object
-        
-        Compares cell to object, and if not matching puts it in the array
-        
-        Args:
-        not_matching_values: List of not matching values that is updated
-        cell: The current cell
-        site_obj: The current Site object
-        field_name: Name of field in site_obj
-        """
-    if cell.value != prop_obj[field_name]:
-        not_matching_values.append('%s:(cell=[%s],object=[%s])' % (field_name, cell.value, prop_obj[field_name]))
+class _LazyJson(object):
+    """Serializes an object for a log message only if the message is written
 
-def _add_site(site_name, row):
-    """Attempst to add a new Site object based on the Cell.
+    Passing _LazyJson(data) instead of json.dumps(data) as a logging
+    argument means suppressed debug messages cost no serialization.
+    """
+    __slots__ = ('_obj',)
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __str__(self):
+        return json.dumps(self._obj)
+
+def _has_value(value):
+    """True if a worksheet value is neither empty nor missing"""
+    return value is not None and len(str(value)) > 0
+
+def _site_data(rec):
+    """Builds the object to post to create the Site of a Sites record"""
+    # The Sites fields are named as in xMatters
+    data = {}
+    for field in _SITE_FIELDS:
+        data[field] = getattr(rec, field)
+    for field in _OPTIONAL_SITE_FIELDS:
+        value = getattr(rec, field)
+        if _has_value(value):
+            data[field] = value
+    return data
+
+def _add_site(site_name, data):
+    """Attempst to add a new Site object.
         
-        Creates a dict object to pass to xMatters to create a new site
+        Posts the object built from the worksheet row to create a new site
         
         Args:
         site_name: The name of the site to add
-        row: The row containing data to add
+        data: The Site object to post, see _site_data
         """
     _logger.debug("Attempting to add Site: %s", site_name)
     
-    # Setup object to post
-    data = {}
-    for cell in row:
-        if cell.column == 'D': # name
-            data['name'] = cell.value
-        elif cell.column == 'E': # address1
-            data['address1'] = cell.value
-        elif cell.column == 'F' and cell.value is not None and len(cell.value) > 0: # address2
-            data['address2'] = cell.value
-        elif cell.column == 'G': # city
-            data['city'] = cell.value
-        elif cell.column == 'H': # country
-            data['country'] = cell.value
-        elif cell.column == 'I': # language
-            data['language'] = cell.value
-        elif cell.column == 'J': # postalCode
-            data['postalCode'] = cell.value
-        elif cell.column == 'K': # state
-            data['state'] = cell.value
-        elif cell.column == 'L': # timezone
-            data['timezone'] = cell.value
-        elif cell.column == 'M' and cell.value is not None and len(cell.value) > 0: # latitude
-            data['latitude'] = cell.value
-        elif cell.column == 'N' and cell.value is not None and len(cell.value) > 0: # longitude
-            data['longitude'] = cell.value
-    
     # Set our resource URLs
     url = config.xmod_url + '/api/xm/1/sites'
     _logger.debug('Attempting to create site "%s" via url: %s', site_name, url)
 
     # Initialize loop with first request
     try:
-        response = requests.post(url,
-                                 headers = {'Content-Type': 'application/json'},
-                                 data = json.dumps(data),
-                                 auth=config.basic_auth)
+        response = _client.post(url, data)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
         return None
 
     # If the initial response fails, log and return null
@@ -137,9 +251,9 @@ def _site_exists(site_name: str):
     
     # Initialize loop with first request
     try:
-        response = requests.get(url, auth=config.basic_auth)
+        response = _client.get(url)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
         return None
     
     # If the initial response fails, log and return null
@@ -148,219 +262,331 @@ def _site_exists(site_name: str):
         return None
     
     # Process the response
-    site_obj = response.json()
+    site_obj = reconcile.RemoteSite(response.json())
     # _logger.debug('Site "%s" - json body: %s', str, pprint.pformat(site_obj))
     return site_obj
 
-def _sites_match(row: tuple, site_obj: dict):
-    """Compares source with existing object and returns true if they match.
+def _load_index(objects, key: str, fetch_one, normalize, kind: str):
+    """Builds a local index from the objects of a paged listing"""
+    index = _RemoteIndex(fetch_one, normalize)
+    index.load(objects, key)
+    _logger.info('Prefetched %d %s.', len(index), kind)
+    return index
+
+def _prefetch_index(url: str, key: str, fetch_one, normalize, kind: str):
+    """Builds a local index from a paged xMatters listing.
         
-        Looks at the details of the retrieved site object and returns false
-        if the column values don't match
+        Args:
+        url (str): Collection URL to page through
+        key (str): Field of each object to index it by
+        fetch_one: Callable retrieving a single object by name
+        normalize: Callable normalizing each listed object, see reconcile
+        kind (str): Object kind, for logging
+
+        Returns:
+        _RemoteIndex: The loaded index, or None if the listing failed, in
+        which case objects are looked up one request at a time instead
+        """
+    _logger.info('Prefetching %s via url: %s', kind, url)
+    try:
+        return _load_index(_client.paginate(url), key, fetch_one, normalize, kind)
+    except requests.exceptions.RequestException as e:
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
+        return None
+
+def _prefetch(objects_to_process: list):
+    """Builds the local indexes needed by the requested phases.
         
         Args:
-        sites_file (Workbook): Open sites worksheet
+        objects_to_process (list): The phases that are about to run
         """
-    _logger.debug('Comparing worksheet with xMatters for site "%s".', site_obj['name'])
-    match = True
-    not_matching_values = [];
-    for cell in row:
-        if config.non_prod and cell.column == 'C':
-            _match_field(not_matching_values, cell, site_obj, 'id')
-        elif not config.non_prod and cell.column == 'B':
-            _match_field(not_matching_values, cell, site_obj, 'id')
-        elif cell.column == 'E': # address1
-            _match_field(not_matching_values, cell, site_obj, 'address1')
-        elif cell.column == 'F' and 'address2' in site_obj and len(site_obj['address2']) > 0: # address2
-            _match_field(not_matching_values, cell, site_obj, 'address2')
-        elif cell.column == 'G': # city
-            _match_field(not_matching_values, cell, site_obj, 'city')
-        elif cell.column == 'H': # country
-            _match_field(not_matching_values, cell, site_obj, 'country')
-        elif cell.column == 'I': # language
-            _match_field(not_matching_values, cell, site_obj, 'language')
-        elif cell.column == 'J': # postalCode
-            _match_field(not_matching_values, cell, site_obj, 'postalCode')
-        elif cell.column == 'K': # state
-            _match_field(not_matching_values, cell, site_obj, 'state')
-        elif cell.column == 'L': # timezone
-            _match_field(not_matching_values, cell, site_obj, 'timezone')
-    if len(not_matching_values) > 0:
-        match = False
-        _logger.error('Site "%s" DOES NOT MATCH the source worksheet.%s', site_obj['name'],
-                 ', '.join(not_matching_values))
-    else:
-        _logger.info('Site "%s" matches the source worksheet', site_obj['name'])
+    global _site_index # pylint: disable=global-statement
+    global _user_index # pylint: disable=global-statement
+    global _group_index # pylint: disable=global-statement
 
-    return match
+    base_url = config.xmod_url + '/api/xm/1'
+    if 'sites' in objects_to_process:
+        _site_index = _prefetch_index(base_url + '/sites', 'name',
+                                      _site_exists, reconcile.RemoteSite, 'Sites')
+    if 'admins' in objects_to_process:
+        _user_index = _prefetch_index(base_url + '/people?embed=roles,properties',
+                                      'targetName', _get_user, reconcile.RemoteUser, 'Users')
+    if 'groups' in objects_to_process:
+        _group_index = _prefetch_index(base_url + '/groups?embed=supervisors',
+                                       'targetName', _get_group, reconcile.RemoteGroup, 'Groups')
 
-def _process_sites(sites_file: Workbook):
-    """Retrieves and processes xMatters Site objects.
+def _find_site(site_name: str):
+    """Returns the named Site from the prefetched index, or from xMatters.
         
-        Retrieves the Sites from the excel sheet and then attempst to verify
-        them in xMatters.  If they don't exist yet, then create them.
-        Update the spreadsheet with IDs.
+        Args:
+        site_name (str): Name of site to retrieve
+        """
+    if _site_index is None:
+        return _site_exists(site_name)
+    site_obj = _site_index.get(site_name)
+    if site_obj is None:
+        _logger.debug('Site "%s" is not in the prefetched index.', site_name)
+    return site_obj
+
+def _diff_site(rec, site_obj: dict):
+    """Compares a Sites record with its Site, logs and returns the Diff
         
         Args:
-        sites_file (Workbook): Open sites worksheet
+        rec: The Sites record
+        site_obj (dict): The retrieved site
         """
-    _logger.info('Processing worksheet for Sites.')
+    _logger.debug('Comparing worksheet with xMatters for site "%s".', site_obj['name'])
+    diff = reconcile.diff_site(rec, site_obj)
+    diff.log(_logger)
+    return diff
 
-    # Get the Sites worksheet
-    sites_sheet = sites_file["Sites"];
-    
-    for row in sites_sheet.iter_rows(min_row=2):
-        for cell in row:
-            if cell.column == 'D':
-                _logger.debug('Found cell=%s', cell)
-                site_name = cell.value
-                site_obj = _site_exists(site_name)
-                if site_obj:
-                    _logger.info('Processing Site "%s", id=[%s] in the %s environment',
-                                 site_name, site_obj['id'],
-                                 'Non-Production' if config.non_prod else 'Production')
-                    if not _sites_match(row, site_obj):
-                        # Update the spreadsheet
-                        if config.non_prod:
-                            sites_sheet.cell(row=cell.row, column=column_index_from_string('C')).value = site_obj['id']
-                        else:
-                            sites_sheet.cell(row=cell.row, column=column_index_from_string('B')).value = site_obj['id']
-                        sites_sheet.cell(row=cell.row, column=column_index_from_string('M')).value = repr(site_obj['latitude'])
-                        sites_sheet.cell(row=cell.row, column=column_index_from_string('N')).value = repr(site_obj['longitude'])
-                else:
-                    _logger.info('Site "%s" does not exist in the %s environment; adding.',
-                                 site_name,
-                                 'Non-Production' if config.non_prod else 'Production')
-                    site_obj = _add_site(site_name, row)
-                    if site_obj:
-                        if config.non_prod:
-                            sites_sheet.cell(row=cell.row, column=column_index_from_string('C')).value = site_obj['id']
-                        else:
-                            sites_sheet.cell(row=cell.row, column=column_index_from_string('B')).value = site_obj['id']
-
-def _get_site_id(sites_sheet, site_name: str):
-    """Return the UUID of the named site
-        
-        Looks through the sites sheet for that site row
-        
-        Args:
-        sites_sheet: Worksheet with Site details
-        site_name (str): Name of the site to find
-        """
-    _logger.debug('Searching for site "%s".', site_name)
-    found = False
-    for row in sites_sheet.iter_rows(min_row=2):
-        for cell in row:
-            id = ''
-            if cell.column == 'D':
-                if cell.value == site_name:
-                    if config.non_prod:
-                        id = sites_sheet.cell(row=cell.row, column=column_index_from_string('C')).value
-                        _logger.debug('Found site "%s" with Non-Prod ID of [%s].', site_name, id)
-                        return id
-                    else:
-                        id = sites_sheet.cell(row=cell.row, column=column_index_from_string('B')).value
-                        _logger.debug('Found site "%s" with Production ID of [%s].', site_name, id)
-                        return id
-    return None
-
-def _add_email_device(owner_name: str, owner_id: str, email_addr: str):
-    """Attempst to add an email device to a User.
-        
-        Adds an email device to the user.
+def _run_rows(func, jobs):
+    """Runs the network side of row processing on the worker pool.
+
+        Calls func(*job) for every job using up to config.workers threads.
+        Log output of each call is buffered on its worker and replayed here,
+        and results are yielded in job order, so the caller can apply
+        worksheet updates on the main thread exactly as a serial run would.
+
+        Args:
+        func: Callable performing the xMatters requests for one row
+        jobs: Iterable of argument tuples, one per row, read as needed
+
+        Yields:
+        tuple: (job, result) in the same order as jobs
+        """
+    return _map_buffered(func, jobs, config.workers or 1)
+
+def _buffered_call(func, job):
+    """Calls func(*job), buffering its log output on this thread
+
+        Returns:
+        tuple: (log records, result), the records to be replayed with
+        np_logger.replay() on the thread that hands out the result
+        """
+    with np_logger.buffered() as records:
+        result = func(*job)
+    return records, result
+
+def _map_buffered(func, jobs, max_workers: int):
+    """Calls func(*job) for every job on up to max_workers threads.
+
+        Log output of each call is buffered on its thread and replayed on
+        the calling thread, in job order.  Jobs are read from the iterable
+        only _LOOKAHEAD per worker ahead of the results handed out, so a
+        generator of jobs, e.g. over the rows of a streamed worksheet, is
+        never held in memory as a whole.
+
+        Yields:
+        tuple: (job, result) in the same order as jobs
+        """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        window = collections.deque()
+        for job in jobs:
+            window.append((job, pool.submit(_buffered_call, func, job)))
+            if len(window) < _LOOKAHEAD * max_workers:
+                continue
+            job, future = window.popleft()
+            records, result = future.result()
+            np_logger.replay(records)
+            yield job, result
+        while window:
+            job, future = window.popleft()
+            records, result = future.result()
+            np_logger.replay(records)
+            yield job, result
+
+def _reconcile_site(rec):
+    """Verifies, or creates, the Site for one worksheet row.
+        
+        Only performs xMatters requests and comparisons; it never touches
+        the worksheet, so it is safe to run on a worker thread.
         
         Args:
-        owner_name: User's targetName
-        owner_id: The id of the user to add a device to
-        email_addr: The email address to add
+        rec: The Sites record
+
+        Returns:
+        tuple: (site_obj, created, diff) where diff is the Diff of an
+        existing Site, or None
         """
-    _logger.debug("Attempting to add device to User: %s", owner_name)
-    
-    # Setup object to post
-    data = {
-        'name' : config.device_name,
+    _logger.debug('Found row=%s', rec)
+    site_name = rec.name
+    with _name_locks.hold('site', site_name):
+        site_obj = _find_site(site_name)
+        if site_obj:
+            _logger.info('Processing Site "%s", id=[%s] in the %s environment',
+                         site_name, site_obj['id'],
+                         'Non-Production' if config.non_prod else 'Production')
+            return site_obj, False, _diff_site(rec, site_obj)
+        _logger.info('Site "%s" does not exist in the %s environment; adding.',
+                     site_name,
+                     'Non-Production' if config.non_prod else 'Production')
+        site_obj = _add_site(site_name, _site_data(rec))
+        if site_obj and _site_index is not None:
+            _site_index.created(site_name)
+    return site_obj, True, None
+
+def _apply_site(book: sheets.PropertiesWorkbook, rec, site_obj, created, diff):
+    """Updates the spreadsheet with the outcome of _reconcile_site"""
+    if not site_obj:
+        return
+    if created or 'id' in diff:
+        book.write('Sites', rec.row, sheets.id_field(), site_obj['id'])
+        _workbook_index.set_site_id(rec.row, rec.name, site_obj['id'])
+    if not created and not diff.matches:
+        book.write('Sites', rec.row, 'latitude', repr(site_obj['latitude']))
+        book.write('Sites', rec.row, 'longitude', repr(site_obj['longitude']))
+
+def _device_data(owner_id: str, name: str, device_type: str, field: str, address: str):
+    """Builds the object to post to add a device to a User"""
+    return {
+        'name' : name,
         'owner' : owner_id,
-        'deviceType' : config.device_type,
+        'deviceType' : device_type,
         'recipientType' : 'DEVICE',
         'defaultDevice' : True,
-        'emailAddress' : email_addr
+        field : address
     }
-    
+
+def _user_devices(owner_id: str, rec):
+    """Builds the objects to post for every device column of an Admins record
+        
+        The device columns are configured by admin_devices; columns the
+        worksheet does not have, or that are empty, are skipped.
+        """
+    devices = []
+    for column, (name, device_type, field) in (
+            config.admin_devices or config.DEFAULT_ADMIN_DEVICES).items():
+        address = getattr(rec, column, None)
+        if _has_value(address):
+            devices.append(_device_data(owner_id, name, device_type, field, str(address)))
+    return devices
+
+def _add_device(owner_name: str, data: dict):
+    """Attempst to add a device to a User.
+        
+        Args:
+        owner_name: User's targetName
+        data: The device object, see _device_data
+
+        Returns:
+        dict: The added device, or None if it could not be added
+        """
     # Set our resource URLs
     url = config.xmod_url + '/api/xm/1/devices'
-    _logger.debug('Attempting to add email device for %s to user "%s" via url: %s\njson body: %s',
-                  email_addr,
+    _logger.debug('Attempting to add %s device "%s" to user "%s" via url: %s\njson body: %s',
+                  data['deviceType'],
+                  data['name'],
                   owner_name,
                   url,
-                  json.dumps(data))
+                  _LazyJson(data))
 
-    # Initialize loop with first request
     try:
-        response = requests.post(url,
-                                 headers = {'Content-Type': 'application/json'},
-                                 data = json.dumps(data),
-                                 auth=config.basic_auth)
+        response = _client.post(url, data)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
         return None
 
-    # If the initial response fails, log and return null
+    # If the response fails, log and return null
     if response.status_code != 201:
         _log_xm_error(url, response)
         return None
         
     # Process the response
     dev_obj = response.json()
-    _logger.info('Created Email Device "%s" for "%s" - idy: %s', email_addr, owner_name, dev_obj['id'])
-    # _logger.debug('Created Email Device "%s" for "%s" - json body: %s', email_addrowner_name, pprint.pformat(user_obj))
+    _logger.info('Created %s Device "%s" for "%s" - idy: %s',
+                 data['deviceType'], data['name'], owner_name, dev_obj['id'])
     return dev_obj
 
-def _add_user(target_name, site_id, row):
-    """Attempst to add a new User object based on the Cell.
+def _add_user_devices(owner_name: str, devices: list, started: float):
+    """Adds all devices of a new User at once and logs the User's creation time
         
-        Creates a dict object to pass to xMatters to create a new site
+        The devices are posted in parallel, and their log output is
+        replayed on the calling thread, so it stays part of the output of
+        the User's row.  A device that raises is logged and counted like
+        one that could not be added.
         
         Args:
-        target_name: The key of the user to add
-        site_id: The id for the related site object
-        row: The row containing data to add
+        owner_name: User's targetName
+        devices: The device objects to post, see _user_devices
+        started: time.monotonic() when the User's creation started
+
+        Returns:
+        int: The number of devices that could not be added
         """
-    _logger.debug("Attempting to add User: %s", target_name)
-    
-    # Setup object to post
-    data = {
+    jobs = [(owner_name, data) for data in devices]
+    dev_objs = [dev_obj for _, dev_obj in
+                _map_buffered(_add_device_logged, jobs, max(len(jobs), 1))]
+    return _log_user_created(owner_name, dev_objs, started)
+
+def _add_device_logged(owner_name: str, data: dict):
+    """Calls _add_device, logging an exception as a device not added"""
+    try:
+        return _add_device(owner_name, data)
+    except Exception as e: # pylint: disable=broad-except
+        _logger.error('Unable to add %s device "%s" to user "%s": %s',
+                      data['deviceType'], data['name'], owner_name, repr(e))
+        return None
+
+def _log_user_created(owner_name: str, dev_objs: list, started: float):
+    """Logs and records how long a User and its devices took to create
+        
+        Returns:
+        int: The number of devices that could not be added
+        """
+    latency = time.monotonic() - started
+    _user_latencies.append(latency)
+    missing = len([dev for dev in dev_objs if not dev])
+    _logger.info('Created User "%s" with %d of %d device(s) in %.3fs',
+                 owner_name, len(dev_objs) - missing, len(dev_objs), latency)
+    if missing:
+        _logger.error('Unable to add %d of the %d device(s) of User "%s".',
+                      missing, len(dev_objs), owner_name)
+    return missing
+
+def _log_user_latencies():
+    """Logs a summary of the creation times of the Users added by this run"""
+    if not _user_latencies:
+        return
+    latencies = sorted(_user_latencies)
+    _logger.info('Created %d User(s): creation time min %.3fs, median %.3fs, max %.3fs',
+                 len(latencies), latencies[0], latencies[len(latencies) // 2], latencies[-1])
+
+def _user_data(target_name, site_id, rec):
+    """Builds the object to post to create the User of an Admins record"""
+    return {
         'targetName' : target_name,
         'site' : site_id,
-        'supervisors' : config.supervisor_ids
+        'supervisors' : _supervisors.ids(),
+        'properties' : {config.udf_name : rec.propertyName},
+        'firstName' : rec.firstName,
+        'lastName' : rec.lastName,
+        'roles' : [role for role in (rec.roles or '').split('|') if role]
     }
-    for cell in row:
-        if cell.column == 'A': # name
-            properties = {}
-            properties[config.udf_name] = cell.value
-            data['properties'] = properties
-        elif cell.column == 'E': # firstName
-            data['firstName'] = cell.value
-        elif cell.column == 'F': # lastName
-            data['lastName'] = cell.value
-        elif cell.column == 'G': # roles
-            in_roles = cell.value.split('|')
-            data['roles'] = in_roles
 
+def _add_user(target_name, data):
+    """Attempst to add a new User object.
+        
+        Posts the object built from the worksheet row to create a new User
+        
+        Args:
+        target_name: The key of the user to add
+        data: The User object to post, see _user_data
+        """
+    _logger.debug("Attempting to add User: %s", target_name)
+    
     # Set our resource URLs
     url = config.xmod_url + '/api/xm/1/people'
     _logger.debug('Attempting to create user "%s" via url: %s\njson body: %s',
                   target_name,
                   url,
-                  json.dumps(data))
+                  _LazyJson(data))
 
     # Initialize loop with first request
     try:
-        response = requests.post(url,
-                                 headers = {'Content-Type': 'application/json'},
-                                 data = json.dumps(data),
-                                 auth=config.basic_auth)
+        response = _client.post(url, data)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
         return None
 
     # If the initial response fails, log and return null
@@ -391,9 +617,9 @@ def _get_user(target_name: str):
     
     # Initialize loop with first request
     try:
-        response = requests.get(url, auth=config.basic_auth)
+        response = _client.get(url)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
         return None
     
     # If the initial response fails, log and return null
@@ -402,227 +628,214 @@ def _get_user(target_name: str):
         return None
     
     # Process the response
-    user_obj = response.json()
+    user_obj = reconcile.RemoteUser(response.json())
     # _logger.debug('Found User "%s" - json body: %s', target_name, pprint.pformat(user_obj))
     _logger.debug('Found User "%s" - json body.id: %s', target_name, user_obj['id'])
     return user_obj
 
-def _users_match(row: tuple, user_obj: dict):
-    """Compares source with existing object and returns true if they match.
+def _find_user(target_name: str):
+    """Returns the named User from the prefetched index, or from xMatters.
         
-        Looks at the details of the retrieved User object and returns false
-        if the column values don't match
+        Args:
+        target_name (str): Target Name of User to retrieve
+        """
+    if _user_index is None:
+        return _get_user(target_name)
+    user_obj = _user_index.get(target_name)
+    if user_obj is None:
+        _logger.debug('User "%s" is not in the prefetched index.', target_name)
+    return user_obj
+
+def _diff_user(rec, user_obj: dict):
+    """Compares an Admins record with its User, logs and returns the Diff
         
         Args:
-        row (tuple): The row representing this Admin User from the spreadsheet
+        rec: The Admins record representing this Admin User
         user_obj (dict): The retrieved user
         """
     _logger.debug('Comparing worksheet with xMatters for User "%s".', user_obj['targetName'])
-    match = True
-    not_matching_values = [];
-    for cell in row:
-        if cell.column == 'A':
-            _match_field(not_matching_values, cell, user_obj['properties'], config.udf_name)
-        elif not config.non_prod and cell.column == 'B':
-            _match_field(not_matching_values, cell, user_obj, 'id')
-        elif config.non_prod and cell.column == 'C':
-            _match_field(not_matching_values, cell, user_obj, 'id')
-        elif cell.column == 'E': # firstName
-            _match_field(not_matching_values, cell, user_obj, 'firstName')
-        elif cell.column == 'F': # lastName
-            _match_field(not_matching_values, cell, user_obj, 'lastName')
-        elif cell.column == 'G': # roles
-            ws_roles = cell.value.split('|')
-            num_ws_roles = len(ws_roles)
-            _logger.debug('Found %d ws_roles.',num_ws_roles)
-            ws_role_cnt = 0
-            for ws_role in ws_roles:
-                _logger.debug('ws_role: %s', ws_role)
-                for user_role in user_obj['roles']['data']:
-                    _logger.debug("user_role['name']: %s", user_role['name'])
-                    if ws_role == user_role['name']:
-                        _logger.debug('Matched %s',ws_role)
-                        ws_role_cnt += 1
-                        break
-            if ws_role_cnt != num_ws_roles:
-                not_matching_values.append('%s:(cell=[%s],site=[%s])' % ('roles', cell.value, user_obj['roles']['data']))
-    if len(not_matching_values) > 0:
-        match = False
-        _logger.error('User "%s" DOES NOT MATCH the source worksheet.%s', user_obj['targetName'],
-                      ', '.join(not_matching_values))
-    else:
-        _logger.info('User "%s" matches the source worksheet', user_obj['targetName'])
-    
-    return match
+    diff = reconcile.diff_user(rec, user_obj)
+    diff.log(_logger)
+    return diff
 
-def _process_admins(sites_file: Workbook):
-    """Retrieves and processes xMatters Admin User objects.
+def _reconcile_admin(rec, site_id: str):
+    """Verifies, or creates, the User for one Admins row.
         
-        Retrieves the Admins from the excel sheet and then attempst to verify
-        them in xMatters.  If they don't exist yet, then create them.
-        Update the spreadsheet with IDs.
+        Only performs xMatters requests and comparisons; it never touches
+        the worksheet, so it is safe to run on a worker thread.
         
         Args:
-        sites_file (Workbook): Open sites worksheet
+        rec: The Admins record
+        site_id (str): ID of the User's Site
+
+        Returns:
+        tuple: (user_obj, created, diff) where diff is the Diff of an
+        existing User, or None
         """
-    _logger.info('Processing worksheet for Admins.')
-    
-    # Get the Sites worksheet
-    sites_sheet = sites_file["Sites"];
+    target_name = rec.targetName
+    with _name_locks.hold('user', target_name):
+        user_obj = _find_user(target_name)
+        if user_obj:
+            _logger.info('Processing User "%s", id=[%s] in the %s environment',
+                         target_name, user_obj['id'],
+                         'Non-Production' if config.non_prod else 'Production')
+            return user_obj, False, _diff_user(rec, user_obj)
+        _logger.info('Processing User "%s" does not exist in the %s environment; adding.',
+                     target_name,
+                     'Non-Production' if config.non_prod else 'Production')
+        started = time.monotonic()
+        user_obj = _add_user(target_name, _user_data(target_name, site_id, rec))
+        if user_obj and _user_index is not None:
+            _user_index.created(target_name)
+    if user_obj:
+        # Outside the lock: the devices need only the new User's ID
+        _add_user_devices(target_name, _user_devices(user_obj['id'], rec), started)
+    return user_obj, True, None
 
-    # Get the Admins worksheet
-    admins_sheet = sites_file["Admins"];
-    
-    # Resolve the default supervisor
-    for supervisor in config.supervisors:
-        supervisor_obj = _get_user(supervisor)
-        if supervisor is None:
-            _logger.error('Unable to find default supervisor %s', supervisor)
-        else:
-            config.supervisor_ids.append(supervisor_obj['id'])
-
-    for row in admins_sheet.iter_rows(min_row=2):
-        for cell in row:
-            if cell.column == 'D':
-                _logger.debug('Found cell=%s', cell)
-                target_name = cell.value
-                site_name = admins_sheet.cell(row=cell.row, column=column_index_from_string('H')).value
-                site_id = _get_site_id(sites_sheet, site_name)
-                if site_id:
-                    user_obj = _get_user(target_name)
-                    if user_obj:
-                        _logger.info('Processing User "%s", id=[%s] in the %s environment',
-                                     target_name, user_obj['id'],
-                                     'Non-Production' if config.non_prod else 'Production')
-                        if not _users_match(row, user_obj):
-                            # Update the spreadsheet
-                            if config.non_prod:
-                                admins_sheet.cell(row=cell.row, column=column_index_from_string('C')).value = user_obj['id']
-                            else:
-                                admins_sheet.cell(row=cell.row, column=column_index_from_string('B')).value = user_obj['id']
-                    else:
-                        _logger.info('Processing User "%s" does not exist in the %s environment; adding.',
-                                     target_name,
-                                     'Non-Production' if config.non_prod else 'Production')
-                        user_obj = _add_user(target_name, site_id, row)
-                        if user_obj:
-                            _add_email_device(target_name,
-                                              user_obj['id'],
-                                              admins_sheet.cell(row=cell.row, column=column_index_from_string('I')).value)
-                            if config.non_prod:
-                                admins_sheet.cell(row=cell.row, column=column_index_from_string('C')).value = user_obj['id']
-                            else:
-                                admins_sheet.cell(row=cell.row, column=column_index_from_string('B')).value = user_obj['id']
-                else:
-                    _logger.error('Unable to find Site "%s" for user %s.', site_name, target_name)
-
-def _get_site_id_from_sites_sheet(sites_sheet, site_name):
-    """Finds and returns the id for the named site
-        
-        Iterates through the rows in he sites sheet looking for a matching site name.
-        Returns the ID if found, or None.
-        
-        Args:
-        sites_sheet: An active Sites worksheet
-        site_name: The name of the site to find
-        """
-    for col in sites_sheet.iter_cols(min_row=2, min_col=column_index_from_string('D'), max_col=column_index_from_string('D')):
-        for cell in col:
-            if cell.value == site_name:
-                if config.non_prod:
-                    return sites_sheet.cell(row=cell.row, column=column_index_from_string('C')).value
-                else:
-                    return sites_sheet.cell(row=cell.row, column=column_index_from_string('B')).value
-    return None
-
-def _get_supervisors_from_admins_sheet(admins_sheet, site_name):
-    """Finds and returns the list of admin ids for the named site
-        
-        Iterates through the rows in the admins sheet looking for a matching site name.
-        Returns the ID if found, or None.
-        
-        Args:
-        admins_sheet: An active Admins worksheet
-        site_name: The name of the site to find
-        """
-    supervisors = []
-    for col in admins_sheet.iter_cols(min_row=2, min_col=column_index_from_string('H'), max_col=column_index_from_string('H')):
-        for cell in col:
-            if cell.value == site_name:
-                if config.non_prod:
-                    supervisors.append(admins_sheet.cell(row=cell.row, column=column_index_from_string('C')).value)
-                else:
-                    supervisors.append(admins_sheet.cell(row=cell.row, column=column_index_from_string('B')).value)
-    return supervisors
+def _apply_admin(book: sheets.PropertiesWorkbook, rec, user_obj, created, diff):
+    """Updates the spreadsheet with the outcome of _reconcile_admin"""
+    if user_obj and (created or 'id' in diff):
+        book.write('Admins', rec.row, sheets.id_field(), user_obj['id'])
+        _workbook_index.set_admin_id(rec.row, rec.site, user_obj['id'])
 
-def _add_group_members(target_name, site_id, supervisors):
-    """Attempst to add supervisors members to Group
+class _Supervisors(object):
+    """IDs of the default supervisors of added Users, resolved once per run.
         
-        Adds supervisors as members to the group
+        IDs found in the persistent cache need no request at all; the rest
+        are looked up by the caller, all at once, and reported via add(),
+        which also stores them in the cache for later runs.
         
-        Args:
-        target_name: The key of the Group to add
-        site_id: The id for the related site object
-        supervisors: list of supervisor ids
+        Attributes:
+        names (list): targetNames of the default supervisors
         """
-    _logger.debug("Attempting to add members to Group: %s", target_name)
-    members = []
-    
-    # Add Supervisors as members in the Roster
-    for supervisor in supervisors:
-        # Setup object to post
-        recip = {
+
+    def __init__(self, names: list, cache):
+        self.names = list(names or [])
+        self._cache = cache
+        self._ids = {}
+        if cache is not None:
+            for name in self.names:
+                supervisor_id = cache.get_id(config.xmod_url, 'people', name)
+                if supervisor_id:
+                    self._ids[name] = supervisor_id
+
+    def missing(self):
+        """Returns the names whose IDs still need to be looked up"""
+        return [name for name in self.names if name not in self._ids]
+
+    def add(self, name: str, user_obj: dict):
+        """Records the looked up User of a default supervisor"""
+        if user_obj is None:
+            _logger.error('Unable to find default supervisor %s', name)
+            return
+        self._ids[name] = user_obj['id']
+        if self._cache is not None:
+            self._cache.put_id(config.xmod_url, 'people', name, user_obj['id'])
+
+    def ids(self):
+        """Returns the IDs of the supervisors that could be resolved"""
+        return [self._ids[name] for name in self.names if name in self._ids]
+
+def _resolve_supervisors():
+    """Looks up the IDs of the default supervisors of added Users, once"""
+    global _supervisors # pylint: disable=global-statement
+    if _supervisors is not None:
+        return
+    supervisors = _Supervisors(config.supervisors, _client.cache)
+    jobs = [(name,) for name in supervisors.missing()]
+    if jobs:
+        for (name,), user_obj in _map_buffered(_find_user, jobs, len(jobs)):
+            supervisors.add(name, user_obj)
+    _supervisors = supervisors
+    _logger.debug('Default supervisor IDs: %s', _supervisors.ids())
+
+def _member_data(supervisor: str):
+    """Builds the object to post to add a supervisor to a Group's roster"""
+    return {
+        'recipient' : {
             'recipientType' : 'PERSON',
             'id' : supervisor
         }
-        data = {
-            'recipient' : recip
-        }
+    }
+
+def _add_group_member(target_name: str, supervisor: str):
+    """Attempst to add one supervisor as a member of the Group's Default Shift
         
-        # Set our resource URLs
-        url = config.xmod_url + '/api/xm/1/groups/' + urllib.parse.quote(target_name) + '/shifts/Default%20Shift/members'
-        _logger.debug('Attempting to add Supervisor with id[%s] to Group "%s" via url: %s\njson body: %s',
-                      supervisor,
-                      target_name,
-                      url,
-                      json.dumps(data))
-        
-        # Initialize loop with first request
-        try:
-            response = requests.post(url,
-                                     headers = {'Content-Type': 'application/json'},
-                                     data = json.dumps(data),
-                                     auth=config.basic_auth)
-        except requests.exceptions.RequestException as e:
-            _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
-
-        # If the initial response fails, log
-        if response.status_code != 200:
-            _log_xm_error(url, response)
-        else:
-            # Process the response
-            member_obj = response.json()
-            members.append(member_obj['recipient']['id'])
-            _logger.info('Added member to Group "%s" - id: %s', target_name, members[len(members)-1])
-            # _logger.debug('Added member to Group "%s" - json body: %s', target_name, pprint.pformat(member_obj))
+        Args:
+        target_name: The key of the Group
+        supervisor: ID of the supervisor to add
 
-    return members
+        Returns:
+        dict: The added member, or None if it could not be added
+        """
+    # Setup object to post
+    data = _member_data(supervisor)
+    
+    # Set our resource URLs
+    url = config.xmod_url + '/api/xm/1/groups/' + urllib.parse.quote(target_name) + '/shifts/Default%20Shift/members'
+    _logger.debug('Attempting to add Supervisor with id[%s] to Group "%s" via url: %s\njson body: %s',
+                  supervisor,
+                  target_name,
+                  url,
+                  _LazyJson(data))
+    
+    try:
+        response = _client.post(url, data)
+    except requests.exceptions.RequestException as e:
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
+        return None
 
-def _add_group(target_name, site_id, site_name, supervisors):
-    """Attempst to add a new Group object
+    # If the response fails, log and return null
+    if response.status_code != 200:
+        _log_xm_error(url, response)
+        return None
+
+    # Process the response
+    member_obj = response.json()
+    _logger.info('Added member to Group "%s" - id: %s', target_name, member_obj['recipient']['id'])
+    # _logger.debug('Added member to Group "%s" - json body: %s', target_name, pprint.pformat(member_obj))
+    return member_obj
+
+def _log_group_members(target_name: str, members: dict):
+    """Logs the supervisors that could not be added to a Group"""
+    failed = [supervisor for supervisor, member in members.items() if member is None]
+    if failed:
+        _logger.error('Unable to add %d of %d member(s) to Group "%s": %s',
+                      len(failed), len(members), target_name, failed)
+
+def _add_group_members(target_name, site_id, supervisors):
+    """Attempst to add supervisors members to Group
         
-        Creates a dict object to pass to xMatters to create a new Group
+        Adds supervisors as members to the group.  The API adds one member
+        per request, so the requests are all issued at once, each on its own
+        thread, and adding N members costs about one round trip instead of N.
         
         Args:
-        target_name: The key of the user to add
+        target_name: The key of the Group to add
         site_id: The id for the related site object
-        site_name: Literal name of the site
         supervisors: list of supervisor ids
+
+        Returns:
+        OrderedDict: Supervisor ID -> added member ID, or None if it could
+        not be added, in supervisors order
         """
-    _logger.debug("Attempting to add Group: %s", target_name)
-    
-    # Setup object to post
-    data = {
+    _logger.debug("Attempting to add members to Group: %s", target_name)
+    members = collections.OrderedDict()
+    if not supervisors:
+        return members
+
+    # Add Supervisors as members in the Roster
+    jobs = [(target_name, supervisor) for supervisor in supervisors]
+    max_workers = min(len(jobs), config.pool_size or config.DEFAULT_POOL_SIZE)
+    for (_, supervisor), member_obj in _map_buffered(_add_group_member, jobs, max_workers):
+        members[supervisor] = member_obj['recipient']['id'] if member_obj else None
+    _log_group_members(target_name, members)
+
+    return members
+
+def _group_data(target_name, site_id, supervisors):
+    """Builds the object to post to create the Group of a Groups record"""
+    return {
         'targetName' : target_name,
         'description' : target_name[3:] + ' Administrators',
         'site' : site_id,
@@ -630,21 +843,29 @@ def _add_group(target_name, site_id, site_name, supervisors):
         'observedByAll' : False
     }
 
+def _add_group(target_name, data):
+    """Attempst to add a new Group object
+        
+        Posts the object built for the worksheet row to create a new Group
+        
+        Args:
+        target_name: The key of the Group to add
+        data: The Group object to post, see _group_data
+        """
+    _logger.debug("Attempting to add Group: %s", target_name)
+    
     # Set our resource URLs
     url = config.xmod_url + '/api/xm/1/groups'
     _logger.debug('Attempting to create Group "%s" via url: %s\njson body: %s',
                   target_name,
                   url,
-                  json.dumps(data))
+                  _LazyJson(data))
 
     # Initialize loop with first request
     try:
-        response = requests.post(url,
-                                 headers = {'Content-Type': 'application/json'},
-                                 data = json.dumps(data),
-                                 auth=config.basic_auth)
+        response = _client.post(url, data)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
         return None
 
     # If the initial response fails, log and return null
@@ -676,9 +897,9 @@ def _get_group(target_name: str):
     
     # Initialize loop with first request
     try:
-        response = requests.get(url, auth=config.basic_auth)
+        response = _client.get(url)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
         return None
     
     # If the initial response fails, log and return null
@@ -687,16 +908,29 @@ def _get_group(target_name: str):
         return None
     
     # Process the response
-    group_obj = response.json()
+    group_obj = reconcile.RemoteGroup(response.json())
     # _logger.debug('Found Group "%s" - json body: %s', target_name, pprint.pformat(group_obj))
     _logger.debug('Found Group "%s" - json body.id: %s', target_name, group_obj['id'])
     return group_obj
 
+def _find_group(target_name: str):
+    """Returns the named Group from the prefetched index, or from xMatters.
+        
+        Args:
+        target_name (str): Target Name of Group to retrieve
+        """
+    if _group_index is None:
+        return _get_group(target_name)
+    group_obj = _group_index.get(target_name)
+    if group_obj is None:
+        _logger.debug('Group "%s" is not in the prefetched index.', target_name)
+    return group_obj
+
 def _get_group_members(target_name: str, id: str):
     """Attempst to retrieve Group Roster by targetName.
         
-        If the named Group exists, retrieve and return the roster.
-        If not, return null
+        If the named Group exists, retrieve and return the member IDs
+        of the roster as a frozenset.  If not, return an empty frozenset
         
         Args:
         target_name (str): Target Name of Group to retrieve members of
@@ -711,15 +945,15 @@ def _get_group_members(target_name: str, id: str):
     
     # Initialize loop with first request
     try:
-        response = requests.get(url, auth=config.basic_auth)
+        response = _client.get(url)
     except requests.exceptions.RequestException as e:
-        _logger.error(config.ERR_REQUEST_EXCEPTION_CODE, url, repr(e))
-        return group_members
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
+        return frozenset()
     
-    # If the initial response fails, log and return null
+    # If the initial response fails, log and return an empty roster
     if response.status_code != 200:
         _log_xm_error(url, response)
-        return group_members
+        return frozenset()
     
     # Process the response
     group_member_obj = response.json()
@@ -733,115 +967,251 @@ def _get_group_members(target_name: str, id: str):
     else:
         _logger.debug('Found 0 members of Group "%s"', target_name)
 
-    return group_members
+    return frozenset(group_members)
 
-def _collect_supervisors(group_obj: dict):
-    supervisors = []
-    for sup in group_obj['supervisors']['data']:
-        supervisors.append(sup['id'])
-    return supervisors
-
-def _group_match(groups_sheet, row, site_id: str, supervisors: list, group_obj: dict):
-    """Compares source with existing object and returns true if they match.
-        
-        Looks at the details of the retrieved Group object and returns false
-        if the column values don't match
+def _diff_group(rec, site_id: str, supervisors: list, group_obj: dict, grp_members):
+    """Compares a Groups record with its Group, logs and returns the Diff
         
         Args:
-        groups_sheet: The Groups spreadsheet
-        row: Row
+        rec: The Groups record
         site_id (str): GUID for the related Site
         supervisors (list): Array of supervisor IDs
         group_obj (dict): The retrieved group
+        grp_members: IDs of the retrieved group's members
         """
     _logger.debug('Comparing worksheet with xMatters for Group "%s".', group_obj['targetName'])
-    match = True
-    not_matching_values = [];
+    diff = reconcile.diff_group(rec, site_id, supervisors, group_obj, grp_members)
+    diff.log(_logger)
+    return diff
 
-    if not config.non_prod:
-        _match_field(not_matching_values, groups_sheet.cell(row=row, column=column_index_from_string('B')), group_obj, 'id')
-    else:
-        _match_field(not_matching_values, groups_sheet.cell(row=row, column=column_index_from_string('C')), group_obj, 'id')
+def _reconcile_group(rec, site_id: str, supervisors: list):
+    """Verifies, or creates, the Group for one Groups row.
+        
+        Only performs xMatters requests and comparisons; it never touches
+        the worksheet, so it is safe to run on a worker thread.
+        
+        Args:
+        rec: The Groups record
+        site_id (str): ID of the Group's Site
+        supervisors (list): IDs of the Site's Admins
 
-    if group_obj['site']['id'] != site_id:
-        not_matching_values.append('site:(cell=[%s],group=[%s])' % (site_id, group_obj['site']['id']))
+        Returns:
+        tuple: (group_obj, created, diff, members) where diff is the Diff
+        of an existing Group, or None, and members maps each supervisor to
+        its member ID in a created Group's roster, or None if it could not
+        be added
+        """
+    target_name = rec.targetName
+    with _name_locks.hold('group', target_name):
+        group_obj = _find_group(target_name)
+        if group_obj:
+            _logger.info('Processing Group "%s", id=[%s] in the %s environment',
+                         target_name, group_obj['id'],
+                         'Non-Production' if config.non_prod else 'Production')
+            grp_members = _get_group_members(target_name, group_obj['id'])
+            return group_obj, False, _diff_group(rec, site_id, supervisors,
+                                                 group_obj, grp_members), {}
+        _logger.info('Group "%s" does not exist in the %s environment; adding.',
+                     target_name,
+                     'Non-Production' if config.non_prod else 'Production')
+        group_obj = _add_group(target_name, _group_data(target_name, site_id, supervisors))
+        if group_obj and _group_index is not None:
+            _group_index.created(target_name)
+    members = {}
+    if group_obj:
+        members = _add_group_members(target_name, site_id, supervisors)
+    return group_obj, True, None, members
 
-    grp_supervisors = _collect_supervisors(group_obj)
-    if len(grp_supervisors) == 0 or not set(supervisors).issubset(set(grp_supervisors)):
-        not_matching_values.append('supervisors:(cell=[%s],group=[%s])' % (supervisors, grp_supervisors))
+def _apply_group(book: sheets.PropertiesWorkbook, rec, group_obj, created, diff, members):
+    """Updates the spreadsheet with the outcome of _reconcile_group"""
+    if not group_obj:
+        return
+    if (created and any(members.values())) or (not created and 'id' in diff):
+        book.write('Groups', rec.row, sheets.id_field(), group_obj['id'])
 
-    if group_obj['observedByAll'] != False:
-        not_matching_values.append('observedByAll:(cell=[False],group=[%s])' % (group_obj['observedByAll']))
+# Worksheets in dependency order: a property's Admins need its Site ID, and
+# its Group needs the IDs of its Admins
+_PHASES = collections.OrderedDict([
+    ('Sites', ('sites', _reconcile_site, _apply_site)),
+    ('Admins', ('admins', _reconcile_admin, _apply_admin)),
+    ('Groups', ('groups', _reconcile_group, _apply_group)),
+])
 
-    grp_members = _get_group_members(group_obj['targetName'], group_obj['id'])
-    if len(grp_members) == 0 or not set(supervisors).issubset(set(grp_members)):
-        not_matching_values.append('members:(cell=[%s],group=[%s])' % (supervisors, grp_members))
+class _SheetTimer(object):
+    """Times each worksheet's rows as a phase of the run's metrics
+        
+        Properties are processed concurrently, so the phase of a worksheet
+        (e.g. 'admins') is the wall time during which rows of it were in
+        flight for any property, rather than the sum of the row times.
+        Used only from the thread, or event loop, scheduling the rows.
+        """
 
-    if len(not_matching_values) > 0:
-        match = False
-        _logger.error('Group "%s" DOES NOT MATCH the source worksheet.%s', group_obj['targetName'],
-                      ', '.join(not_matching_values))
-    else:
-        _logger.info('Group "%s" matches the source worksheet', group_obj['targetName'])
-    
-    return match
+    def __init__(self):
+        self._in_flight = collections.Counter()
+        self._since = {}
+
+    def started(self, title: str, count: int = 1):
+        """Notes that count rows of the titled worksheet were started"""
+        if count and not self._in_flight[title]:
+            self._since[title] = time.monotonic()
+        self._in_flight[title] += count
+
+    def finished(self, title: str, count: int = 1):
+        """Notes that count rows of the titled worksheet are done"""
+        self._in_flight[title] -= count
+        if count and not self._in_flight[title]:
+            xm_metrics.get_metrics().add_phase(
+                title.lower(), time.monotonic() - self._since.pop(title))
+
+def _group_by_property(book: sheets.PropertiesWorkbook):
+    """Returns the records of every worksheet, grouped by Site name.
+        
+        Returns:
+        OrderedDict: Site name -> {worksheet title: [records]}, in the
+        order the properties first appear
+        """
+    properties = collections.OrderedDict()
+    for title, field in (('Sites', 'name'), ('Admins', 'site'), ('Groups', 'site')):
+        if title not in book:
+            continue
+        for rec in book.records(title):
+            rows = properties.setdefault(getattr(rec, field), {
+                'Sites': [], 'Admins': [], 'Groups': []})
+            rows[title].append(rec)
+    return properties
 
-def _process_groups(sites_file: Workbook):
-    """Retrieves and processes xMatters Group objects.
+def _row_jobs(title: str, site_name: str, records: list):
+    """Returns the reconcile arguments for one property's rows of a worksheet.
         
-        Retrieves the Groups from the excel sheet and then attempst to verify
-        them in xMatters.  If they don't exist yet, then create them.
-        Update the spreadsheet with IDs.
+        Called only once the property's earlier worksheets are done, so the
+        Site ID and Admin IDs written back by them are available.
+        
+        Returns:
+        list: (rec, job) pairs; empty if the Site ID is not known
+        """
+    if title == 'Sites':
+        return [(rec, (rec,)) for rec in records]
+    site_id = _workbook_index.site_id(site_name)
+    _logger.debug('Found site "%s" with ID of [%s].', site_name, site_id)
+    if not site_id:
+        kind = 'user' if title == 'Admins' else 'Group'
+        for rec in records:
+            _logger.error('Unable to find Site "%s" for %s %s.', site_name, kind, rec.targetName)
+        return []
+    if title == 'Admins':
+        return [(rec, (rec, site_id)) for rec in records]
+    supervisors = _workbook_index.supervisors(site_name)
+    _logger.debug('admins_sheet.supervisors=[%s]', supervisors)
+    return [(rec, (rec, site_id, supervisors)) for rec in records]
+
+def _process_properties(book: sheets.PropertiesWorkbook, objects_to_process: list):
+    """Runs every property's Sites, Admins and Groups rows as a dependency chain.
+        
+        Rather than finishing each worksheet for the whole workbook before
+        starting the next, a property's Admins are started as soon as its
+        own Site rows are done, and its Groups as soon as its Admins are
+        done, so properties never wait on each other.  The xMatters requests
+        run on up to config.workers threads.  Once all of a property's rows
+        of a worksheet are done, their worksheet updates, and the buffered
+        log output of each row, are applied here in row order, exactly as a
+        serial run would; properties finishing together are applied in
+        workbook order.  Each worksheet is timed by a _SheetTimer.
         
         Args:
-        sites_file (Workbook): Open sites worksheet
+        book (PropertiesWorkbook): Open properties workbook
+        objects_to_process (list): The phases to run
         """
-    _logger.info('Processing worksheet for Groups.')
-    
-    # Get the Sites worksheet
-    sites_sheet = sites_file["Sites"];
-    
-    # Get the Admins worksheet
-    admins_sheet = sites_file["Admins"];
-    
-    # Get the Groups worksheet
-    groups_sheet = sites_file["Groups"];
-    
-    for col in groups_sheet.iter_cols(min_row=2, min_col=column_index_from_string('D'), max_col=column_index_from_string('D')):
-        for cell in col:
-            _logger.debug('Found cell=%s', cell)
-            target_name = cell.value
-            site_name = groups_sheet.cell(row=cell.row, column=column_index_from_string('E')).value
-            site_id = _get_site_id_from_sites_sheet(sites_sheet, site_name)
-            _logger.debug('sites_sheet.site_id=[%s]', site_id)
-            supervisors = _get_supervisors_from_admins_sheet(admins_sheet, site_name)
-            _logger.debug('admins_sheet.supervisors=[%s]', supervisors)
-            if site_id:
-                group_obj = _get_group(target_name)
-                if group_obj:
-                    _logger.info('Processing Group "%s", id=[%s] in the %s environment',
-                                 target_name, group_obj['id'],
-                                 'Non-Production' if config.non_prod else 'Production')
-                    if not _group_match(groups_sheet, cell.row, site_id, supervisors, group_obj):
-                        # Update the spreadsheet
-                        if config.non_prod:
-                            groups_sheet.cell(row=cell.row, column=column_index_from_string('C')).value = group_obj['id']
-                        else:
-                            groups_sheet.cell(row=cell.row, column=column_index_from_string('B')).value = group_obj['id']
-                else:
-                    _logger.info('Group "%s" does not exist in the %s environment; adding.',
-                                 target_name,
-                                 'Non-Production' if config.non_prod else 'Production')
-                    group_obj = _add_group(target_name, site_id, site_name, supervisors)
-                    if group_obj:
-                        members = _add_group_members(target_name, site_id, supervisors)
-                        if len(members) > 0:
-                            if config.non_prod:
-                                groups_sheet.cell(row=cell.row, column=column_index_from_string('C')).value = group_obj['id']
-                            else:
-                                groups_sheet.cell(row=cell.row, column=column_index_from_string('B')).value = group_obj['id']
-            else:
-                _logger.error('Unable to find Site "%s" for Group %s.', site_name, target_name)
+    titles = [title for title, (name, _, _) in _PHASES.items()
+              if name in objects_to_process]
+    properties = _group_by_property(book)
+    _logger.info('Processing %s for %d properties.', ', '.join(titles), len(properties))
+
+    # site name -> position in the workbook
+    positions = {site_name: position for position, site_name in enumerate(properties)}
+    # future -> site name
+    pending = {}
+    # site name -> (index into titles, [(rec, future)] in row order)
+    stages = {}
+    timer = _SheetTimer()
+
+    with ThreadPoolExecutor(max_workers=config.workers or 1) as pool:
+        def _start(site_name: str, stage: int):
+            """Submits the first of the property's remaining stages that has rows"""
+            while stage < len(titles):
+                title = titles[stage]
+                jobs = _row_jobs(title, site_name, properties[site_name][title])
+                if jobs:
+                    timer.started(title, len(jobs))
+                    rows = []
+                    for rec, job in jobs:
+                        future = pool.submit(_buffered_call, _PHASES[title][1], job)
+                        pending[future] = site_name
+                        rows.append((rec, future))
+                    stages[site_name] = (stage, rows)
+                    return
+                stage += 1
+            stages.pop(site_name, None)
+
+        for site_name in properties:
+            _start(site_name, 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            finished = set()
+            for future in done:
+                site_name = pending.pop(future)
+                timer.finished(titles[stages[site_name][0]])
+                finished.add(site_name)
+            for site_name in sorted(finished, key=positions.get):
+                stage, rows = stages[site_name]
+                if any(future in pending for _, future in rows):
+                    continue
+                title = titles[stage]
+                for rec, future in rows:
+                    records, result = future.result()
+                    np_logger.replay(records)
+                    _PHASES[title][2](book, rec, *result)
+                _start(site_name, stage + 1)
+
+def _sheet_titles(objects_to_process: list):
+    """Returns the worksheets the phases read
+        
+        Admins need the Sites worksheet for their Site IDs, and Groups also
+        need the Admins worksheet for their supervisors.
+        """
+    titles = ['Sites']
+    if 'admins' in objects_to_process or 'groups' in objects_to_process:
+        titles.append('Admins')
+    if 'groups' in objects_to_process:
+        titles.append('Groups')
+    return titles
+
+def _open_book(titles: list = None):
+    """Opens the excel sheet, applying any writes an unfinished run left behind
+        
+        Args:
+        titles (list): The worksheets to read [default: all]
+
+        Raises:
+        SchemaError: If one of them is missing or lacks required fields
+        """
+    with xm_metrics.phase('load'):
+        properties_file = load_workbook(config.properties_filename)
+        _logger.debug(properties_file.sheetnames)
+        book = sheets.PropertiesWorkbook(
+            properties_file,
+            journal.Journal(config.properties_filename + config.JOURNAL_SUFFIX),
+            titles)
+        replayed = book.replay_journal()
+    if replayed:
+        _logger.warning('Recovered %d worksheet update(s) from an unfinished run.', replayed)
+    return book
+
+def _save_book(book: sheets.PropertiesWorkbook):
+    """Saves the excel sheet, if anything changed"""
+    with xm_metrics.phase('save'):
+        if book.save(config.properties_filename):
+            _logger.info('Saved changes to %s', config.properties_filename)
 
 def process(objects_to_process: list):
     """Verify or create the sites for this instance.
@@ -850,39 +1220,847 @@ def process(objects_to_process: list):
     Verify sites, creating missing ones if necessary, caching results
     Verify Admins, creating missing ones if necessary, caching results
     Verify Groups, creating missing ones if necessary
+    Each property moves on to its Admins and Groups as soon as its own
+    Site is done, see _process_properties
 
     Args:
         none
     """
     global _logger # pylint: disable=global-statement
+    global _client # pylint: disable=global-statement
+    global _workbook_index # pylint: disable=global-statement
 
     ### Get the current logger
     _logger = np_logger.get_logger()
 
-    # Open the excel sheet
-    properties_file = load_workbook(config.properties_filename)
-    _logger.debug(properties_file.sheetnames)
+    ### Get the shared, pooled xMatters client
+    _client = xm_client.get_client()
+
+    book = _open_book(_sheet_titles(objects_to_process))
+    _workbook_index = _WorkbookIndex(book)
+
+    try:
+        # Load the remote objects in bulk if requested
+        if config.prefetch:
+            with xm_metrics.phase('prefetch'):
+                _prefetch(objects_to_process)
+
+        # Resolve the default supervisor of added Users
+        if 'admins' in objects_to_process:
+            with xm_metrics.phase('supervisors'):
+                _resolve_supervisors()
+
+        # Process the objects of every property based on the spreadsheet
+        with xm_metrics.phase('properties'):
+            _process_properties(book, objects_to_process)
+        _log_user_latencies()
+    finally:
+        # Save any changes, once
+        _save_book(book)
+
+def _async_name_lock(kind: str, name: str):
+    """Returns the asyncio lock of the named object of kind, see _NameLocks"""
+    lock = _async_name_locks.get((kind, name))
+    if lock is None:
+        lock = _async_name_locks[(kind, name)] = asyncio.Lock()
+    return lock
 
-    # Process the Site objects based on the spreadsheet
+async def _find_async(index: _RemoteIndex, fetch_one, name: str):
+    """Coroutine version of _find_site, _find_user and _find_group
+
+        Args:
+        index (_RemoteIndex): The prefetched index, or None
+        fetch_one: Coroutine function retrieving a single object by name
+        name (str): Name of the object to retrieve
+        """
+    if index is None or index.stale(name):
+        return await fetch_one(name)
+    obj = index.get(name)
+    if obj is None:
+        _logger.debug('"%s" is not in the prefetched index.', name)
+    return obj
+
+async def _prefetch_index_async(client: 'xm_async.AsyncXmClient', url: str, key: str,
+                                normalize, kind: str):
+    """Coroutine version of _prefetch_index"""
+    _logger.info('Prefetching %s via url: %s', kind, url)
+    objects = await client.get_all(url)
+    if objects is None:
+        return None
+    return _load_index(objects, key, None, normalize, kind)
+
+async def _prefetch_async(client: 'xm_async.AsyncXmClient', objects_to_process: list):
+    """Coroutine version of _prefetch; the listings are read concurrently"""
+    global _site_index # pylint: disable=global-statement
+    global _user_index # pylint: disable=global-statement
+    global _group_index # pylint: disable=global-statement
+
+    base_url = config.xmod_url + '/api/xm/1'
+    listings = collections.OrderedDict()
     if 'sites' in objects_to_process:
-        _process_sites(properties_file)
+        listings['sites'] = _prefetch_index_async(
+            client, base_url + '/sites', 'name', reconcile.RemoteSite, 'Sites')
+    if 'admins' in objects_to_process:
+        listings['admins'] = _prefetch_index_async(
+            client, base_url + '/people?embed=roles,properties', 'targetName',
+            reconcile.RemoteUser, 'Users')
+    if 'groups' in objects_to_process:
+        listings['groups'] = _prefetch_index_async(
+            client, base_url + '/groups?embed=supervisors', 'targetName',
+            reconcile.RemoteGroup, 'Groups')
+    indexes = dict(zip(listings, await asyncio.gather(*listings.values())))
+    _site_index = indexes.get('sites')
+    _user_index = indexes.get('admins')
+    _group_index = indexes.get('groups')
+
+async def _reconcile_site_async(client: 'xm_async.AsyncXmClient', rec):
+    """Coroutine version of _reconcile_site"""
+    _logger.debug('Found row=%s', rec)
+    site_name = rec.name
+    async with _async_name_lock('site', site_name):
+        site_obj = reconcile.RemoteSite.of(
+            await _find_async(_site_index, client.get_site, site_name))
+        if site_obj:
+            _logger.info('Processing Site "%s", id=[%s] in the %s environment',
+                         site_name, site_obj['id'],
+                         'Non-Production' if config.non_prod else 'Production')
+            return site_obj, False, _diff_site(rec, site_obj)
+        _logger.info('Site "%s" does not exist in the %s environment; adding.',
+                     site_name,
+                     'Non-Production' if config.non_prod else 'Production')
+        site_obj = await client.add_site(_site_data(rec))
+        if site_obj and _site_index is not None:
+            _site_index.created(site_name)
+    if site_obj:
+        _logger.info('Created Site "%s" - Id: %s', site_name, site_obj['id'])
+    return site_obj, True, None
+
+async def _reconcile_admin_async(client: 'xm_async.AsyncXmClient', rec, site_id: str):
+    """Coroutine version of _reconcile_admin"""
+    _logger.debug('Found row=%s', rec)
+    target_name = rec.targetName
+    async with _async_name_lock('user', target_name):
+        user_obj = reconcile.RemoteUser.of(
+            await _find_async(_user_index, client.get_user, target_name))
+        if user_obj:
+            _logger.info('Processing User "%s", id=[%s] in the %s environment',
+                         target_name, user_obj['id'],
+                         'Non-Production' if config.non_prod else 'Production')
+            return user_obj, False, _diff_user(rec, user_obj)
+        _logger.info('Processing User "%s" does not exist in the %s environment; adding.',
+                     target_name,
+                     'Non-Production' if config.non_prod else 'Production')
+        started = time.monotonic()
+        user_obj = await client.add_user(_user_data(target_name, site_id, rec))
+        if user_obj and _user_index is not None:
+            _user_index.created(target_name)
+    if user_obj:
+        _logger.info('Created User "%s" - idy: %s', target_name, user_obj['id'])
+        # Outside the lock: the devices need only the new User's ID
+        await _add_user_devices_async(
+            client, target_name, _user_devices(user_obj['id'], rec), started)
+    return user_obj, True, None
 
-    # Save any changes
-    properties_file.save(config.properties_filename)
+async def _add_user_devices_async(client: 'xm_async.AsyncXmClient', owner_name: str,
+                                  devices: list, started: float):
+    """Coroutine version of _add_user_devices"""
+    dev_objs = await asyncio.gather(*[client.add_device(data) for data in devices],
+                                    return_exceptions=True)
+    for index, (data, dev_obj) in enumerate(zip(devices, dev_objs)):
+        if isinstance(dev_obj, Exception):
+            _logger.error('Unable to add %s device "%s" to user "%s": %s',
+                          data['deviceType'], data['name'], owner_name, repr(dev_obj))
+            dev_objs[index] = None
+        elif dev_obj:
+            _logger.info('Created %s Device "%s" for "%s" - idy: %s',
+                         data['deviceType'], data['name'], owner_name, dev_obj['id'])
+    return _log_user_created(owner_name, dev_objs, started)
 
-    # Process the Admin objects based on the spreadsheet
+async def _reconcile_group_async(client: 'xm_async.AsyncXmClient', rec, site_id: str,
+                                 supervisors: list):
+    """Coroutine version of _reconcile_group"""
+    _logger.debug('Found row=%s', rec)
+    target_name = rec.targetName
+    async with _async_name_lock('group', target_name):
+        group_obj = reconcile.RemoteGroup.of(
+            await _find_async(_group_index, client.get_group, target_name))
+        if group_obj:
+            _logger.info('Processing Group "%s", id=[%s] in the %s environment',
+                         target_name, group_obj['id'],
+                         'Non-Production' if config.non_prod else 'Production')
+            grp_members = await client.get_group_members(group_obj['id'])
+            return group_obj, False, _diff_group(rec, site_id, supervisors,
+                                                 group_obj, grp_members), {}
+        _logger.info('Group "%s" does not exist in the %s environment; adding.',
+                     target_name,
+                     'Non-Production' if config.non_prod else 'Production')
+        group_obj = await client.add_group(_group_data(target_name, site_id, supervisors))
+        if group_obj and _group_index is not None:
+            _group_index.created(target_name)
+    members = collections.OrderedDict()
+    if group_obj:
+        _logger.info('Created Group "%s" - id: %s', target_name, group_obj['id'])
+        for supervisor, member_obj in zip(supervisors, await asyncio.gather(
+                *[client.add_member(target_name, _member_data(supervisor))
+                  for supervisor in supervisors])):
+            members[supervisor] = member_obj['recipient']['id'] if member_obj else None
+            if member_obj:
+                _logger.info('Added member to Group "%s" - id: %s', target_name, members[supervisor])
+        _log_group_members(target_name, members)
+    return group_obj, True, None, members
+
+async def _process_property_async(client: 'xm_async.AsyncXmClient',
+                                  book: sheets.PropertiesWorkbook,
+                                  site_name: str, rows: dict,
+                                  objects_to_process: list, timer: _SheetTimer):
+    """Runs the Sites, Admins and Groups rows of one property in order.
+        
+        Rows of the same worksheet are reconciled concurrently, and the
+        worksheet updates are applied as soon as each phase completes.
+        
+        Args:
+        client (AsyncXmClient): The asyncio client
+        book (PropertiesWorkbook): Open properties workbook
+        site_name (str): The property's Site name
+        rows (dict): The property's records, by worksheet title
+        objects_to_process (list): The phases to run
+        timer (_SheetTimer): Times the worksheets of all properties
+        """
+    if 'sites' in objects_to_process:
+        timer.started('Sites', len(rows['Sites']))
+        results = await asyncio.gather(
+            *[_reconcile_site_async(client, rec) for rec in rows['Sites']])
+        timer.finished('Sites', len(rows['Sites']))
+        for rec, result in zip(rows['Sites'], results):
+            _apply_site(book, rec, *result)
+
+    site_id = _workbook_index.site_id(site_name)
     if 'admins' in objects_to_process:
-        _process_admins(properties_file)
-    
-    # Save any changes
-    properties_file.save(config.properties_filename)
+        if site_id:
+            timer.started('Admins', len(rows['Admins']))
+            results = await asyncio.gather(
+                *[_reconcile_admin_async(client, rec, site_id) for rec in rows['Admins']])
+            timer.finished('Admins', len(rows['Admins']))
+            for rec, result in zip(rows['Admins'], results):
+                _apply_admin(book, rec, *result)
+        else:
+            for rec in rows['Admins']:
+                _logger.error('Unable to find Site "%s" for user %s.', site_name, rec.targetName)
 
-    # Process the Group objects based on the spreadsheet
     if 'groups' in objects_to_process:
-        _process_groups(properties_file)
-    
-    # Save any changes
-    properties_file.save(config.properties_filename)
+        if site_id:
+            supervisors = _workbook_index.supervisors(site_name)
+            timer.started('Groups', len(rows['Groups']))
+            results = await asyncio.gather(
+                *[_reconcile_group_async(client, rec, site_id, supervisors)
+                  for rec in rows['Groups']])
+            timer.finished('Groups', len(rows['Groups']))
+            for rec, result in zip(rows['Groups'], results):
+                _apply_group(book, rec, *result)
+        else:
+            for rec in rows['Groups']:
+                _logger.error('Unable to find Site "%s" for Group %s.', site_name, rec.targetName)
+
+async def _resolve_supervisors_async(client: 'xm_async.AsyncXmClient'):
+    """Coroutine version of _resolve_supervisors"""
+    global _supervisors # pylint: disable=global-statement
+    if _supervisors is not None:
+        return
+    supervisors = _Supervisors(config.supervisors, client.cache)
+    names = supervisors.missing()
+    for name, user_obj in zip(names, await asyncio.gather(
+            *[client.get_user(name) for name in names])):
+        supervisors.add(name, user_obj)
+    _supervisors = supervisors
+    _logger.debug('Default supervisor IDs: %s', _supervisors.ids())
+
+async def _process_async(book: sheets.PropertiesWorkbook, objects_to_process: list,
+                         get_async_client):
+    """Processes every property of the workbook concurrently
+
+        Args:
+        book (PropertiesWorkbook): Open properties workbook
+        objects_to_process (list): The phases to run
+        get_async_client: xm_async.get_async_client, imported by the caller
+        """
+    client = get_async_client()
+    try:
+        # Load the remote objects in bulk if requested
+        if config.prefetch:
+            with xm_metrics.phase('prefetch'):
+                await _prefetch_async(client, objects_to_process)
+
+        if 'admins' in objects_to_process:
+            with xm_metrics.phase('supervisors'):
+                await _resolve_supervisors_async(client)
+
+        properties = _group_by_property(book)
+        _logger.info('Processing %d properties concurrently.', len(properties))
+
+        timer = _SheetTimer()
+        with xm_metrics.phase('properties'):
+            await asyncio.gather(
+                *[_process_property_async(client, book, site_name, rows,
+                                          objects_to_process, timer)
+                  for site_name, rows in properties.items()])
+        _log_user_latencies()
+    finally:
+        await client.close()
+
+def process_async(objects_to_process: list):
+    """Verify or create the sites for this instance with asyncio.
+
+    Like process(), but every property (a Site with its Admins and Groups)
+    is pipelined through the Sites, Admins and Groups phases on its own,
+    so independent properties progress concurrently instead of waiting for
+    each phase to finish for the whole workbook.  All requests share one
+    event loop and one aiohttp session; worksheet updates are applied on
+    the same thread and saved once at the end.  With config.prefetch the
+    existing objects are listed up front, as by process().
+
+    aiohttp is only needed, and only imported, in this mode.
+
+    Args:
+        objects_to_process (list): The phases to run
+
+    Returns:
+        int: 0, or ERR_ASYNC_UNAVAILABLE_CODE if aiohttp is not installed
+    """
+    global _logger # pylint: disable=global-statement
+    global _workbook_index # pylint: disable=global-statement
+
+    _logger = np_logger.get_logger()
+    try:
+        import xm_async # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        _logger.error(config.ERR_ASYNC_UNAVAILABLE_MSG, repr(e))
+        return config.ERR_ASYNC_UNAVAILABLE_CODE
+    book = _open_book(_sheet_titles(objects_to_process))
+    _workbook_index = _WorkbookIndex(book)
+    try:
+        asyncio.run(_process_async(book, objects_to_process, xm_async.get_async_client))
+    finally:
+        # Save any changes, once
+        _save_book(book)
+    return 0
+
+def _verify_site(rec):
+    """Compares one Sites row with xMatters; returns its verification status"""
+    site_obj = _find_site(rec.name)
+    if not site_obj:
+        _logger.error('Site "%s" does not exist in the %s environment.', rec.name,
+                      'Non-Production' if config.non_prod else 'Production')
+        return 'missing'
+    return 'match' if _diff_site(rec, site_obj).matches else 'mismatch'
+
+def _verify_admin(rec):
+    """Compares one Admins row with xMatters; returns its verification status"""
+    user_obj = _find_user(rec.targetName)
+    if not user_obj:
+        _logger.error('User "%s" does not exist in the %s environment.', rec.targetName,
+                      'Non-Production' if config.non_prod else 'Production')
+        return 'missing'
+    return 'match' if _diff_user(rec, user_obj).matches else 'mismatch'
+
+def _verify_group(rec):
+    """Compares one Groups row with xMatters; returns its verification status"""
+    site_id = _workbook_index.site_id(rec.site)
+    if not site_id:
+        _logger.error('Unable to find Site "%s" for Group %s.', rec.site, rec.targetName)
+        return 'missing'
+    group_obj = _find_group(rec.targetName)
+    if not group_obj:
+        _logger.error('Group "%s" does not exist in the %s environment.', rec.targetName,
+                      'Non-Production' if config.non_prod else 'Production')
+        return 'missing'
+    supervisors = _workbook_index.supervisors(rec.site)
+    grp_members = _get_group_members(group_obj['targetName'], group_obj['id'])
+    return 'match' if _diff_group(rec, site_id, supervisors, group_obj, grp_members).matches else 'mismatch'
+
+def verify():
+    """Compare the spreadsheet with this instance without changing either.
+
+    The workbook is opened in read-only streaming mode, so memory use does
+    not grow with the number of rows.  Every Site, Admin and Group row is
+    compared with xMatters and the mismatches are logged; nothing is
+    created and nothing is written back.
+
+    Returns:
+        int: 1 if any row is missing or does not match, else 0
+    """
+    global _logger # pylint: disable=global-statement
+    global _client # pylint: disable=global-statement
+    global _workbook_index # pylint: disable=global-statement
+
+    _logger = np_logger.get_logger()
+    _client = xm_client.get_client()
+
+    with xm_metrics.phase('load'):
+        properties_file = load_workbook(config.properties_filename, read_only=True)
+    try:
+        book = sheets.PropertiesWorkbook(properties_file)
+        _workbook_index = _WorkbookIndex(book)
+        if config.prefetch:
+            with xm_metrics.phase('prefetch'):
+                _prefetch(['sites', 'admins', 'groups'])
+
+        results = collections.OrderedDict()
+        with xm_metrics.phase('compare'):
+            for title, check in (('Sites', _verify_site),
+                                 ('Admins', _verify_admin),
+                                 ('Groups', _verify_group)):
+                _logger.info('Verifying worksheet for %s.', title)
+                jobs = ((rec,) for rec in book.records(title))
+                results[title] = collections.Counter(
+                    status for _, status in _run_rows(check, jobs))
+    finally:
+        properties_file.close()
+
+    problems = 0
+    for title, counts in results.items():
+        summary = '%s: %d checked, %d match, %d mismatch, %d missing' % (
+            title, sum(counts.values()), counts['match'],
+            counts['mismatch'], counts['missing'])
+        _logger.info(summary)
+        problems += counts['mismatch'] + counts['missing']
+    if problems:
+        _logger.error('%d row(s) are missing or do not match; exiting with 1.', problems)
+        return 1
+    return 0
+
+def _file_digest(filename: str) -> str:
+    """Returns the SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as digest_file:
+        for chunk in iter(lambda: digest_file.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _plan_sites(book: sheets.PropertiesWorkbook):
+    """Returns the planned action of every Sites row"""
+    actions = []
+    for rec in book.records('Sites'):
+        action = {'kind': 'site', 'row': rec.row, 'name': rec.name}
+        site_obj = _find_site(rec.name)
+        if not site_obj:
+            _logger.info('Site "%s" does not exist in the %s environment; planning to add it.',
+                         rec.name, 'Non-Production' if config.non_prod else 'Production')
+            action.update(action='create', data=_site_data(rec))
+            actions.append(action)
+            continue
+        diff = _diff_site(rec, site_obj)
+        if diff.matches:
+            action.update(action='match', id=site_obj['id'])
+        else:
+            action.update(action='update', id=site_obj['id'], diff=diff.to_list(),
+                          latitude=repr(site_obj['latitude']),
+                          longitude=repr(site_obj['longitude']))
+        actions.append(action)
+    return actions
+
+def _plan_admins(book: sheets.PropertiesWorkbook, site_ids: dict):
+    """Returns the planned action of every Admins row
+        
+        Args:
+        book (PropertiesWorkbook): Open properties workbook
+        site_ids (dict): Site name -> ID, None for planned Sites
+        """
+    actions = []
+    for rec in book.records('Admins'):
+        if rec.site not in site_ids:
+            _logger.error('Unable to find Site "%s" for user %s.', rec.site, rec.targetName)
+            continue
+        action = {'kind': 'user', 'row': rec.row, 'name': rec.targetName, 'site': rec.site}
+        user_obj = _find_user(rec.targetName)
+        if not user_obj:
+            _logger.info('User "%s" does not exist in the %s environment; planning to add it.',
+                         rec.targetName, 'Non-Production' if config.non_prod else 'Production')
+            action.update(action='create',
+                          data=_user_data(rec.targetName, site_ids[rec.site], rec),
+                          devices=_user_devices(None, rec))
+            actions.append(action)
+            continue
+        diff = _diff_user(rec, user_obj)
+        if diff.matches:
+            action.update(action='match', id=user_obj['id'])
+        else:
+            action.update(action='update', id=user_obj['id'], diff=diff.to_list())
+        actions.append(action)
+    return actions
+
+def _plan_groups(book: sheets.PropertiesWorkbook, site_ids: dict, user_actions: list):
+    """Returns the planned actions of every Groups row and its members
+        
+        The rosters of the existing Groups are the only objects read one
+        request per Group, all at once.
+        
+        Args:
+        book (PropertiesWorkbook): Open properties workbook
+        site_ids (dict): Site name -> ID, None for planned Sites
+        user_actions (list): The planned actions of the Admins rows
+        """
+    user_ids = {}
+    admins = {}
+    for action in user_actions:
+        user_ids.setdefault(action['name'], action.get('id'))
+        admins.setdefault(action['site'], []).append(action['name'])
+
+    rows = []
+    for rec in book.records('Groups'):
+        if rec.site not in site_ids:
+            _logger.error('Unable to find Site "%s" for Group %s.', rec.site, rec.targetName)
+            continue
+        rows.append((rec, _find_group(rec.targetName)))
+    jobs = [(group_obj['targetName'], group_obj['id']) for _, group_obj in rows if group_obj]
+    rosters = {}
+    if jobs:
+        for (target_name, _), grp_members in _map_buffered(
+                _get_group_members, jobs, config.workers or 1):
+            rosters[target_name] = grp_members
+
+    actions = []
+    for rec, group_obj in rows:
+        site_id = site_ids[rec.site]
+        names = admins.get(rec.site, [])
+        supervisors = [user_ids[name] for name in names if user_ids[name]]
+        action = {'kind': 'group', 'row': rec.row, 'name': rec.targetName, 'site': rec.site}
+        grp_members = []
+        if not group_obj:
+            _logger.info('Group "%s" does not exist in the %s environment; planning to add it.',
+                         rec.targetName, 'Non-Production' if config.non_prod else 'Production')
+            action.update(action='create', supervisors=names,
+                          data=_group_data(rec.targetName, site_id, supervisors))
+        else:
+            grp_members = rosters.get(rec.targetName, frozenset())
+            diff = _diff_group(rec, site_id, supervisors, group_obj, grp_members)
+            if diff.matches:
+                action.update(action='match', id=group_obj['id'])
+            else:
+                action.update(action='update', id=group_obj['id'], diff=diff.to_list())
+        actions.append(action)
+        for name in names:
+            actions.append({'kind': 'member', 'group': rec.targetName, 'name': name,
+                            'action': 'match' if user_ids[name] in grp_members else 'add'})
+    return actions
+
+def _plan_summary(actions: list):
+    """Returns one line of action counts per kind of object in the plan"""
+    counts = collections.OrderedDict(
+        (kind, collections.Counter()) for kind in ('site', 'user', 'group', 'member'))
+    for action in actions:
+        counts[action['kind']][action['action']] += 1
+    lines = []
+    for kind, title in (('site', 'Sites'), ('user', 'Admins'), ('group', 'Groups')):
+        lines.append('%s: %d create, %d update, %d match' % (
+            title, counts[kind]['create'], counts[kind]['update'], counts[kind]['match']))
+    lines.append('Members: %d add, %d match' % (counts['member']['add'],
+                                                 counts['member']['match']))
+    return lines
+
+def plan(plan_filename: str):
+    """Work out what processing all worksheets would change, without changing it.
+
+    The existing objects are read with paged listing requests, plus one
+    roster request per existing Group, and compared with the workbook.
+    The resulting create, update and match actions for every Site, User,
+    Group and member are written to plan_filename as JSON, for apply(),
+    and summarized.
+
+    Args:
+        plan_filename (str): Where to write the plan
+
+    Returns:
+        int: 0
+    """
+    global _logger # pylint: disable=global-statement
+    global _client # pylint: disable=global-statement
+    global _workbook_index # pylint: disable=global-statement
+
+    _logger = np_logger.get_logger()
+    _client = xm_client.get_client()
+
+    digest = _file_digest(config.properties_filename)
+    with xm_metrics.phase('load'):
+        properties_file = load_workbook(config.properties_filename, read_only=True)
+    try:
+        book = sheets.PropertiesWorkbook(properties_file)
+        _workbook_index = _WorkbookIndex(book)
+        with xm_metrics.phase('prefetch'):
+            _prefetch(['sites', 'admins', 'groups'])
+        with xm_metrics.phase('supervisors'):
+            _resolve_supervisors()
+        with xm_metrics.phase('compare'):
+            actions = _plan_sites(book)
+            site_ids = {}
+            for action in actions:
+                site_ids.setdefault(action['name'], action.get('id'))
+            user_actions = _plan_admins(book, site_ids)
+            actions += user_actions
+            actions += _plan_groups(book, site_ids, user_actions)
+    finally:
+        properties_file.close()
+
+    with open(plan_filename, 'w') as plan_file:
+        json.dump(collections.OrderedDict([
+            ('version', config.PLAN_VERSION),
+            ('instance', config.xmod_url),
+            ('nonProd', config.non_prod),
+            ('workbook', config.properties_filename),
+            ('workbookSha256', digest),
+            ('created', time.strftime('%Y-%m-%dT%H:%M:%S%z')),
+            ('actions', actions),
+        ]), plan_file, indent=1)
+    # A new plan is applied from the start
+    journal.Journal(plan_filename + config.JOURNAL_SUFFIX).clear()
+    _logger.info('Wrote the plan of %d action(s) to %s', len(actions), plan_filename)
+    for line in _plan_summary(actions):
+        _logger.info(line)
+    return 0
+
+def _check_plan(plan_filename: str, plan_obj: dict, digests: set):
+    """Returns True if the plan was made for this instance and workbook
+        
+        Args:
+        plan_filename (str): The plan file
+        plan_obj (dict): The plan read from it
+        digests (set): SHA-256 of the workbooks the plan may be applied to:
+            the planned one, and any saved by an interrupted apply
+        """
+    for name, planned, current in (
+            ('version', plan_obj.get('version'), config.PLAN_VERSION),
+            ('instance', plan_obj.get('instance'), config.xmod_url),
+            ('environment', plan_obj.get('nonProd'), config.non_prod)):
+        if planned != current:
+            _logger.error(config.ERR_PLAN_MISMATCH_MSG, plan_filename, name)
+            return False
+    if _file_digest(config.properties_filename) not in digests:
+        _logger.error(config.ERR_PLAN_MISMATCH_MSG, plan_filename, 'workbook')
+        return False
+    return True
+
+def _apply_user_create(target_name: str, data: dict, devices: list, resuming: bool):
+    """Creates a planned User with its devices
+        
+        When resuming, an existing User is returned instead, see _apply_plan.
+        
+        Returns:
+        tuple: (user_obj, missing) where missing is the number of devices
+        that could not be added
+        """
+    if resuming:
+        user_obj = _find_user(target_name)
+        if user_obj:
+            return user_obj, 0
+    started = time.monotonic()
+    user_obj = _add_user(target_name, data)
+    if not user_obj:
+        return None, 0
+    return user_obj, _add_user_devices(
+        target_name, [dict(device, owner=user_obj['id']) for device in devices], started)
+
+def _diff_fields(action: dict):
+    """Returns the names of the fields an update action found to differ"""
+    return frozenset(field['field'] for field in action.get('diff', []))
+
+def _apply_plan(book: sheets.PropertiesWorkbook, actions: list,
+                progress: journal.Journal, done: dict = None):
+    """Carries out the actions of a plan; returns the number that failed
+        
+        Each create and member add is recorded in progress, by its index
+        in actions, as soon as it succeeds.  When resuming, the actions an
+        earlier run recorded are not repeated, and each outstanding create
+        first looks the object up, in case that run created it without
+        getting to record it.
+        
+        Args:
+        book (PropertiesWorkbook): Open properties workbook
+        actions (list): The actions of the plan
+        progress (Journal): Where the actions carried out are recorded
+        done (dict): Action index -> created ID of the actions recorded by
+            an interrupted run, or None if not resuming
+        """
+    workers = config.workers or 1
+    id_field = sheets.id_field()
+    failed = 0
+    by_kind = collections.defaultdict(list)
+    for index, action in enumerate(actions):
+        by_kind[action['kind']].append((index, action))
+    resuming = done is not None
+    done = done or {}
+
+    def _creator(find, create):
+        if not resuming:
+            return create
+        return lambda name, *args: find(name) or create(name, *args)
+
+    def _created(title: str, index: int, action: dict, obj_id: str):
+        if index not in done:
+            progress.record({'action': index, 'id': obj_id})
+        book.write(title, action['row'], id_field, obj_id)
+
+    site_ids = {}
+    creates = []
+    for index, action in by_kind['site']:
+        if action['action'] == 'update':
+            if 'id' in _diff_fields(action):
+                book.write('Sites', action['row'], id_field, action['id'])
+            book.write('Sites', action['row'], 'latitude', action['latitude'])
+            book.write('Sites', action['row'], 'longitude', action['longitude'])
+        if action['action'] != 'create':
+            site_ids.setdefault(action['name'], action['id'])
+        elif index in done:
+            _created('Sites', index, action, done[index])
+            site_ids.setdefault(action['name'], done[index])
+        else:
+            creates.append((index, action))
+    jobs = [(action['name'], action['data']) for _, action in creates]
+    for (index, action), (_, site_obj) in zip(creates, _map_buffered(
+            _creator(_find_site, _add_site), jobs, workers)):
+        if not site_obj:
+            failed += 1
+            continue
+        _created('Sites', index, action, site_obj['id'])
+        site_ids.setdefault(action['name'], site_obj['id'])
+
+    user_ids = {}
+    creates = []
+    for index, action in by_kind['user']:
+        if action['action'] == 'update' and 'id' in _diff_fields(action):
+            book.write('Admins', action['row'], id_field, action['id'])
+        if action['action'] != 'create':
+            user_ids.setdefault(action['name'], action['id'])
+            continue
+        if index in done:
+            _created('Admins', index, action, done[index])
+            user_ids.setdefault(action['name'], done[index])
+            continue
+        data = dict(action['data'], site=action['data']['site'] or site_ids.get(action['site']))
+        if not data['site']:
+            _logger.error('Unable to find Site "%s" for user %s.', action['site'], action['name'])
+            failed += 1
+            continue
+        creates.append((index, action, (action['name'], data, action['devices'], resuming)))
+    for (index, action, _), (_, (user_obj, missing)) in zip(creates, _map_buffered(
+            _apply_user_create, [job for _, _, job in creates], workers)):
+        if not user_obj:
+            failed += 1
+            continue
+        # Recorded even so, as a rerun would find the User and add no devices
+        failed += missing
+        _created('Admins', index, action, user_obj['id'])
+        user_ids.setdefault(action['name'], user_obj['id'])
+
+    groups = set()
+    creates = []
+    for index, action in by_kind['group']:
+        if action['action'] == 'update' and 'id' in _diff_fields(action):
+            book.write('Groups', action['row'], id_field, action['id'])
+        if action['action'] != 'create':
+            groups.add(action['name'])
+            continue
+        if index in done:
+            _created('Groups', index, action, done[index])
+            groups.add(action['name'])
+            continue
+        supervisors = [user_ids[name] for name in action['supervisors'] if user_ids.get(name)]
+        data = dict(action['data'], site=action['data']['site'] or site_ids.get(action['site']),
+                    supervisors=supervisors)
+        if not data['site']:
+            _logger.error('Unable to find Site "%s" for Group %s.', action['site'], action['name'])
+            failed += 1
+            continue
+        creates.append((index, action, (action['name'], data)))
+    for (index, action, _), (_, group_obj) in zip(creates, _map_buffered(
+            _creator(_find_group, _add_group), [job for _, _, job in creates], workers)):
+        if not group_obj:
+            failed += 1
+            continue
+        _created('Groups', index, action, group_obj['id'])
+        groups.add(action['name'])
+
+    adds = []
+    for index, action in by_kind['member']:
+        if action['action'] != 'add' or index in done:
+            continue
+        if action['group'] not in groups or not user_ids.get(action['name']):
+            _logger.error('Unable to add "%s" to Group "%s".', action['name'], action['group'])
+            failed += 1
+            continue
+        adds.append((index, (action['group'], user_ids[action['name']])))
+    for (index, _), (_, member_obj) in zip(adds, _map_buffered(
+            _add_group_member, [job for _, job in adds], workers)):
+        if not member_obj:
+            failed += 1
+            continue
+        progress.record({'action': index})
+    return failed
+
+def apply(plan_filename: str):
+    """Carry out a plan written by plan(), without reading xMatters again.
+
+    The plan is only applied to the instance, environment and unchanged
+    workbook it was made for.  The planned objects are created, in
+    dependency order and concurrently within each kind, and their IDs
+    are written back to the workbook, which is saved once.
+
+    The progress is journaled next to the plan file until every action
+    succeeded, so running apply again after a crash or failures resumes
+    the plan, even though the workbook was saved with the IDs created so
+    far: only the actions not yet carried out are attempted, and the
+    outstanding creates first look for the object, see _apply_plan.
+    Running plan again starts over.
+
+    Args:
+        plan_filename (str): The plan to apply
+
+    Returns:
+        int: ERR_PLAN_MISMATCH_CODE if the plan does not fit, 1 if any
+        action failed, else 0
+    """
+    global _logger # pylint: disable=global-statement
+    global _client # pylint: disable=global-statement
+
+    _logger = np_logger.get_logger()
+    with open(plan_filename) as plan_file:
+        plan_obj = json.load(plan_file)
+    progress = journal.Journal(plan_filename + config.JOURNAL_SUFFIX)
+    entries = progress.entries()
+    digests = {plan_obj.get('workbookSha256')}
+    digests.update(entry['workbookSha256'] for entry in entries if 'workbookSha256' in entry)
+    if not _check_plan(plan_filename, plan_obj, digests):
+        return config.ERR_PLAN_MISMATCH_CODE
+    _client = xm_client.get_client()
+
+    done = None
+    if entries:
+        done = {entry['action']: entry.get('id') for entry in entries if 'action' in entry}
+        _logger.info('Resuming the plan %s; %d action(s) were already carried out.',
+                     plan_filename, len(done))
+    else:
+        # Marks the plan as started, so even a run that dies before its
+        # first create is resumed
+        progress.record({'workbookSha256': plan_obj.get('workbookSha256')})
+
+    book = _open_book()
+    try:
+        with xm_metrics.phase('apply'):
+            failed = _apply_plan(book, plan_obj['actions'], progress, done)
+        _log_user_latencies()
+    finally:
+        _save_book(book)
+        progress.record({'workbookSha256': _file_digest(config.properties_filename)})
+    if failed:
+        progress.close()
+    else:
+        progress.clear()
+
+    changes = len([action for action in plan_obj['actions']
+                   if action['action'] in ('create', 'update', 'add')])
+    _logger.info('Applied %d planned change(s), %d failed', changes - failed, failed)
+    if failed:
+        _logger.error('%d planned change(s) failed; exiting with 1.', failed)
+        return 1
+    return 0
 
 def main():
     """In case we need to execute the module directly"""
@@ -0,0 +1,193 @@
+"""Compares worksheet rows with xMatters objects field by field
+
+    Each xMatters object is normalized once, when it is retrieved or
+    prefetched: RemoteSite, RemoteUser and RemoteGroup are the decoded
+    objects themselves (they are dicts), plus the role names, supervisor
+    IDs and similar collections precomputed as frozensets.  Comparing a
+    row with an object then costs one step per field and yields a Diff,
+    the list of fields that do not match with both of their values.  The
+    same Diff is logged, written to plans, and decides which worksheet
+    cells are updated.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import collections
+
+import config
+import sheets
+
+class RemoteObject(dict):
+    """An object as retrieved from xMatters"""
+
+    @classmethod
+    def of(cls, obj):
+        """Returns obj normalized, or None if there is no object"""
+        if obj is None or isinstance(obj, cls):
+            return obj
+        return cls(obj)
+
+class RemoteSite(RemoteObject):
+    """A Site as retrieved from xMatters"""
+
+class RemoteUser(RemoteObject):
+    """A User as retrieved from xMatters, with its role names
+
+    Attributes:
+        roles (frozenset): Names of the User's roles
+    """
+
+    def __init__(self, obj: dict):
+        super(RemoteUser, self).__init__(obj)
+        self.roles = frozenset(role['name'] for role in
+                               (obj.get('roles') or {}).get('data', []))
+
+class RemoteGroup(RemoteObject):
+    """A Group as retrieved from xMatters, with its supervisor IDs
+
+    Attributes:
+        site_id (str): ID of the Group's Site
+        supervisors (frozenset): IDs of the Group's supervisors
+    """
+
+    def __init__(self, obj: dict):
+        super(RemoteGroup, self).__init__(obj)
+        self.site_id = (obj.get('site') or {}).get('id')
+        self.supervisors = frozenset(supervisor['id'] for supervisor in
+                                     (obj.get('supervisors') or {}).get('data', []))
+
+class FieldDiff(collections.namedtuple('FieldDiff', 'field sheet remote')):
+    """One field whose worksheet and xMatters values differ
+
+    Attributes:
+        field (str): Name of the field
+        sheet: The worksheet's value
+        remote: The xMatters object's value
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return '%s:(cell=[%s],object=[%s])' % (
+            self.field, _printable(self.sheet), _printable(self.remote))
+
+def _printable(value):
+    """Returns sets in a stable order, for messages and JSON"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return value
+
+class Diff(object):
+    """The fields of one worksheet row that differ from its xMatters object
+
+    Attributes:
+        kind (str): 'Site', 'User' or 'Group'
+        name (str): The object's name
+        fields (tuple): The FieldDiffs, in comparison order
+    """
+    __slots__ = ('kind', 'name', 'fields', '_names')
+
+    def __init__(self, kind: str, name: str, fields: list):
+        self.kind = kind
+        self.name = name
+        self.fields = tuple(fields)
+        self._names = frozenset(field.field for field in self.fields)
+
+    @property
+    def matches(self) -> bool:
+        """True if no field differs"""
+        return not self.fields
+
+    def __contains__(self, field: str) -> bool:
+        """True if the named field differs"""
+        return field in self._names
+
+    def __str__(self):
+        return ', '.join(str(field) for field in self.fields)
+
+    def to_list(self) -> list:
+        """Returns the differing fields as JSON serializable dicts"""
+        return [collections.OrderedDict([
+            ('field', field.field), ('sheet', _printable(field.sheet)),
+            ('remote', _printable(field.remote))]) for field in self.fields]
+
+    def log(self, logger):
+        """Logs the outcome of the comparison the way processor always has"""
+        if self.fields:
+            logger.error('%s "%s" DOES NOT MATCH the source worksheet.%s',
+                         self.kind, self.name, self)
+        else:
+            logger.info('%s "%s" matches the source worksheet', self.kind, self.name)
+
+def _compare(fields: list, field: str, sheet, remote):
+    if sheet != remote:
+        fields.append(FieldDiff(field, sheet, remote))
+
+def diff_site(rec, site_obj) -> Diff:
+    """Compares a Sites record with its Site
+
+    address2 is only compared if the Site has one.
+    """
+    site_obj = RemoteSite.of(site_obj)
+    fields = []
+    _compare(fields, 'id', getattr(rec, sheets.id_field()), site_obj.get('id'))
+    _compare(fields, 'address1', rec.address1, site_obj.get('address1'))
+    if site_obj.get('address2'):
+        _compare(fields, 'address2', rec.address2, site_obj['address2'])
+    for field in ('city', 'country', 'language', 'postalCode', 'state', 'timezone'):
+        _compare(fields, field, getattr(rec, field), site_obj.get(field))
+    return Diff('Site', site_obj['name'], fields)
+
+def diff_user(rec, user_obj) -> Diff:
+    """Compares an Admins record with its User
+
+    The User must have at least the record's roles; further roles are
+    allowed, and a role listed twice in the record is only needed once.
+    An empty Roles cell requires no roles.
+    """
+    user_obj = RemoteUser.of(user_obj)
+    fields = []
+    _compare(fields, config.udf_name, rec.propertyName,
+             (user_obj.get('properties') or {}).get(config.udf_name))
+    _compare(fields, 'id', getattr(rec, sheets.id_field()), user_obj.get('id'))
+    _compare(fields, 'firstName', rec.firstName, user_obj.get('firstName'))
+    _compare(fields, 'lastName', rec.lastName, user_obj.get('lastName'))
+    roles = frozenset(role for role in (rec.roles or '').split('|') if role)
+    if not roles <= user_obj.roles:
+        fields.append(FieldDiff('roles', roles, user_obj.roles))
+    return Diff('User', user_obj['targetName'], fields)
+
+def diff_group(rec, site_id: str, supervisors, group_obj, members) -> Diff:
+    """Compares a Groups record with its Group
+
+    The Group must belong to the record's Site, must not be observed by
+    all, and must have at least the property's supervisors both as
+    supervisors and as members.
+
+    Args:
+        rec: The Groups record
+        site_id (str): ID of the record's Site
+        supervisors: IDs of the property's Admins
+        group_obj (dict): The Group
+        members: IDs of the Group's members
+    """
+    group_obj = RemoteGroup.of(group_obj)
+    supervisors = frozenset(supervisors)
+    members = frozenset(members)
+    fields = []
+    _compare(fields, 'id', getattr(rec, sheets.id_field()), group_obj.get('id'))
+    _compare(fields, 'site', site_id, group_obj.site_id)
+    if not group_obj.supervisors or not supervisors <= group_obj.supervisors:
+        fields.append(FieldDiff('supervisors', supervisors, group_obj.supervisors))
+    _compare(fields, 'observedByAll', False, group_obj.get('observedByAll'))
+    if not members or not supervisors <= members:
+        fields.append(FieldDiff('members', supervisors, members))
+    return Diff('Group', group_obj['targetName'], fields)
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
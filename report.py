@@ -0,0 +1,299 @@
+"""Generates the Group on-call report
+
+    Lists every Group, retrieves who is on call for each of them today,
+    and writes one row per on-call member with the member's name, 2016 DRE
+    property and device addresses.  Which devices are reported, and in
+    which columns, is configured by report_devices.
+
+    The per-Group on-call requests and the per-person requests are spread
+    over a bounded worker pool, and every person is fetched only once, no
+    matter how many Groups and Shifts they appear in.  Only a few Groups
+    per worker are looked up ahead of the rows being written.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import collections
+import csv
+import json
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import xlsxwriter
+
+import config
+import np_logger
+import xm_client
+
+_logger = None
+_client = None
+
+# Groups whose on-call lookups may run ahead of the one being written, per worker
+LOOKAHEAD = 4
+
+# Columns ahead of the device columns, which come from report_devices
+HEADER = ('group_name', 'group_description', 'user_name', 'shift',
+          'position', 'delay', 'first_name', 'last_name', 'DRE')
+
+class _XlsxRowWriter(object):
+    """Writes report rows to an .xlsx file in constant memory mode
+
+    Each row is flushed to disk as soon as the next one starts, so memory
+    use does not grow with the size of the report.
+    """
+
+    def __init__(self, filename: str, header: tuple):
+        self._workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+        self._worksheet = self._workbook.add_worksheet()
+        self._row_num = 0
+        self.write(header)
+
+    def write(self, row: tuple):
+        """Appends one row"""
+        self._worksheet.write_row(self._row_num, 0, row)
+        self._row_num += 1
+
+    def close(self):
+        """Finishes the file"""
+        self._workbook.close()
+
+class _CsvRowWriter(object):
+    """Writes report rows to a .csv file with a header line"""
+
+    def __init__(self, filename: str, header: tuple):
+        self._file = open(filename, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self.write(header)
+
+    def write(self, row: tuple):
+        """Appends one row"""
+        self._writer.writerow(row)
+
+    def close(self):
+        """Finishes the file"""
+        self._file.close()
+
+class _JsonlRowWriter(object):
+    """Writes report rows to a JSON Lines file, one object per row"""
+
+    def __init__(self, filename: str, header: tuple):
+        self._file = open(filename, 'w')
+        self._header = header
+
+    def write(self, row: tuple):
+        """Appends one row"""
+        self._file.write(json.dumps(dict(zip(self._header, row))) + '\n')
+
+    def close(self):
+        """Finishes the file"""
+        self._file.close()
+
+# Row writer per report format
+WRITERS = collections.OrderedDict([
+    ('xlsx', _XlsxRowWriter),
+    ('csv', _CsvRowWriter),
+    ('jsonl', _JsonlRowWriter),
+])
+
+def _get_json(url: str):
+    """Retrieves url and returns the decoded body, or None on failure
+
+    The response cache is bypassed, so that the report shows each
+    person's current names and devices.
+
+    Args:
+        url (str): Fully qualified resource URL
+    """
+    try:
+        response = _client.get(url, cache=False)
+    except requests.exceptions.RequestException as e:
+        _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
+        return None
+    if response.status_code != 200:
+        _logger.warning(config.ERR_INITIAL_REQUEST_FAILED_MSG,
+                        response.status_code, url)
+        return None
+    return response.json()
+
+class _DeviceProjection(object):
+    """Maps a person's devices onto the report's device columns
+
+    Built once from a device name -> (column, field) table, so placing a
+    device costs a single dict lookup.  Devices not in the table are
+    ignored; columns without a device hold 'None'.
+
+    Attributes:
+        header (tuple): The device column names, in table order
+    """
+
+    def __init__(self, report_devices: dict):
+        self.header = tuple(column for column, _ in report_devices.values())
+        self._slots = {}
+        for index, (name, (_, field)) in enumerate(report_devices.items()):
+            self._slots[name] = (index, field)
+
+    def project(self, devices: list):
+        """Returns the device columns for a person's devices"""
+        columns = ['None'] * len(self.header)
+        for device in devices:
+            slot = self._slots.get(device['name'])
+            if slot is not None:
+                columns[slot[0]] = device.get(slot[1], 'None')
+        return tuple(columns)
+
+def _get_person(user_name: str, projection: _DeviceProjection):
+    """Retrieves a person and their devices
+
+    Returns:
+        tuple: The person's columns, first_name onwards, or None if the
+        person can not be read
+    """
+    base_url = config.xmod_url + '/api/xm/1/people/' + urllib.parse.quote(user_name)
+    person = _get_json(base_url + '?embed=roles')
+    if person is None:
+        return None
+    devices = _get_json(base_url + '/devices') or {}
+    return ((person['firstName'], person['lastName'],
+             person.get('properties', {}).get('2016 DRE', 'None')) +
+            projection.project(devices.get('data', [])))
+
+class _People(object):
+    """Deduplicates person lookups across Groups and Shifts
+
+    The first request for a person submits its lookup to the pool; every
+    later request shares the same future, so each person is fetched and
+    projected onto the report columns only once.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, projection: _DeviceProjection):
+        self._pool = pool
+        self._projection = projection
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._futures)
+
+    def get(self, user_name: str):
+        """Returns the future of the named person's columns"""
+        with self._lock:
+            future = self._futures.get(user_name)
+            if future is None:
+                future = self._pool.submit(_get_person, user_name, self._projection)
+                self._futures[user_name] = future
+            return future
+
+def _get_on_call(group: dict, today: str, people: _People):
+    """Retrieves today's on-call entries of a Group
+
+    The lookups of the on-call members are started right away, so they
+    run while other Groups are still being retrieved.
+
+    Returns:
+        list: The on-call entries, or None if they can not be read
+    """
+    _logger.info('Retrieving on-call for Group "%s"', group['targetName'])
+    url = (config.xmod_url + '/api/xm/1/on-call?groups=' +
+           urllib.parse.quote(group['id']) + '&embed=shift,members.owner' +
+           '&from=' + today + 'T08:00:00Z&to=' + today + 'T23:59:59Z')
+    on_call = _get_json(url)
+    if on_call is None:
+        return None
+    for entry in on_call['data']:
+        if 'shift' in entry:
+            for member in entry['members']['data']:
+                people.get(member['member']['targetName'])
+    return on_call['data']
+
+def _write_on_call(writer, padding: tuple, people: _People, group: dict, future):
+    """Writes the rows of one Group once its on-call lookup completes
+
+    Returns:
+        int: The number of rows written
+    """
+    entries = future.result()
+    if entries is None:
+        return 0
+    rows = 0
+    group_columns = (group['targetName'], group.get('description'))
+    for entry in entries:
+        if 'shift' not in entry:
+            _logger.info('No Shifts are defined for Group "%s".', group['targetName'])
+            row = group_columns + ('', 'No Shifts defined')
+            writer.write(row + padding[len(row):])
+            rows += 1
+            continue
+        shift = entry['shift']['name']
+        for member in entry['members']['data']:
+            user_name = member['member']['targetName']
+            person_columns = people.get(user_name).result()
+            if person_columns is None:
+                continue
+            writer.write(group_columns + (
+                user_name, shift, member['position'], member['delay']) +
+                         person_columns)
+            rows += 1
+    return rows
+
+def generate(filename: str, report_format: str = 'xlsx'):
+    """Writes today's on-call report for every Group to filename
+
+    Rows are written one at a time, in Group, Shift and member order, as
+    soon as their lookups complete.  At most LOOKAHEAD Groups per worker
+    are retrieved ahead of the Group being written, so the pending lookups
+    do not grow with the number of Groups; only the columns of each
+    distinct person are kept for the whole report.
+
+    Args:
+        filename (str): Location of the report
+        report_format (str): One of the WRITERS formats
+    """
+    global _logger # pylint: disable=global-statement
+    global _client # pylint: disable=global-statement
+
+    _logger = np_logger.get_logger()
+    _client = xm_client.get_client()
+
+    today = time.strftime("%Y-%m-%d")
+    url = config.xmod_url + '/api/xm/1/groups'
+    projection = _DeviceProjection(config.report_devices or config.DEFAULT_REPORT_DEVICES)
+    header = HEADER + projection.header
+    padding = (None,) * len(header)
+
+    workers = config.workers or 1
+    writer = WRITERS[report_format](filename, header)
+    rows = 0
+    groups = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            people = _People(pool, projection)
+            # Start each Group's on-call lookup as soon as its page arrives,
+            # writing out the oldest Group once too many are pending
+            on_calls = collections.deque()
+            try:
+                for group in _client.paginate(url, cache=False, read_ahead=True):
+                    on_calls.append(
+                        (group, pool.submit(_get_on_call, group, today, people)))
+                    groups += 1
+                    if len(on_calls) > LOOKAHEAD * workers:
+                        rows += _write_on_call(writer, padding, people, *on_calls.popleft())
+            except requests.exceptions.RequestException as e:
+                _logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
+            while on_calls:
+                rows += _write_on_call(writer, padding, people, *on_calls.popleft())
+    finally:
+        writer.close()
+    _logger.info('Wrote %d on-call row(s) for %d Group(s) and %d person(s) to %s',
+                 rows, groups, len(people), filename)
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
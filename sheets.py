@@ -0,0 +1,176 @@
+"""Header driven access to the worksheets of the properties workbook
+
+    Each worksheet's header row is read once to map field names (the
+    header text, e.g. 'targetName') to column positions.  Rows are then
+    handed out as compact namedtuple records, so processing code reads
+    `record.targetName` instead of comparing column letters cell by cell.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import collections
+import os
+
+import config
+
+# Fields each worksheet must provide, by worksheet title
+REQUIRED_FIELDS = collections.OrderedDict([
+    ('Sites', ('propertyName', 'prodId', 'npId', 'name', 'address1',
+               'address2', 'city', 'country', 'language', 'postalCode',
+               'state', 'timezone', 'latitude', 'longitude')),
+    ('Admins', ('propertyName', 'prodId', 'npId', 'targetName', 'firstName',
+                'lastName', 'roles', 'site', 'email')),
+    ('Groups', ('propertyName', 'prodId', 'npId', 'targetName', 'site')),
+])
+
+class SchemaError(Exception):
+    """Raised when a worksheet is missing or lacks required header fields
+
+    Attributes:
+        result_code (int): The exit code for the error, see config
+    """
+    def __init__(self, msg: str, result_code: int):
+        super(SchemaError, self).__init__(msg)
+        self.result_code = result_code
+
+def id_field() -> str:
+    """Returns the ID field of the environment being processed"""
+    return 'npId' if config.non_prod else 'prodId'
+
+class SheetSchema(object):
+    """Field to column map of one worksheet, read from its header row
+
+    Header cells that are empty or not valid identifiers are ignored.
+
+    Attributes:
+        title (str): The worksheet title
+        fields (tuple): Field names in column order
+        record_type (type): namedtuple of 'row' plus fields
+    """
+
+    def __init__(self, sheet, required: tuple = ()):
+        self.title = sheet.title
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        self._columns = collections.OrderedDict()
+        for index, name in enumerate(header):
+            if isinstance(name, str) and name.isidentifier() and name != 'row':
+                self._columns.setdefault(name, index)
+        missing = [field for field in required if field not in self._columns]
+        if missing:
+            raise SchemaError(config.ERR_SCHEMA_MISSING_FIELDS_MSG %
+                              (self.title, ', '.join(missing)),
+                              config.ERR_SCHEMA_MISSING_FIELDS_CODE)
+        self.fields = tuple(self._columns)
+        self._positions = tuple(self._columns.values())
+        self.record_type = collections.namedtuple(
+            self.title + 'Record', ('row',) + self.fields)
+
+    def column(self, field: str) -> int:
+        """Returns the 1-based column index of field"""
+        return self._columns[field] + 1
+
+    def record(self, row_num: int, values: tuple):
+        """Builds the record for one row of values"""
+        width = len(values)
+        return self.record_type(
+            row_num, *[values[i] if i < width else None for i in self._positions])
+
+    def records(self, sheet):
+        """Yields a record for every non-empty data row of sheet"""
+        for row_num, values in enumerate(
+                sheet.iter_rows(min_row=2, values_only=True), 2):
+            if any(value is not None for value in values):
+                yield self.record(row_num, values)
+
+class PropertiesWorkbook(object):
+    """The properties workbook, accessed through its worksheet schemas
+
+    Only the worksheets being processed are checked and read, so e.g.
+    processing Sites does not need the Admins or Groups worksheets.
+    Writes are recorded in the optional journal before they are applied,
+    and the workbook is only written to disk by save().
+
+    Attributes:
+        workbook (Workbook): The underlying openpyxl workbook
+        schemas (dict): SheetSchema per worksheet title read
+        journal (Journal): Optional write-ahead journal of writes
+        dirty (bool): True if there are writes not yet saved
+    """
+
+    def __init__(self, workbook, journal=None, titles=None):
+        self.workbook = workbook
+        self.journal = journal
+        self.dirty = False
+        self.schemas = {}
+        for title, required in REQUIRED_FIELDS.items():
+            if titles is not None and title not in titles:
+                continue
+            if title not in workbook.sheetnames:
+                raise SchemaError(config.ERR_SCHEMA_MISSING_SHEET_MSG % title,
+                                  config.ERR_SCHEMA_MISSING_SHEET_CODE)
+            self.schemas[title] = SheetSchema(workbook[title], required)
+
+    def __contains__(self, title: str):
+        """True if the titled worksheet was read"""
+        return title in self.schemas
+
+    def records(self, title: str):
+        """Yields the records of the titled worksheet"""
+        return self.schemas[title].records(self.workbook[title])
+
+    def write(self, title: str, row_num: int, field: str, value):
+        """Sets field of row_num in the titled worksheet to value"""
+        if self.journal is not None:
+            self.journal.append(title, row_num, field, value)
+        self._set(title, row_num, field, value)
+
+    def _set(self, title: str, row_num: int, field: str, value):
+        schema = self.schemas.get(title)
+        if schema is None:
+            # A journaled write to a worksheet this run does not process
+            schema = self.schemas[title] = SheetSchema(self.workbook[title])
+        self.workbook[title].cell(
+            row=row_num, column=schema.column(field)).value = value
+        self.dirty = True
+
+    def replay_journal(self) -> int:
+        """Applies the writes a previous, unfinished run left in the journal
+
+        Returns:
+            int: The number of writes applied
+        """
+        if self.journal is None:
+            return 0
+        entries = self.journal.entries()
+        for entry in entries:
+            self._set(entry['sheet'], entry['row'], entry['field'], entry['value'])
+        return len(entries)
+
+    def save(self, filename: str):
+        """Writes the workbook to filename if anything changed
+
+        The workbook is written to a temporary file which then replaces
+        filename, so a crash while saving never leaves a truncated file.
+        Once saved, the journal is no longer needed and is discarded.
+
+        Returns:
+            bool: True if the workbook was written
+        """
+        if not self.dirty:
+            return False
+        temp_filename = filename + '.tmp'
+        self.workbook.save(temp_filename)
+        os.replace(temp_filename, filename)
+        self.dirty = False
+        if self.journal is not None:
+            self.journal.clear()
+        return True
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
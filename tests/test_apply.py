@@ -0,0 +1,137 @@
+"""Tests of applying a plan, resuming it, and refusing a changed workbook"""
+
+import collections
+import json
+import logging
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import config
+import np_logger
+import processor
+import sheets
+
+BASE = 'https://company.xmatters.com'
+
+class FakeXMatters(object):
+    """Stands in for processor's xMatters requests, keeping what was posted"""
+
+    def __init__(self):
+        self.objects = {}
+        self.posts = collections.Counter()
+        self.fail = set()
+
+    def find(self, kind):
+        return lambda name: self.objects.get((kind, name))
+
+    def add(self, kind):
+        def _add(name, data):
+            if kind in self.fail:
+                if kind == 'user':
+                    raise RuntimeError('interrupted')
+                return None
+            self.posts[kind] += 1
+            obj = self.objects[(kind, name)] = {'id': '%s-%s' % (kind, name)}
+            return obj
+        return _add
+
+@pytest.fixture
+def xmatters(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'properties_filename', str(tmp_path / 'wb.xlsx'))
+    monkeypatch.setattr(config, 'xmod_url', BASE)
+    monkeypatch.setattr(config, 'non_prod', True)
+    monkeypatch.setattr(config, 'workers', 2)
+    logger = logging.getLogger('test_apply')
+    logger.addHandler(logging.NullHandler())
+    monkeypatch.setattr(np_logger, '__logger', logger)
+    monkeypatch.setattr(processor.xm_client, 'get_client', lambda: None)
+    monkeypatch.setattr(processor, '_user_latencies', [])
+    fake = FakeXMatters()
+    for kind in ('site', 'user', 'group'):
+        monkeypatch.setattr(processor, '_find_' + kind, fake.find(kind))
+        monkeypatch.setattr(processor, '_add_' + kind, fake.add(kind))
+    def _add_group_member(group_name, user_id):
+        fake.posts['member'] += 1
+        return {'group': group_name, 'member': user_id}
+    monkeypatch.setattr(processor, '_add_group_member', _add_group_member)
+    _write_workbook(config.properties_filename)
+    return fake
+
+def _write_workbook(filename: str):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    rows = {'Sites': {'propertyName': 'Prop', 'name': 'Main'},
+            'Admins': {'propertyName': 'Prop', 'targetName': 'jdoe', 'site': 'Main'},
+            'Groups': {'propertyName': 'Prop', 'targetName': 'Main - Security', 'site': 'Main'}}
+    for title, fields in sheets.REQUIRED_FIELDS.items():
+        sheet = workbook.create_sheet(title)
+        sheet.append(fields)
+        sheet.append([rows[title].get(field) for field in fields])
+    workbook.save(filename)
+
+def _write_plan(filename: str):
+    actions = [
+        {'kind': 'site', 'row': 2, 'name': 'Main', 'action': 'create', 'data': {}},
+        {'kind': 'user', 'row': 2, 'name': 'jdoe', 'site': 'Main', 'action': 'create',
+         'data': {'site': None}, 'devices': []},
+        {'kind': 'group', 'row': 2, 'name': 'Main - Security', 'site': 'Main',
+         'action': 'create', 'data': {'site': None}, 'supervisors': ['jdoe']},
+        {'kind': 'member', 'group': 'Main - Security', 'name': 'jdoe', 'action': 'add'},
+    ]
+    with open(filename, 'w') as plan_file:
+        json.dump({'version': config.PLAN_VERSION, 'instance': BASE, 'nonProd': True,
+                   'workbookSha256': processor._file_digest(config.properties_filename),
+                   'actions': actions}, plan_file)
+
+def _ids():
+    workbook = load_workbook(config.properties_filename)
+    return [workbook[title]['C2'].value for title in ('Sites', 'Admins', 'Groups')]
+
+def test_failed_actions_are_resumed(xmatters, tmp_path):
+    plan_filename = str(tmp_path / 'plan.json')
+    _write_plan(plan_filename)
+    xmatters.fail.add('group')
+    assert processor.apply(plan_filename) == 1
+    assert _ids() == ['site-Main', 'user-jdoe', None]
+
+    xmatters.fail.clear()
+    assert processor.apply(plan_filename) == 0
+    assert xmatters.posts == {'site': 1, 'user': 1, 'group': 1, 'member': 1}
+    assert _ids() == ['site-Main', 'user-jdoe', 'group-Main - Security']
+    assert not (tmp_path / ('plan.json' + config.JOURNAL_SUFFIX)).exists()
+
+def test_interrupted_apply_is_resumed(xmatters, tmp_path):
+    plan_filename = str(tmp_path / 'plan.json')
+    _write_plan(plan_filename)
+    xmatters.fail.add('user')
+    with pytest.raises(RuntimeError):
+        processor.apply(plan_filename)
+    assert _ids() == ['site-Main', None, None]
+
+    xmatters.fail.clear()
+    assert processor.apply(plan_filename) == 0
+    assert xmatters.posts == {'site': 1, 'user': 1, 'group': 1, 'member': 1}
+    assert _ids() == ['site-Main', 'user-jdoe', 'group-Main - Security']
+
+def test_creates_are_looked_up_when_resuming(xmatters, tmp_path):
+    plan_filename = str(tmp_path / 'plan.json')
+    _write_plan(plan_filename)
+    xmatters.fail.add('group')
+    assert processor.apply(plan_filename) == 1
+    # Created by the first run, but never recorded as done
+    xmatters.objects[('group', 'Main - Security')] = {'id': 'group-found'}
+    xmatters.fail.clear()
+    assert processor.apply(plan_filename) == 0
+    assert xmatters.posts['group'] == 0
+    assert _ids()[2] == 'group-found'
+
+def test_plan_is_refused_after_the_workbook_changed(xmatters, tmp_path):
+    plan_filename = str(tmp_path / 'plan.json')
+    _write_plan(plan_filename)
+    workbook = load_workbook(config.properties_filename)
+    workbook['Sites']['D2'] = 'Annex'
+    workbook.save(config.properties_filename)
+    assert processor.apply(plan_filename) == config.ERR_PLAN_MISMATCH_CODE
+    assert not xmatters.posts
+    assert _ids() == [None, None, None]
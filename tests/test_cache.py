@@ -0,0 +1,67 @@
+"""Tests of the persistent response cache"""
+
+import pytest
+
+import xm_cache
+
+BASE = 'https://company.xmatters.com/api/xm/1/'
+
+@pytest.fixture
+def cache(tmp_path):
+    response_cache = xm_cache.ResponseCache(str(tmp_path / 'cache.sqlite'), 3600, user='alice')
+    yield response_cache
+    response_cache.close()
+
+def test_get_returns_what_was_put(cache):
+    assert cache.get(BASE + 'sites/Main') is None
+    cache.put(BASE + 'sites/Main', b'{"id": "s1"}')
+    assert cache.get(BASE + 'sites/Main') == b'{"id": "s1"}'
+    assert cache.get(BASE + 'sites/Main?embed=x') is None
+
+def test_post_invalidates_its_collection_only(cache):
+    cache.put(BASE + 'sites/Main', b'site')
+    cache.put(BASE + 'people/jdoe?embed=roles', b'user')
+    cache.invalidate(BASE + 'sites')
+    assert cache.get(BASE + 'sites/Main') is None
+    assert cache.get(BASE + 'people/jdoe?embed=roles') == b'user'
+
+def test_devices_invalidate_people(cache):
+    cache.put(BASE + 'people/jdoe', b'user')
+    cache.put(BASE + 'groups/g', b'group')
+    cache.invalidate(BASE + 'devices')
+    assert cache.get(BASE + 'people/jdoe') is None
+    assert cache.get(BASE + 'groups/g') == b'group'
+
+def test_entries_expire(tmp_path):
+    expired = xm_cache.ResponseCache(str(tmp_path / 'cache.sqlite'), -1)
+    expired.put(BASE + 'sites/Main', b'site')
+    expired.put_id('https://company.xmatters.com', 'people', 'jdoe', 'u1')
+    assert expired.get(BASE + 'sites/Main') is None
+    assert expired.get_id('https://company.xmatters.com', 'people', 'jdoe') is None
+    expired.close()
+
+def test_refresh_discards_everything(tmp_path):
+    filename = str(tmp_path / 'cache.sqlite')
+    first = xm_cache.ResponseCache(filename, 3600)
+    first.put(BASE + 'sites/Main', b'site')
+    first.put_id('https://company.xmatters.com', 'people', 'jdoe', 'u1')
+    first.close()
+    kept = xm_cache.ResponseCache(filename, 3600)
+    assert kept.get(BASE + 'sites/Main') == b'site'
+    kept.close()
+    refreshed = xm_cache.ResponseCache(filename, 3600, refresh=True)
+    assert refreshed.get(BASE + 'sites/Main') is None
+    assert refreshed.get_id('https://company.xmatters.com', 'people', 'jdoe') is None
+    refreshed.close()
+
+def test_entries_are_kept_per_user_and_instance(tmp_path, cache):
+    cache.put(BASE + 'sites/Main', b'alice')
+    cache.put_id('https://company.xmatters.com', 'people', 'jdoe', 'u1')
+    bob = xm_cache.ResponseCache(str(tmp_path / 'cache.sqlite'), 3600, user='bob')
+    assert bob.get(BASE + 'sites/Main') is None
+    assert bob.get_id('https://company.xmatters.com', 'people', 'jdoe') is None
+    bob.put(BASE + 'sites/Main', b'bob')
+    bob.invalidate(BASE + 'sites')
+    bob.close()
+    assert cache.get(BASE + 'sites/Main') == b'alice'
+    assert cache.get('https://other.xmatters.com/api/xm/1/sites/Main') is None
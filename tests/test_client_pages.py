@@ -0,0 +1,94 @@
+"""Tests of XmClient's paging, against a fake requests session"""
+
+import json
+
+import pytest
+import requests
+
+import xm_client
+
+BASE = 'https://company.xmatters.com'
+PEOPLE = BASE + '/api/xm/1/people'
+
+class FakeResponse(object):
+    """The parts of a requests Response the client uses"""
+
+    def __init__(self, url: str, status_code: int, body: dict):
+        self.url = url
+        self.status_code = status_code
+        self.content = json.dumps(body).encode()
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(self.status_code)
+
+class FakeSession(object):
+    """Answers GETs from a dict of URL -> (status, body), recording each URL"""
+
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.urls = []
+
+    def request(self, method, url, timeout=None, **kwargs):
+        assert method == 'GET' and timeout == (1, 2)
+        self.urls.append(url)
+        status, body = self.pages[url]
+        return FakeResponse(url, status, body)
+
+def _client(pages: dict):
+    client = xm_client.XmClient(BASE, None, 1, timeout=(1, 2))
+    client.session = FakeSession(pages)
+    return client
+
+def _page(first: int, count: int, total: int, next_url: str = None):
+    page = {'count': count, 'total': total,
+            'data': [{'id': 'u%d' % i} for i in range(first, first + count)]}
+    if next_url:
+        page['links'] = {'next': next_url}
+    return page
+
+def test_pages_follow_links_next():
+    client = _client({
+        PEOPLE + '?offset=0&limit=2': (200, _page(0, 2, 3, '/api/xm/1/people?offset=2&limit=2')),
+        PEOPLE + '?offset=2&limit=2': (200, _page(2, 1, 3)),
+    })
+    assert [obj['id'] for obj in client.paginate(PEOPLE, limit=2, cache=False)] == [
+        'u0', 'u1', 'u2']
+    assert client.session.urls == [PEOPLE + '?offset=0&limit=2', PEOPLE + '?offset=2&limit=2']
+
+def test_pages_step_offset_without_links():
+    client = _client({
+        PEOPLE + '?embed=roles&offset=0&limit=2': (200, _page(0, 2, 5)),
+        PEOPLE + '?embed=roles&offset=2&limit=2': (200, _page(2, 2, 5)),
+        PEOPLE + '?embed=roles&offset=4&limit=2': (200, _page(4, 1, 5)),
+    })
+    pages = list(client.pages(PEOPLE + '?embed=roles', limit=2, cache=False))
+    assert [page['count'] for page in pages] == [2, 2, 1]
+    assert len(client.session.urls) == 3
+
+def test_pages_stop_on_an_empty_page():
+    client = _client({
+        PEOPLE + '?offset=0&limit=2': (200, _page(0, 2, 10)),
+        PEOPLE + '?offset=2&limit=2': (200, _page(2, 0, 10)),
+    })
+    assert len(list(client.pages(PEOPLE, limit=2, cache=False))) == 2
+
+def test_read_ahead_yields_the_same_objects():
+    client = _client({
+        PEOPLE + '?offset=0&limit=1': (200, _page(0, 1, 2)),
+        PEOPLE + '?offset=1&limit=1': (200, _page(1, 1, 2)),
+    })
+    assert [obj['id'] for obj in client.paginate(PEOPLE, limit=1, cache=False,
+                                                 read_ahead=True)] == ['u0', 'u1']
+
+def test_failed_page_raises():
+    client = _client({
+        PEOPLE + '?offset=0&limit=2': (200, _page(0, 2, 4)),
+        PEOPLE + '?offset=2&limit=2': (404, {'code': 404}),
+    })
+    with pytest.raises(requests.exceptions.HTTPError):
+        list(client.paginate(PEOPLE, limit=2, cache=False, read_ahead=True))
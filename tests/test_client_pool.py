@@ -0,0 +1,44 @@
+"""Tests of the shared, pooled client"""
+
+import pytest
+from requests.auth import HTTPBasicAuth
+
+import config
+import xm_client
+
+BASE = 'https://company.xmatters.com'
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    monkeypatch.setattr(config, 'xmod_url', BASE)
+    monkeypatch.setattr(config, 'basic_auth', HTTPBasicAuth('alice', 'secret'))
+    monkeypatch.setattr(config, 'use_cache', False)
+    monkeypatch.setattr(config, 'pool_size', 2)
+    monkeypatch.setattr(config, 'workers', 8)
+    monkeypatch.setattr(config, 'max_in_flight', None)
+    for name in ('__client', '__rate_limiter', '__cache'):
+        monkeypatch.setattr(xm_client, name, None)
+
+def test_client_is_shared():
+    client = xm_client.get_client()
+    assert xm_client.get_client() is client
+    assert client.limiter is xm_client.get_rate_limiter()
+    assert client.cache is None
+
+def test_one_pool_serves_both_schemes():
+    session = xm_client.get_client().session
+    adapter = session.get_adapter(BASE)
+    assert session.get_adapter('http://company.xmatters.com') is adapter
+    assert adapter._pool_block
+
+def test_pool_is_never_smaller_than_the_workers(monkeypatch):
+    assert xm_client.get_client().session.get_adapter(BASE)._pool_maxsize == 8
+    monkeypatch.setattr(xm_client, '__client', None)
+    monkeypatch.setattr(config, 'pool_size', 20)
+    assert xm_client.get_client().session.get_adapter(BASE)._pool_maxsize == 20
+
+def test_in_flight_defaults_to_the_pool_size():
+    client = xm_client.get_client()
+    for _ in range(8):
+        assert client._in_flight.acquire(blocking=False)
+    assert not client._in_flight.acquire(blocking=False)
@@ -0,0 +1,31 @@
+"""Tests of the write-ahead journal"""
+
+import journal
+
+def test_entries_round_trip(tmp_path):
+    log = journal.Journal(str(tmp_path / 'wb.journal.jsonl'))
+    assert log.entries() == []
+    log.append('Sites', 2, 'npId', 'abc')
+    log.record({'action': 3, 'id': 'def'})
+    assert log.entries() == [
+        {'sheet': 'Sites', 'row': 2, 'field': 'npId', 'value': 'abc'},
+        {'action': 3, 'id': 'def'}]
+
+def test_truncated_line_is_skipped_and_not_continued(tmp_path):
+    filename = tmp_path / 'wb.journal.jsonl'
+    filename.write_text('{"sheet": "Sites", "row": 2, "field": "npId", "value": "a"}\n'
+                        '{"sheet": "Admins", "row": 3, "fi')
+    log = journal.Journal(str(filename))
+    assert [entry['row'] for entry in log.entries()] == [2]
+    log.append('Groups', 4, 'npId', 'c')
+    log.close()
+    assert [entry['row'] for entry in journal.Journal(str(filename)).entries()] == [2, 4]
+
+def test_clear_removes_the_file(tmp_path):
+    filename = tmp_path / 'wb.journal.jsonl'
+    log = journal.Journal(str(filename))
+    log.append('Sites', 2, 'npId', 'a')
+    log.clear()
+    assert not filename.exists()
+    assert log.entries() == []
+    log.clear()
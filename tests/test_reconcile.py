@@ -0,0 +1,115 @@
+"""Tests of reconcile's field by field comparisons"""
+
+import collections
+
+import pytest
+
+import config
+import reconcile
+
+SiteRecord = collections.namedtuple(
+    'SiteRecord', 'row prodId npId name address1 address2 city country '
+    'language postalCode state timezone')
+AdminRecord = collections.namedtuple(
+    'AdminRecord', 'row propertyName prodId npId targetName firstName lastName roles')
+GroupRecord = collections.namedtuple('GroupRecord', 'row prodId npId targetName site')
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    monkeypatch.setattr(config, 'non_prod', True)
+    monkeypatch.setattr(config, 'udf_name', 'Property')
+
+def _site_rec(**fields):
+    values = dict(row=2, prodId=None, npId='s1', name='Site', address1='1 Main St',
+                  address2=None, city='Toronto', country='Canada', language='English',
+                  postalCode='M5V', state='ON', timezone='America/Toronto')
+    values.update(fields)
+    return SiteRecord(**values)
+
+def _site_obj(**fields):
+    obj = {'id': 's1', 'name': 'Site', 'address1': '1 Main St', 'city': 'Toronto',
+           'country': 'Canada', 'language': 'English', 'postalCode': 'M5V',
+           'state': 'ON', 'timezone': 'America/Toronto'}
+    obj.update(fields)
+    return obj
+
+def _user_obj(roles=('Standard User',), **fields):
+    obj = {'id': 'u1', 'targetName': 'jdoe', 'firstName': 'Jane', 'lastName': 'Doe',
+           'properties': {'Property': 'Prop'},
+           'roles': {'data': [{'name': role} for role in roles]}}
+    obj.update(fields)
+    return obj
+
+def _admin_rec(**fields):
+    values = dict(row=2, propertyName='Prop', prodId=None, npId='u1', targetName='jdoe',
+                  firstName='Jane', lastName='Doe', roles='Standard User')
+    values.update(fields)
+    return AdminRecord(**values)
+
+def _group_obj(supervisors=('u1',), **fields):
+    obj = {'id': 'g1', 'targetName': 'Site - Security', 'site': {'id': 's1'},
+           'observedByAll': False,
+           'supervisors': {'data': [{'id': supervisor} for supervisor in supervisors]}}
+    obj.update(fields)
+    return obj
+
+def test_site_matches():
+    diff = reconcile.diff_site(_site_rec(), _site_obj())
+    assert diff.matches
+    assert diff.to_list() == []
+
+def test_site_lists_each_differing_field():
+    diff = reconcile.diff_site(_site_rec(npId=None, city='Ottawa'), _site_obj())
+    assert not diff.matches
+    assert 'id' in diff and 'city' in diff and 'state' not in diff
+    assert [field['field'] for field in diff.to_list()] == ['id', 'city']
+    assert diff.fields[1] == reconcile.FieldDiff('city', 'Ottawa', 'Toronto')
+
+def test_site_address2_only_compared_when_present():
+    assert reconcile.diff_site(_site_rec(address2='Unit 5'), _site_obj()).matches
+    assert 'address2' in reconcile.diff_site(_site_rec(address2='Unit 5'),
+                                             _site_obj(address2='Unit 6'))
+
+def test_site_id_field_follows_environment(monkeypatch):
+    monkeypatch.setattr(config, 'non_prod', False)
+    assert 'id' in reconcile.diff_site(_site_rec(), _site_obj())
+    assert reconcile.diff_site(_site_rec(prodId='s1'), _site_obj()).matches
+
+def test_user_needs_at_least_the_record_roles():
+    user = _user_obj(roles=('Standard User', 'Group Supervisor'))
+    assert reconcile.diff_user(_admin_rec(roles='Standard User|Standard User'), user).matches
+    diff = reconcile.diff_user(_admin_rec(roles='Standard User|Company Admin'), user)
+    assert 'roles' in diff
+    assert diff.to_list()[0]['sheet'] == ['Company Admin', 'Standard User']
+
+@pytest.mark.parametrize('roles', ['', None, '|'])
+def test_user_empty_roles_require_none(roles):
+    assert reconcile.diff_user(_admin_rec(roles=roles), _user_obj(roles=())).matches
+
+def test_user_compares_property_and_names():
+    diff = reconcile.diff_user(_admin_rec(propertyName='Other', lastName='Roe'), _user_obj())
+    assert [field.field for field in diff.fields] == ['Property', 'lastName']
+
+def test_group_matches_with_supervisors_as_members():
+    rec = GroupRecord(2, None, 'g1', 'Site - Security', 'Site')
+    assert reconcile.diff_group(rec, 's1', ['u1'], _group_obj(), frozenset(['u1', 'u2'])).matches
+
+def test_group_reports_site_supervisors_and_members():
+    rec = GroupRecord(2, None, 'g1', 'Site - Security', 'Site')
+    diff = reconcile.diff_group(rec, 's2', ['u1', 'u3'], _group_obj(observedByAll=True),
+                                frozenset())
+    assert [field.field for field in diff.fields] == [
+        'site', 'supervisors', 'observedByAll', 'members']
+
+def test_group_without_supervisors_never_matches():
+    rec = GroupRecord(2, None, 'g1', 'Site - Security', 'Site')
+    assert 'supervisors' in reconcile.diff_group(rec, 's1', [], _group_obj(supervisors=()),
+                                                 frozenset(['u1']))
+
+def test_remote_objects_are_normalized_once():
+    user = reconcile.RemoteUser.of(_user_obj())
+    assert reconcile.RemoteUser.of(user) is user
+    assert reconcile.RemoteUser.of(None) is None
+    assert user.roles == frozenset(['Standard User'])
+    group = reconcile.RemoteGroup.of(_group_obj(site=None))
+    assert group.site_id is None and group.supervisors == frozenset(['u1'])
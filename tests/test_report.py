@@ -0,0 +1,66 @@
+"""Tests of the on-call report's row writers and device columns"""
+
+import csv
+import json
+
+from openpyxl import load_workbook
+
+import report
+
+HEADER = ('group_name', 'user_name', 'delay')
+ROWS = [('Front Desk', 'jdoe', 0), ('Front Desk, Night', 'o"brien', 15)]
+
+def _write(writer_type, filename: str):
+    writer = writer_type(filename, HEADER)
+    for row in ROWS:
+        writer.write(row)
+    writer.close()
+
+def test_writers_cover_every_format():
+    assert list(report.WRITERS) == ['xlsx', 'csv', 'jsonl']
+
+def test_xlsx_rows(tmp_path):
+    filename = str(tmp_path / 'report.xlsx')
+    _write(report.WRITERS['xlsx'], filename)
+    worksheet = load_workbook(filename).active
+    assert [tuple(row) for row in worksheet.iter_rows(values_only=True)] == [HEADER] + ROWS
+
+def test_csv_rows(tmp_path):
+    filename = tmp_path / 'report.csv'
+    _write(report.WRITERS['csv'], str(filename))
+    with open(str(filename), newline='') as csv_file:
+        assert list(csv.reader(csv_file)) == [list(HEADER)] + [
+            [str(value) for value in row] for row in ROWS]
+
+def test_jsonl_rows(tmp_path):
+    filename = tmp_path / 'report.jsonl'
+    _write(report.WRITERS['jsonl'], str(filename))
+    lines = filename.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == [dict(zip(HEADER, row)) for row in ROWS]
+
+def test_empty_report_has_only_the_header(tmp_path):
+    report.WRITERS['csv'](str(tmp_path / 'report.csv'), HEADER).close()
+    assert (tmp_path / 'report.csv').read_text().splitlines() == [','.join(HEADER)]
+    report.WRITERS['jsonl'](str(tmp_path / 'report.jsonl'), HEADER).close()
+    assert (tmp_path / 'report.jsonl').read_text() == ''
+
+DEVICES = {'Work Email': ('work_email', 'emailAddress'),
+           'Work Phone': ('work_phone', 'phoneNumber'),
+           'SMS Phone': ('sms', 'phoneNumber')}
+
+def test_projection_header_follows_the_table():
+    assert report._DeviceProjection(DEVICES).header == ('work_email', 'work_phone', 'sms')
+
+def test_projection_places_devices_by_name():
+    projection = report._DeviceProjection(DEVICES)
+    assert projection.project([
+        {'name': 'SMS Phone', 'phoneNumber': '+15555550100'},
+        {'name': 'Pager', 'pin': '1234'},
+        {'name': 'Work Email', 'emailAddress': 'jdoe@example.com'}]) == (
+            'jdoe@example.com', 'None', '+15555550100')
+
+def test_projection_of_missing_devices_and_fields():
+    projection = report._DeviceProjection(DEVICES)
+    assert projection.project([]) == ('None', 'None', 'None')
+    assert projection.project([{'name': 'Work Phone'}]) == ('None', 'None', 'None')
+    assert report._DeviceProjection({}).project([{'name': 'Work Email'}]) == ()
@@ -0,0 +1,162 @@
+"""Tests of processor's per-property scheduling, against stub reconcile functions"""
+
+import collections
+import logging
+import threading
+import time
+
+import pytest
+
+import config
+import np_logger
+import processor
+
+SiteRecord = collections.namedtuple('SiteRecord', 'row name')
+AdminRecord = collections.namedtuple('AdminRecord', 'row site targetName')
+GroupRecord = collections.namedtuple('GroupRecord', 'row site targetName')
+
+class FakeBook(object):
+    """The parts of a PropertiesWorkbook the scheduler reads"""
+
+    def __init__(self, **sheets):
+        self.sheets = sheets
+
+    def __contains__(self, title):
+        return title in self.sheets
+
+    def records(self, title):
+        return iter(self.sheets[title])
+
+class ListHandler(logging.Handler):
+    """Keeps the message of every record it is handed"""
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+@pytest.fixture
+def handler(monkeypatch):
+    logger = logging.getLogger('test_scheduler')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addFilter(np_logger._BufferFilter())
+    list_handler = ListHandler()
+    logger.addHandler(list_handler)
+    monkeypatch.setattr(np_logger, '__logger', logger)
+    monkeypatch.setattr(processor, '_logger', logger)
+    monkeypatch.setattr(config, 'workers', 4)
+    monkeypatch.setattr(processor, '_row_jobs', lambda title, site_name, records: [
+        (rec, (rec,) if title == 'Sites' else (rec, 'id-' + site_name)) for rec in records])
+    yield list_handler
+    logger.removeHandler(list_handler)
+    logger.filters.clear()
+
+def _book():
+    return FakeBook(
+        Sites=[SiteRecord(2, 'Slow'), SiteRecord(3, 'Fast')],
+        Admins=[AdminRecord(2, 'Slow', 'slow.1'), AdminRecord(3, 'Fast', 'fast.1'),
+                AdminRecord(4, 'Slow', 'slow.2')],
+        Groups=[GroupRecord(2, 'Fast', 'Fast - Security'),
+                GroupRecord(3, 'Slow', 'Slow - Security')])
+
+def test_each_property_runs_its_worksheets_in_order(handler, monkeypatch):
+    events = []
+    lock = threading.Lock()
+
+    def reconcile(title):
+        def _reconcile(rec, *args):
+            site_name = rec.name if title == 'Sites' else rec.site
+            with lock:
+                events.append(('start', title, site_name, rec.row))
+            time.sleep(0.05 if site_name == 'Slow' else 0.0)
+            processor._logger.info('%s row %d', title, rec.row)
+            with lock:
+                events.append(('end', title, site_name, rec.row))
+            return (site_name,)
+        return _reconcile
+
+    applied = []
+    def apply(title):
+        return lambda book, rec, site_name: applied.append((site_name, title, rec.row))
+
+    monkeypatch.setattr(processor, '_PHASES', collections.OrderedDict(
+        (title, (name, reconcile(title), apply(title))) for title, name in (
+            ('Sites', 'sites'), ('Admins', 'admins'), ('Groups', 'groups'))))
+    processor._process_properties(_book(), ['sites', 'admins', 'groups'])
+
+    for site_name in ('Slow', 'Fast'):
+        mine = [event for event in events if event[2] == site_name]
+        for earlier, later in (('Sites', 'Admins'), ('Admins', 'Groups')):
+            last_end = max(i for i, event in enumerate(mine)
+                           if event[0] == 'end' and event[1] == earlier)
+            first_start = min(i for i, event in enumerate(mine)
+                              if event[0] == 'start' and event[1] == later)
+            assert last_end < first_start
+    # The fast property does not wait for the slow one's Site
+    assert applied.index(('Fast', 'Groups', 2)) < applied.index(('Slow', 'Admins', 2))
+    assert [row for site_name, title, row in applied
+            if (site_name, title) == ('Slow', 'Admins')] == [2, 4]
+    assert sorted(applied) == sorted(
+        [('Slow', 'Sites', 2), ('Fast', 'Sites', 3), ('Slow', 'Admins', 2),
+         ('Fast', 'Admins', 3), ('Slow', 'Admins', 4), ('Fast', 'Groups', 2),
+         ('Slow', 'Groups', 3)])
+    # Each row's log output is replayed as its rows are applied
+    assert [message for message in handler.messages if ' row ' in message] == [
+        '%s row %d' % (title, row) for _, title, row in applied]
+
+def test_rows_sharing_a_name_are_serialized(handler, monkeypatch):
+    users = {}
+    posts = []
+    inside = collections.Counter()
+    overlapped = []
+    lock = threading.Lock()
+
+    def _enter(name):
+        with lock:
+            inside[name] += 1
+            if inside[name] > 1:
+                overlapped.append(name)
+
+    def _leave(name):
+        with lock:
+            inside[name] -= 1
+
+    def _find_user(name):
+        _enter(name)
+        time.sleep(0.02)
+        _leave(name)
+        return users.get(name)
+
+    def _add_user(name, data):
+        _enter(name)
+        time.sleep(0.02)
+        posts.append(name)
+        users[name] = {'id': 'u-' + name}
+        _leave(name)
+        return users[name]
+
+    monkeypatch.setattr(processor, '_find_user', _find_user)
+    monkeypatch.setattr(processor, '_add_user', _add_user)
+    monkeypatch.setattr(processor, '_user_data', lambda name, site_id, rec: {})
+    monkeypatch.setattr(processor, '_user_devices', lambda user_id, rec: [])
+    monkeypatch.setattr(processor, '_add_user_devices', lambda name, devices, started: 0)
+    monkeypatch.setattr(processor, '_diff_user', lambda rec, user_obj: None)
+    monkeypatch.setattr(processor, '_user_index', None)
+    monkeypatch.setattr(processor, '_name_locks', processor._NameLocks())
+    results = []
+    monkeypatch.setattr(processor, '_PHASES', collections.OrderedDict([
+        ('Admins', ('admins', processor._reconcile_admin,
+                    lambda book, rec, user_obj, created, diff: results.append(
+                        (rec.row, user_obj['id'], created))))]))
+    book = FakeBook(Admins=[AdminRecord(2, 'First', 'jdoe'), AdminRecord(3, 'Second', 'jdoe'),
+                            AdminRecord(4, 'Third', 'asmith')])
+    processor._process_properties(book, ['admins'])
+
+    assert not overlapped
+    assert sorted(posts) == ['asmith', 'jdoe']
+    assert sorted((row, user_id) for row, user_id, _ in results) == [
+        (2, 'u-jdoe'), (3, 'u-jdoe'), (4, 'u-asmith')]
+    assert sorted(created for row, _, created in results if row in (2, 3)) == [False, True]
@@ -0,0 +1,56 @@
+"""Tests of the header driven worksheet schemas"""
+
+import pytest
+from openpyxl import Workbook
+
+import config
+import journal
+import sheets
+
+def _sheet(title: str, *rows):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = title
+    for row in rows:
+        sheet.append(row)
+    return workbook, sheet
+
+def test_header_maps_fields_to_columns():
+    _, sheet = _sheet('Sites', ['name', None, 'city', 'not a field', 'row', 'name', 'npId'],
+                      ['Main', 'x', 'Toronto', 'y', 'z', 'Other', 's1'],
+                      [None, None, None],
+                      ['Annex'])
+    schema = sheets.SheetSchema(sheet, ('name', 'npId'))
+    assert schema.fields == ('name', 'city', 'npId')
+    assert schema.column('city') == 3 and schema.column('npId') == 7
+    records = list(schema.records(sheet))
+    assert records[0] == schema.record_type(2, 'Main', 'Toronto', 's1')
+    assert records[1].row == 4 and records[1].name == 'Annex' and records[1].npId is None
+    assert len(records) == 2
+
+def test_missing_fields_raise_schema_error():
+    _, sheet = _sheet('Groups', ['targetName', 'npId'])
+    with pytest.raises(sheets.SchemaError) as error:
+        sheets.SheetSchema(sheet, ('targetName', 'site', 'prodId'))
+    assert error.value.result_code == config.ERR_SCHEMA_MISSING_FIELDS_CODE
+    assert 'site, prodId' in str(error.value)
+
+def test_missing_sheet_raises_schema_error():
+    workbook, _ = _sheet('Sites', sheets.REQUIRED_FIELDS['Sites'])
+    with pytest.raises(sheets.SchemaError) as error:
+        sheets.PropertiesWorkbook(workbook)
+    assert error.value.result_code == config.ERR_SCHEMA_MISSING_SHEET_CODE
+    book = sheets.PropertiesWorkbook(workbook, titles=['Sites'])
+    assert 'Sites' in book and 'Admins' not in book
+
+def test_writes_are_journaled_and_replayed(tmp_path):
+    workbook, sheet = _sheet('Sites', sheets.REQUIRED_FIELDS['Sites'], ['Prop'])
+    log = journal.Journal(str(tmp_path / 'wb.journal.jsonl'))
+    book = sheets.PropertiesWorkbook(workbook, log, ['Sites'])
+    book.write('Sites', 2, 'npId', 's1')
+    assert sheet.cell(row=2, column=3).value == 's1' and book.dirty
+    sheet.cell(row=2, column=3).value = None
+    assert book.replay_journal() == 1
+    assert sheet.cell(row=2, column=3).value == 's1'
+    assert book.save(str(tmp_path / 'wb.xlsx'))
+    assert log.entries() == [] and not book.save(str(tmp_path / 'wb.xlsx'))
@@ -0,0 +1,64 @@
+"""Tests of the rate limiter and retry policy"""
+
+import email.utils
+import time
+
+import pytest
+
+import xm_throttle
+
+def test_rate_limiter_disabled():
+    limiter = xm_throttle.RateLimiter(0)
+    assert [limiter.reserve() for _ in range(100)] == [0.0] * 100
+    limiter.throttled()
+    assert limiter.rate == 0
+
+def test_rate_limiter_spaces_requests_after_burst():
+    limiter = xm_throttle.RateLimiter(10)
+    assert limiter.reserve() == 0.0
+    waits = [limiter.reserve() for _ in range(3)]
+    assert waits == sorted(waits)
+    assert waits[0] == pytest.approx(0.1, abs=0.01)
+    assert waits[-1] == pytest.approx(0.3, abs=0.01)
+
+def test_rate_limiter_backs_off_and_recovers():
+    limiter = xm_throttle.RateLimiter(32)
+    limiter.throttled()
+    assert limiter.rate == 16
+    for _ in range(10):
+        limiter.throttled()
+    assert limiter.rate == 1
+    for _ in range(100):
+        limiter.succeeded()
+    assert limiter.rate == 32
+
+def test_retry_gives_up_after_retries():
+    policy = xm_throttle.RetryPolicy(2)
+    assert policy.delay('GET', 1, 503) is not None
+    assert policy.delay('GET', 2, None) is not None
+    assert policy.delay('GET', 3, 503) is None
+
+@pytest.mark.parametrize('method,status,retried', [
+    ('GET', 429, True), ('GET', 500, True), ('GET', None, True),
+    ('GET', 404, False), ('GET', 400, False),
+    ('POST', 429, True), ('POST', 503, False), ('POST', None, False)])
+def test_retry_only_safe_failures(method, status, retried):
+    assert (xm_throttle.RetryPolicy(3).delay(method, 1, status) is not None) == retried
+
+def test_retry_backoff_is_capped_and_jittered():
+    policy = xm_throttle.RetryPolicy(20, base=0.5, cap=4.0)
+    for attempt, ceiling in ((1, 0.5), (2, 1.0), (3, 2.0), (10, 4.0)):
+        for _ in range(20):
+            assert 0 <= policy.delay('GET', attempt, 503) <= ceiling
+
+def test_retry_honours_retry_after():
+    policy = xm_throttle.RetryPolicy(3, base=0.1)
+    assert policy.delay('GET', 1, 429, '7') >= 7
+    http_date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < policy.delay('POST', 1, 429, http_date) <= 61
+
+@pytest.mark.parametrize('value,seconds', [
+    (None, 0.0), ('', 0.0), ('3', 3.0), ('-2', 0.0), ('soon', 0.0),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0)])
+def test_parse_retry_after(value, seconds):
+    assert xm_throttle._parse_retry_after(value) == seconds
@@ -0,0 +1,61 @@
+"""Tests of processor's Site keyed index over the Sites and Admins worksheets"""
+
+import pytest
+from openpyxl import Workbook
+
+import config
+import processor
+import sheets
+
+def _sheet(workbook, title: str, rows: list):
+    fields = sheets.REQUIRED_FIELDS[title]
+    sheet = workbook.create_sheet(title)
+    sheet.append(fields)
+    for row in rows:
+        sheet.append([row.get(field) for field in fields])
+
+def _book(sites: list, admins: list = None):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    _sheet(workbook, 'Sites', [dict(zip(('name', 'prodId', 'npId'), row)) for row in sites])
+    titles = ['Sites']
+    if admins is not None:
+        _sheet(workbook, 'Admins', [dict(zip(('targetName', 'site', 'prodId', 'npId'), row))
+                                    for row in admins])
+        titles.append('Admins')
+    return sheets.PropertiesWorkbook(workbook, titles=titles)
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    monkeypatch.setattr(config, 'non_prod', True)
+
+def test_site_ids_of_the_environment():
+    index = processor._WorkbookIndex(_book([['Main', 'p1', 'n1'], ['Annex', 'p2', None]]))
+    assert index.site_id('Main') == 'n1'
+    assert index.site_id('Annex') is None
+    assert index.site_id('Elsewhere') is None
+
+def test_first_row_of_a_site_wins():
+    index = processor._WorkbookIndex(_book([['Main', None, 'n1'], ['Main', None, 'n2']]))
+    assert index.site_id('Main') == 'n1'
+    index.set_site_id(3, 'Main', 'n3')
+    assert index.site_id('Main') == 'n1'
+    index.set_site_id(2, 'Main', 'n4')
+    assert index.site_id('Main') == 'n4'
+
+def test_supervisors_follow_written_ids(monkeypatch):
+    monkeypatch.setattr(config, 'non_prod', False)
+    index = processor._WorkbookIndex(_book(
+        [['Main', 'p1', None]],
+        [['jdoe', 'Main', 'u1', None], ['asmith', 'Annex', 'u2', None],
+         ['bcho', 'Main', None, None]]))
+    assert index.site_id('Main') == 'p1'
+    assert index.supervisors('Main') == ['u1', None]
+    index.set_admin_id(4, 'Main', 'u3')
+    index.set_admin_id(9, 'Main', 'u9')
+    assert index.supervisors('Main') == ['u1', 'u3']
+    assert index.supervisors('Elsewhere') == []
+
+def test_without_admins():
+    index = processor._WorkbookIndex(_book([['Main', None, 'n1']]))
+    assert index.supervisors('Main') == []
@@ -0,0 +1,296 @@
+"""asyncio based xMatters REST client
+
+    Mirrors the request helpers of processor.py (get_site, add_site,
+    get_user, add_user, add_device, get_group, add_group, add_member) as
+    coroutines over a single aiohttp session, so that many requests can be
+    in flight from one thread.  Like the helpers it mirrors, every method
+    logs failures and returns the decoded object, or None.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import asyncio
+import json
+import time
+import urllib.parse
+
+import aiohttp
+
+import config
+import np_logger
+import xm_cache
+import xm_client
+import xm_metrics
+import xm_throttle
+
+class AsyncResponse(object):
+    """Status and body of a completed aiohttp request
+
+    Attributes:
+        url (str): The requested URL
+        status_code (int): The HTTP status
+        content (bytes): The response body
+    """
+
+    def __init__(self, url: str, status_code: int, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        """Returns the decoded JSON body, or an empty dict if there is none"""
+        return json.loads(self.content) if self.content else {}
+
+class AsyncXmClient(object):
+    """Keep-alive asyncio client for a single xMatters instance
+
+    The aiohttp connector holds at most limit connections, which also
+    bounds the number of requests in flight.  Requests are rate limited and
+    retried exactly as by xm_client.XmClient.  Must be created, used and
+    closed inside the same running event loop.
+
+    Attributes:
+        base_url (str): Base URL of the xMatters instance
+        cache (ResponseCache): Optional persistent cache of GET responses
+        limiter (RateLimiter): Requests per second shared by all callers
+        retry (RetryPolicy): Which failed requests are retried, and when
+    """
+
+    def __init__(self, base_url: str, basic_auth, limit: int,
+                 cache: xm_cache.ResponseCache = None,
+                 limiter: xm_throttle.RateLimiter = None,
+                 retry: xm_throttle.RetryPolicy = None,
+                 max_in_flight: int = None,
+                 timeout: tuple = None):
+        self.base_url = base_url
+        self.cache = cache
+        self.limiter = limiter or xm_throttle.RateLimiter(0)
+        self.retry = retry or xm_throttle.RetryPolicy(0)
+        self._in_flight = asyncio.Semaphore(max_in_flight or limit)
+        self._logger = np_logger.get_logger()
+        connect_timeout, read_timeout = timeout or xm_client.get_timeout()
+        self._session = aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(basic_auth.username, basic_auth.password),
+            headers={'Content-Type': 'application/json'},
+            connector=aiohttp.TCPConnector(limit=limit),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout,
+                                          sock_read=read_timeout))
+
+    async def _send(self, method: str, url: str, data: str = None):
+        """Issue a request, waiting for the rate limiter and retrying
+
+        Only the attempts are timed; the waits for the rate limiter, for a
+        free request slot and between retries are recorded separately.
+
+        Raises:
+            ClientError: If the last attempt could not be completed
+        """
+        bytes_sent = len(data) if data else 0
+        elapsed = waited = 0.0
+        attempt = 0
+        while True:
+            attempt += 1
+            waiting = time.monotonic()
+            await asyncio.sleep(self.limiter.reserve())
+            try:
+                async with self._in_flight:
+                    sending = time.monotonic()
+                    waited += sending - waiting
+                    async with self._session.request(method, url, data=data) as resp:
+                        response = AsyncResponse(url, resp.status, await resp.read())
+                        retry_after = resp.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                elapsed += time.monotonic() - sending
+                delay = self.retry.delay(method, attempt)
+                if delay is None:
+                    xm_metrics.get_metrics().record(
+                        method, url, 'error', elapsed, bytes_sent, 0, attempt - 1, waited)
+                    raise
+                reason = repr(e)
+            else:
+                elapsed += time.monotonic() - sending
+                if response.status_code == 429:
+                    self.limiter.throttled()
+                elif response.status_code < 400:
+                    self.limiter.succeeded()
+                delay = self.retry.delay(method, attempt, response.status_code,
+                                         retry_after)
+                if delay is None:
+                    xm_metrics.get_metrics().record(
+                        method, url, response.status_code, elapsed,
+                        bytes_sent, len(response.content), attempt - 1, waited)
+                    return response
+                reason = 'status %d' % response.status_code
+            self._logger.warning(
+                'Retrying %s %s in %.2fs after %s (attempt %d of %d).',
+                method, url, delay, reason, attempt, self.retry.retries + 1)
+            await asyncio.sleep(delay)
+            waited += delay
+
+    async def get(self, url: str, cache: bool = True):
+        """Issue a GET request, served from the cache when possible
+
+        Raises:
+            ClientError: If the request can not be completed
+        """
+        if cache and self.cache is not None:
+            content = self.cache.get(url)
+            if content is not None:
+                xm_metrics.get_metrics().record('GET', url, 'cache', 0.0, 0, len(content))
+                return xm_cache.CachedResponse(url, content)
+        response = await self._send('GET', url)
+        if cache and self.cache is not None and response.status_code == 200:
+            self.cache.put(url, response.content)
+        return response
+
+    async def post(self, url: str, data: dict):
+        """Issue a POST request with a JSON body
+
+        Any cached entries of the posted collection are invalidated, even
+        if the request fails, since it may still have been applied.
+
+        Raises:
+            ClientError: If the request can not be completed
+        """
+        try:
+            return await self._send('POST', url, json.dumps(data))
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(url)
+
+    async def close(self):
+        """Release all connections; the cache is shared, see xm_client.get_cache"""
+        await self._session.close()
+
+    def _log_error(self, url: str, response):
+        """Logs a failed request the same way processor does"""
+        body = response.json()
+        if response.status_code == 404:
+            self._logger.warning(config.ERR_INITIAL_REQUEST_FAILED_MSG,
+                                 response.status_code, url)
+            return
+        self._logger.error(config.ERR_INITIAL_REQUEST_FAILED_MSG,
+                           response.status_code, url)
+        self._logger.error('Response - code: %s, reason: %s, message: %s',
+                           str(body.get('code', 'none')),
+                           str(body.get('reason', 'none')),
+                           str(body.get('message', 'none')))
+
+    async def _request(self, method: str, url: str, expected: int, data: dict = None):
+        """Issues one request and returns the decoded body, or None"""
+        try:
+            if method == 'POST':
+                response = await self.post(url, data)
+            else:
+                response = await self.get(url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._logger.error(config.ERR_REQUEST_EXCEPTION_MSG, url, repr(e))
+            return None
+        if response.status_code != expected:
+            self._log_error(url, response)
+            return None
+        return response.json()
+
+    def _url(self, path: str) -> str:
+        return self.base_url + '/api/xm/1/' + path
+
+    async def get_site(self, site_name: str):
+        """Returns the named Site, or None"""
+        return await self._request(
+            'GET', self._url('sites/' + urllib.parse.quote(site_name)), 200)
+
+    async def add_site(self, data: dict):
+        """Creates a Site and returns it, or None"""
+        return await self._request('POST', self._url('sites'), 201, data)
+
+    async def get_user(self, target_name: str):
+        """Returns the named User, with roles and supervisors, or None"""
+        return await self._request(
+            'GET', self._url('people/' + urllib.parse.quote(target_name) +
+                             '?embed=roles,supervisors'), 200)
+
+    async def add_user(self, data: dict):
+        """Creates a User and returns it, or None"""
+        return await self._request('POST', self._url('people'), 201, data)
+
+    async def add_device(self, data: dict):
+        """Creates a Device and returns it, or None"""
+        return await self._request('POST', self._url('devices'), 201, data)
+
+    async def get_group(self, target_name: str):
+        """Returns the named Group, with supervisors, or None"""
+        return await self._request(
+            'GET', self._url('groups/' + urllib.parse.quote(target_name) +
+                             '?embed=supervisors'), 200)
+
+    async def add_group(self, data: dict):
+        """Creates a Group and returns it, or None"""
+        return await self._request('POST', self._url('groups'), 201, data)
+
+    async def add_member(self, target_name: str, data: dict):
+        """Adds a member to a Group's Default Shift and returns it, or None"""
+        return await self._request(
+            'POST', self._url('groups/' + urllib.parse.quote(target_name) +
+                              '/shifts/Default%20Shift/members'), 200, data)
+
+    async def get_all(self, url: str, limit: int = None):
+        """Returns every object of a paged collection, or None
+
+        Pages are followed the same way as by xm_client.XmClient.pages.
+        None is returned, and the failure logged, if any page can not be
+        read.
+        """
+        limit = limit or config.PAGE_SIZE
+        sep = '&' if '?' in url else '?'
+        page_url = '%s%soffset=0&limit=%d' % (url, sep, limit)
+        objects = []
+        while page_url:
+            page = await self._request('GET', page_url, 200)
+            if page is None:
+                return None
+            objects.extend(page['data'])
+            links = page.get('links') or {}
+            if page['count'] == 0:
+                page_url = None
+            elif 'next' in links:
+                page_url = urllib.parse.urljoin(self.base_url, links['next'])
+            elif len(objects) < page.get('total', 0):
+                page_url = '%s%soffset=%d&limit=%d' % (url, sep, len(objects), limit)
+            else:
+                page_url = None
+        return objects
+
+    async def get_group_members(self, group_id: str):
+        """Returns the IDs of a Group's members as a frozenset, empty on error"""
+        members = await self._request(
+            'GET', self._url('groups/' + group_id + '/members'), 200)
+        if members is None:
+            return frozenset()
+        return frozenset(member['member']['id'] for member in members['data'])
+
+def get_async_client() -> AsyncXmClient:
+    """Creates a client for the running event loop from the config module
+
+    Sized, rate limited, retried and timed out like xm_client.get_client(),
+    and sharing its cache, but not shared itself, since an aiohttp session
+    is bound to the loop it was created in.
+
+    Returns:
+        AsyncXmClient: A new client, to be closed by the caller
+    """
+    limit = max(config.pool_size or config.DEFAULT_POOL_SIZE,
+                config.workers or 1)
+    return AsyncXmClient(config.xmod_url, config.basic_auth, limit,
+                         xm_client.get_cache(),
+                         xm_client.get_rate_limiter(),
+                         xm_client.get_retry_policy(), config.max_in_flight,
+                         xm_client.get_timeout())
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Persistent cache of xMatters GET responses
+
+    Responses are stored in a sqlite file, keyed by instance URL, the user
+    who read them and resource path, so that re-running the utility
+    against the same workbook does not fetch unchanged objects again, and
+    a user is never served what only another user may see.  Entries expire after
+    a configurable time-to-live, and every POST to a resource collection
+    invalidates the cached entries of that collection.  The file also maps
+    object names to their IDs, which never change, so those entries are
+    not invalidated by POSTs.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+# Collections whose cached entries are also stale after a POST to the key
+_DEPENDENT_COLLECTIONS = {
+    'devices': ('devices', 'people'),
+}
+
+class CachedResponse(object):
+    """Minimal stand-in for a requests Response served from the cache
+
+    Attributes:
+        url (str): The requested URL
+        content (bytes): The cached response body
+        status_code (int): Always 200, only successful responses are cached
+    """
+    status_code = 200
+
+    def __init__(self, url: str, content: bytes):
+        self.url = url
+        self.content = content
+
+    def json(self):
+        """Returns the decoded JSON body"""
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        """Cached responses are always successful"""
+        pass
+
+def _split(url: str):
+    """Splits url into its instance and its path below /api/xm/1/
+
+    Returns:
+        tuple: (instance, path, collection)
+    """
+    parts = urllib.parse.urlsplit(url)
+    instance = parts.scheme + '://' + parts.netloc
+    path = parts.path.split('/api/xm/1/', 1)[-1]
+    if parts.query:
+        path += '?' + parts.query
+    collection = path.split('/', 1)[0].split('?', 1)[0]
+    return instance, path, collection
+
+class ResponseCache(object):
+    """sqlite backed store of successful GET response bodies
+
+    Entries are stored under the instance URL with the user added, as in
+    'https://user@company.xmatters.com', so users sharing the file never
+    see each other's entries.
+
+    Attributes:
+        filename (str): Location of the sqlite file
+        ttl (int): Seconds an entry stays valid
+        user (str): The user the requests are authenticated as
+    """
+
+    def __init__(self, filename: str, ttl: int, refresh: bool = False,
+                 user: str = None):
+        self.filename = filename
+        self.ttl = ttl
+        self.user = user
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' instance TEXT NOT NULL,'
+            ' path TEXT NOT NULL,'
+            ' collection TEXT NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' body BLOB NOT NULL,'
+            ' PRIMARY KEY (instance, path))')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS ids ('
+            ' instance TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' name TEXT NOT NULL,'
+            ' id TEXT NOT NULL,'
+            ' stored_at REAL NOT NULL,'
+            ' PRIMARY KEY (instance, kind, name))')
+        with self._lock, self._db:
+            for table in ('responses', 'ids'):
+                self._db.execute('DELETE FROM %s WHERE stored_at < ?' % table,
+                                 (time.time() - ttl,))
+                if refresh:
+                    self._db.execute('DELETE FROM %s' % table)
+
+    def _key(self, url: str):
+        """Returns the (instance, path, collection) url is stored under"""
+        instance, path, collection = _split(url)
+        return self._owned(instance), path, collection
+
+    def _owned(self, instance: str) -> str:
+        """Adds the user to the instance URL"""
+        if not self.user:
+            return instance
+        scheme, netloc = instance.split('://', 1)
+        return '%s://%s@%s' % (scheme, urllib.parse.quote(self.user, safe=''), netloc)
+
+    def get(self, url: str):
+        """Returns the cached body for url, or None if missing or expired"""
+        instance, path, _ = self._key(url)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT body FROM responses WHERE instance = ? AND path = ?'
+                ' AND stored_at >= ?',
+                (instance, path, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def put(self, url: str, body: bytes):
+        """Stores the body of a successful GET of url"""
+        instance, path, collection = self._key(url)
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (instance, path, collection, time.time(), body))
+
+    def invalidate(self, url: str):
+        """Drops every cached entry of the collection url belongs to"""
+        instance, _, collection = self._key(url)
+        collections = _DEPENDENT_COLLECTIONS.get(collection, (collection,))
+        with self._lock, self._db:
+            self._db.executemany(
+                'DELETE FROM responses WHERE instance = ? AND collection = ?',
+                [(instance, name) for name in collections])
+
+    def get_id(self, instance: str, kind: str, name: str):
+        """Returns the cached ID of the named object, or None"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT id FROM ids WHERE instance = ? AND kind = ? AND name = ?'
+                ' AND stored_at >= ?',
+                (self._owned(instance), kind, name, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def put_id(self, instance: str, kind: str, name: str, object_id: str):
+        """Stores the ID of the named object"""
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO ids VALUES (?, ?, ?, ?, ?)',
+                (self._owned(instance), kind, name, object_id, time.time()))
+
+    def close(self):
+        """Closes the underlying sqlite file"""
+        with self._lock:
+            self._db.close()
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""Creates and manages a shared, pooled xMatters REST client.
+
+    Attributes:
+        __client (XmClient): Holds the instance of the shared client
+        __rate_limiter (RateLimiter): Holds the shared rate limiter
+        __cache (ResponseCache): Holds the shared response cache
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import json
+import queue
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import np_logger
+import xm_cache
+import xm_metrics
+import xm_throttle
+
+__client = None
+__rate_limiter = None
+__cache = None
+
+class XmClient(object):
+    """Keep-alive HTTP client for a single xMatters instance
+
+    Wraps a requests Session whose connection pool is sized so that every
+    concurrent caller can reuse an already established TCP+TLS connection
+    instead of performing a new handshake per request.  Every request
+    passes through the rate limiter and, when throttled or failing
+    transiently, is retried according to the retry policy.
+
+    Attributes:
+        base_url (str): Base URL of the xMatters instance
+        session (Session): The pooled requests session
+        cache (ResponseCache): Optional persistent cache of GET responses
+        limiter (RateLimiter): Requests per second shared by all callers
+        retry (RetryPolicy): Which failed requests are retried, and when
+        timeout (tuple): Seconds to wait to connect, and for each read
+    """
+
+    def __init__(self, base_url: str, basic_auth, pool_size: int,
+                 cache: xm_cache.ResponseCache = None,
+                 limiter: xm_throttle.RateLimiter = None,
+                 retry: xm_throttle.RetryPolicy = None,
+                 max_in_flight: int = None,
+                 timeout: tuple = None):
+        self.base_url = base_url
+        self.cache = cache
+        self.timeout = timeout or get_timeout()
+        self.limiter = limiter or xm_throttle.RateLimiter(0)
+        self.retry = retry or xm_throttle.RetryPolicy(0)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight or pool_size)
+        self.session = requests.Session()
+        self.session.auth = basic_auth
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=pool_size,
+                              pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _send(self, method: str, url: str, **kwargs):
+        """Issue a request, waiting for the rate limiter and retrying
+
+        The request, with all of its attempts, is recorded in the metrics.
+        Only the attempts themselves are timed; the time spent waiting for
+        the rate limiter, for a free request slot and between retries is
+        recorded separately.
+
+        Returns:
+            Response: The final requests Response object
+
+        Raises:
+            RequestException: If the last attempt could not be completed
+        """
+        data = kwargs.get('data')
+        bytes_sent = len(data) if data else 0
+        elapsed = waited = 0.0
+        attempt = 0
+        while True:
+            attempt += 1
+            waiting = time.monotonic()
+            time.sleep(self.limiter.reserve())
+            try:
+                with self._in_flight:
+                    sending = time.monotonic()
+                    waited += sending - waiting
+                    response = self.session.request(method, url, timeout=self.timeout,
+                                                    **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                elapsed += time.monotonic() - sending
+                delay = self.retry.delay(method, attempt)
+                if delay is None:
+                    xm_metrics.get_metrics().record(
+                        method, url, 'error', elapsed, bytes_sent, 0, attempt - 1, waited)
+                    raise
+                reason = repr(e)
+            else:
+                elapsed += time.monotonic() - sending
+                if response.status_code == 429:
+                    self.limiter.throttled()
+                elif response.status_code < 400:
+                    self.limiter.succeeded()
+                delay = self.retry.delay(method, attempt, response.status_code,
+                                         response.headers.get('Retry-After'))
+                if delay is None:
+                    xm_metrics.get_metrics().record(
+                        method, url, response.status_code, elapsed,
+                        bytes_sent, len(response.content), attempt - 1, waited)
+                    return response
+                reason = 'status %d' % response.status_code
+            np_logger.get_logger().warning(
+                'Retrying %s %s in %.2fs after %s (attempt %d of %d).',
+                method, url, delay, reason, attempt, self.retry.retries + 1)
+            time.sleep(delay)
+            waited += delay
+
+    def get(self, url: str, cache: bool = True):
+        """Issue a GET request over the pooled session
+
+        Successful responses are served from, and stored in, the cache
+        when one is configured.
+
+        Args:
+            url (str): Fully qualified resource URL
+            cache (bool): False for volatile resources that must not be cached
+
+        Returns:
+            Response: The requests Response object, or a CachedResponse
+        """
+        if not cache:
+            return self._send('GET', url)
+        if self.cache is not None:
+            content = self.cache.get(url)
+            if content is not None:
+                xm_metrics.get_metrics().record('GET', url, 'cache', 0.0, 0, len(content))
+                return xm_cache.CachedResponse(url, content)
+        response = self._send('GET', url)
+        if self.cache is not None and response.status_code == 200:
+            self.cache.put(url, response.content)
+        return response
+
+    def post(self, url: str, data: dict):
+        """Issue a POST request with a JSON body over the pooled session
+
+        Any cached entries of the posted collection are invalidated, even
+        if the request fails, since it may still have been applied.
+
+        Args:
+            url (str): Fully qualified resource URL
+            data (dict): Object to serialize as the JSON request body
+
+        Returns:
+            Response: The requests Response object
+        """
+        try:
+            return self._send('POST', url, data=json.dumps(data))
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(url)
+
+    def pages(self, url: str, limit: int = None, cache: bool = True):
+        """Yields every page of a paged xMatters collection
+
+        Follows each page's links.next, or, if the server does not provide
+        one, steps the offset until the reported total has been read.
+
+        Args:
+            url (str): Fully qualified collection URL, optionally with a query
+            limit (int): Objects per page [default: config.PAGE_SIZE]
+            cache (bool): False to bypass the response cache
+
+        Yields:
+            dict: Each page, with its 'data', 'count' and 'total'
+
+        Raises:
+            RequestException: If a page can not be retrieved
+        """
+        limit = limit or config.PAGE_SIZE
+        sep = '&' if '?' in url else '?'
+        page_url = '%s%soffset=0&limit=%d' % (url, sep, limit)
+        offset = 0
+        while page_url:
+            response = self.get(page_url, cache=cache)
+            response.raise_for_status()
+            page = response.json()
+            yield page
+            offset += page['count']
+            links = page.get('links') or {}
+            if page['count'] == 0:
+                page_url = None
+            elif 'next' in links:
+                page_url = urllib.parse.urljoin(self.base_url, links['next'])
+            elif offset < page.get('total', 0):
+                page_url = '%s%soffset=%d&limit=%d' % (url, sep, offset, limit)
+            else:
+                page_url = None
+
+    def paginate(self, url: str, limit: int = None, cache: bool = True,
+                 read_ahead: bool = False):
+        """Yields every object of a paged xMatters collection
+
+        A listing costs one request per page rather than one per object.
+        With read_ahead, the following pages are retrieved on a background
+        thread while the caller is still working on the objects of the
+        current one.
+
+        Args:
+            url (str): Fully qualified collection URL, optionally with a query
+            limit (int): Objects per page [default: config.PAGE_SIZE]
+            cache (bool): False to bypass the response cache
+            read_ahead (bool): Retrieve later pages in the background
+
+        Yields:
+            dict: Each object of the collection in server order
+
+        Raises:
+            RequestException: If a page can not be retrieved
+        """
+        pages = self.pages(url, limit, cache)
+        if read_ahead:
+            pages = _read_ahead(pages)
+        for page in pages:
+            for obj in page['data']:
+                yield obj
+
+    def close(self):
+        """Release all pooled connections; the cache is shared, see get_cache"""
+        self.session.close()
+
+def _read_ahead(iterable, depth: int = 2):
+    """Yields the items of iterable while a background thread produces more
+
+    Up to depth items are produced ahead of the consumer.  An exception
+    raised by the producer is re-raised to the consumer in its place.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def _produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put((done, None))
+        except Exception as exc: # pylint: disable=broad-except
+            items.put((done, exc))
+
+    producer = threading.Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, exc = items.get()
+            if item is done:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stop.set()
+
+def get_rate_limiter() -> xm_throttle.RateLimiter:
+    """Returns the rate limiter shared by every client of the instance"""
+    global __rate_limiter # pylint: disable=global-statement
+    if __rate_limiter is None:
+        __rate_limiter = xm_throttle.RateLimiter(
+            config.DEFAULT_RATE_LIMIT if config.rate_limit is None else config.rate_limit)
+    return __rate_limiter
+
+def get_retry_policy() -> xm_throttle.RetryPolicy:
+    """Returns the retry policy from the config module"""
+    return xm_throttle.RetryPolicy(
+        config.DEFAULT_RETRIES if config.retries is None else config.retries)
+
+def get_timeout() -> tuple:
+    """Returns the (connect, read) timeouts in seconds from the config module"""
+    return (config.connect_timeout or config.DEFAULT_CONNECT_TIMEOUT,
+            config.read_timeout or config.DEFAULT_READ_TIMEOUT)
+
+def get_cache() -> xm_cache.ResponseCache:
+    """Returns the response cache shared by every client, or None if disabled
+
+    Opened, and emptied if config.refresh_cache is set, on first use only,
+    so the sync and async clients of a run share one cache and it is
+    refreshed once.  Entries are kept per authenticated user.
+    """
+    global __cache # pylint: disable=global-statement
+    if __cache is None and config.use_cache:
+        __cache = xm_cache.ResponseCache(
+            config.out_directory + config.dir_sep + config.CACHE_FILENAME,
+            config.DEFAULT_CACHE_TTL if config.cache_ttl is None else config.cache_ttl,
+            config.refresh_cache, config.basic_auth.username)
+    return __cache
+
+def get_client() -> XmClient:
+    """Returns the existing client or creates a new one if the first time
+
+    Uses the xmod_url, basic_auth, pool_size, rate limit, retry and timeout
+    values from the config module.  The pool is never smaller than the
+    number of workers, so that no worker has to wait for a connection.
+    Unless disabled, GET responses are cached in a file in out_directory.
+    The client is a singleton shared across modules so that all requests
+    reuse the same pool.
+
+    Returns:
+        XmClient: __client
+    """
+    global __client # pylint: disable=global-statement
+    if __client is None:
+        pool_size = max(config.pool_size or config.DEFAULT_POOL_SIZE,
+                        config.workers or 1)
+        __client = XmClient(config.xmod_url, config.basic_auth, pool_size,
+                            get_cache(), get_rate_limiter(), get_retry_policy(),
+                            config.max_in_flight, get_timeout())
+    return __client
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""Request and phase metrics of a run
+
+    Every xMatters request made through xm_client or xm_async is recorded
+    by method, endpoint and status: how many were made, how long their
+    attempts took, how long they waited before and between the attempts,
+    how many bytes went each way and how many retries they needed.  Endpoints are reduced to their path templates,
+    e.g. 'people/{id}/devices', so that requests for different objects add
+    up.  The phases of a run, such as loading and saving the workbook, are
+    timed as well.  At the end of a run the metrics are summarized as a
+    table and optionally written out as JSON or in the Prometheus text
+    format, e.g. for node exporter's textfile collector.
+
+    Attributes:
+        __metrics (Metrics): Holds the instance of the shared metrics
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import collections
+import json
+import math
+import os
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+import config
+
+__metrics = None
+
+# Path segments that name a collection or a sub-resource rather than an object
+_RESOURCES = frozenset(('sites', 'people', 'devices', 'groups', 'members',
+                        'shifts', 'on-call', 'supervisors'))
+_API_PATH = '/api/xm/1/'
+_QUANTILES = (50, 95, 99)
+
+def endpoint(url: str) -> str:
+    """Returns the path template of an xMatters URL
+
+    Object names and IDs are replaced by {id}, and the query is dropped,
+    e.g. .../api/xm/1/groups/Front%20Desk/members?offset=0 becomes
+    'groups/{id}/members'.
+    """
+    path = urllib.parse.urlsplit(url).path
+    if _API_PATH in path:
+        path = path.split(_API_PATH, 1)[1]
+    return '/'.join(part if part in _RESOURCES else '{id}'
+                    for part in path.strip('/').split('/'))
+
+def _percentile(ordered: list, percent: int) -> float:
+    """Returns the nearest-rank percentile of an ordered list of values"""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, int(math.ceil(percent / 100.0 * len(ordered))) - 1)]
+
+class _Series(object):
+    """Totals of the requests of one method, endpoint and status"""
+
+    def __init__(self):
+        self.latencies = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retries = 0
+        self.waited = 0.0
+
+class Metrics(object):
+    """Thread safe request counters and phase timers of one run
+
+    Attributes:
+        started (float): time.time() when the run started
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._started = time.monotonic()
+        self._series = collections.OrderedDict()
+        self._phases = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, method: str, url: str, status, seconds: float,
+               bytes_sent: int = 0, bytes_received: int = 0, retries: int = 0,
+               waited: float = 0.0):
+        """Records one completed request
+
+        Args:
+            method (str): The HTTP method
+            url (str): The requested URL
+            status: The final HTTP status, 'error' if the request could not
+                be completed, or 'cache' if it was served from the cache
+            seconds (float): Time taken by the attempts, including any retries
+            bytes_sent (int): Size of the request body
+            bytes_received (int): Size of the response body
+            retries (int): Attempts after the first one
+            waited (float): Time spent waiting for the rate limiter, for a
+                free request slot and between retries
+        """
+        key = (method, endpoint(url), str(status))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series()
+            series.latencies.append(seconds)
+            series.bytes_sent += bytes_sent
+            series.bytes_received += bytes_received
+            series.retries += retries
+            series.waited += waited
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times the enclosed block, adding to any earlier time of the phase"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.monotonic() - started)
+
+    def add_phase(self, name: str, seconds: float):
+        """Adds seconds to the time of the phase, for phases not timed as a block"""
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    def snapshot(self) -> dict:
+        """Returns the metrics so far as a JSON serializable dict"""
+        with self._lock:
+            series = [(key, sorted(value.latencies), value)
+                      for key, value in self._series.items()]
+            phases = collections.OrderedDict(
+                (name, round(seconds, 6)) for name, seconds in self._phases.items())
+        requests = []
+        for (method, path, status), latencies, value in sorted(series, key=lambda s: s[0]):
+            request = collections.OrderedDict([
+                ('method', method), ('endpoint', path), ('status', status),
+                ('count', len(latencies)),
+                ('totalSeconds', round(sum(latencies), 6))])
+            for quantile in _QUANTILES:
+                request['p%d' % quantile] = round(_percentile(latencies, quantile), 6)
+            request['bytesSent'] = value.bytes_sent
+            request['bytesReceived'] = value.bytes_received
+            request['retries'] = value.retries
+            request['waitSeconds'] = round(value.waited, 6)
+            requests.append(request)
+        return collections.OrderedDict([
+            ('command', config.command_name),
+            ('instance', config.xmod_url),
+            ('started', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started))),
+            ('durationSeconds', round(time.monotonic() - self._started, 6)),
+            ('phases', phases),
+            ('requests', requests),
+        ])
+
+def summary(snapshot: dict) -> list:
+    """Returns the lines of a table of a snapshot's requests and phases"""
+    lines = ['%-4s %-32s %-6s %7s %9s %9s %9s %11s %11s %7s' % (
+        'METH', 'ENDPOINT', 'STATUS', 'COUNT', 'P50_MS', 'P95_MS', 'P99_MS',
+        'BYTES_OUT', 'BYTES_IN', 'RETRIES')]
+    totals = collections.Counter()
+    for request in snapshot['requests']:
+        lines.append('%-4s %-32s %-6s %7d %9.1f %9.1f %9.1f %11d %11d %7d' % (
+            request['method'], request['endpoint'], request['status'], request['count'],
+            request['p50'] * 1000, request['p95'] * 1000, request['p99'] * 1000,
+            request['bytesSent'], request['bytesReceived'], request['retries']))
+        for field in ('count', 'totalSeconds', 'bytesSent', 'bytesReceived', 'retries',
+                      'waitSeconds'):
+            totals[field] += request[field]
+    lines.append('Requests: %d, %.2fs in total, %d byte(s) out, %d byte(s) in, %d retries, '
+                 '%.2fs waiting' % (
+                     totals['count'], totals['totalSeconds'], totals['bytesSent'],
+                     totals['bytesReceived'], totals['retries'], totals['waitSeconds']))
+    phases = ['%s %.2fs' % (name, seconds) for name, seconds in snapshot['phases'].items()]
+    lines.append('Run: %.2fs%s' % (snapshot['durationSeconds'],
+                                    ' (' + ', '.join(phases) + ')' if phases else ''))
+    return lines
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus(snapshot: dict) -> str:
+    """Returns a snapshot in the Prometheus text exposition format"""
+    command = 'command="%s"' % _label(snapshot['command'])
+    families = collections.OrderedDict([
+        ('new_property_requests_total',
+         ('counter', 'xMatters requests made', [])),
+        ('new_property_request_duration_seconds',
+         ('summary', 'Time taken by the attempts of xMatters requests', [])),
+        ('new_property_request_wait_seconds_total',
+         ('counter', 'Time xMatters requests waited for the rate limiter, '
+                     'a free request slot or a retry', [])),
+        ('new_property_request_bytes_total',
+         ('counter', 'Request and response body bytes', [])),
+        ('new_property_request_retries_total',
+         ('counter', 'Retries of xMatters requests', [])),
+        ('new_property_phase_duration_seconds',
+         ('gauge', 'Time taken by each phase of the last run', [])),
+        ('new_property_run_duration_seconds',
+         ('gauge', 'Time taken by the last run', [])),
+        ('new_property_run_timestamp_seconds',
+         ('gauge', 'When the last run started', [])),
+    ])
+    for request in snapshot['requests']:
+        labels = '%s,method="%s",endpoint="%s",status="%s"' % (
+            command, request['method'], _label(request['endpoint']), request['status'])
+        families['new_property_requests_total'][2].append(
+            ('{%s}' % labels, request['count']))
+        samples = families['new_property_request_duration_seconds'][2]
+        for quantile in _QUANTILES:
+            samples.append(('{%s,quantile="%s"}' % (labels, quantile / 100.0),
+                            request['p%d' % quantile]))
+        samples.append(('_sum{%s}' % labels, request['totalSeconds']))
+        samples.append(('_count{%s}' % labels, request['count']))
+        for direction, field in (('sent', 'bytesSent'), ('received', 'bytesReceived')):
+            families['new_property_request_bytes_total'][2].append(
+                ('{%s,direction="%s"}' % (labels, direction), request[field]))
+        families['new_property_request_retries_total'][2].append(
+            ('{%s}' % labels, request['retries']))
+        families['new_property_request_wait_seconds_total'][2].append(
+            ('{%s}' % labels, request['waitSeconds']))
+    for name, seconds in snapshot['phases'].items():
+        families['new_property_phase_duration_seconds'][2].append(
+            ('{%s,phase="%s"}' % (command, _label(name)), seconds))
+    families['new_property_run_duration_seconds'][2].append(
+        ('{%s}' % command, snapshot['durationSeconds']))
+    families['new_property_run_timestamp_seconds'][2].append(
+        ('{%s}' % command, int(get_metrics().started)))
+
+    lines = []
+    for name, (metric_type, help_text, samples) in families.items():
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for suffix, value in samples:
+            lines.append('%s%s %s' % (name, suffix, value))
+    return '\n'.join(lines) + '\n'
+
+def write(filename: str, metrics_format: str):
+    """Writes the metrics so far to filename
+
+    The file is replaced in one step, so a collector never reads it half
+    written.
+
+    Args:
+        filename (str): Location of the metrics file
+        metrics_format (str): 'json' or 'prom'
+    """
+    snapshot = get_metrics().snapshot()
+    if metrics_format == 'prom':
+        content = prometheus(snapshot)
+    else:
+        content = json.dumps(snapshot, indent=4) + '\n'
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as metrics_file:
+        metrics_file.write(content)
+    os.replace(temp_filename, filename)
+
+def get_metrics() -> Metrics:
+    """Returns the existing metrics or creates them if the first time
+
+    The metrics are a singleton shared across modules, so that every
+    client and phase of a run adds to the same totals.
+
+    Returns:
+        Metrics: __metrics
+    """
+    global __metrics # pylint: disable=global-statement
+    if __metrics is None:
+        __metrics = Metrics()
+    return __metrics
+
+def phase(name: str):
+    """Times the enclosed block as a phase of the shared metrics"""
+    return get_metrics().phase(name)
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Rate limiting and retry policy shared by the xMatters clients
+
+    xMatters throttles clients that send too many requests with a 429
+    response, and may also answer with a transient 5xx or drop a
+    connection.  RateLimiter spaces requests out with a token bucket whose
+    rate backs off when the instance throttles and creeps back up while
+    requests succeed (additive increase, multiplicative decrease), so the
+    sustained rate settles right at the instance limit.  RetryPolicy
+    decides which failures are retried and for how long to wait first.
+
+.. _Google Python Style Guide:
+   http://google.github.io/styleguide/pyguide.html
+
+"""
+
+import email.utils
+import random
+import threading
+import time
+
+# Statuses worth retrying: throttled, or a transient server side failure
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+class RateLimiter(object):
+    """Token bucket of requests per second, shared by every caller
+
+    A rate of 0 disables the limit.  Each request takes a token; when
+    none are left the caller is told how long to wait for the next one,
+    so the limiter works for threads and coroutines alike.
+
+    Attributes:
+        max_rate (float): The configured requests per second
+        rate (float): The current requests per second, at most max_rate
+    """
+
+    def __init__(self, rate: float):
+        self.max_rate = float(rate or 0)
+        self.rate = self.max_rate
+        self._min_rate = self.max_rate / 32
+        self._step = self.max_rate / 50
+        self._tokens = min(self.max_rate, 1.0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the seconds to wait before using it"""
+        if not self.max_rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            # Allow a burst of up to one second's worth of requests
+            self._tokens = min(max(self.rate, 1.0),
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def throttled(self):
+        """Halves the rate after the instance answered 429"""
+        if self.max_rate:
+            with self._lock:
+                self.rate = max(self._min_rate, self.rate / 2)
+
+    def succeeded(self):
+        """Raises the rate a little towards max_rate after a success"""
+        if self.max_rate and self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self._step)
+
+class RetryPolicy(object):
+    """Decides whether, and after how long, a failed request is retried
+
+    GETs are retried on 429, 5xx and connection errors.  POSTs are only
+    retried on 429, which xMatters answers before applying the request;
+    any other failure may already have created the object.  Waits grow
+    exponentially with full jitter, and never undercut a Retry-After.
+
+    Attributes:
+        retries (int): Retries after the first attempt
+        base (float): Seconds of the first backoff ceiling
+        cap (float): Largest backoff ceiling in seconds
+    """
+
+    def __init__(self, retries: int, base: float = 0.5, cap: float = 30.0):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def delay(self, method: str, attempt: int, status: int = None,
+              retry_after: str = None):
+        """Returns the seconds to wait before retrying, or None to give up
+
+        Args:
+            method (str): The HTTP method
+            attempt (int): Number of attempts made so far, from 1
+            status (int): The response status, None for a connection error
+            retry_after (str): The response's Retry-After header, if any
+        """
+        if attempt > self.retries:
+            return None
+        if method != 'GET' and status != 429:
+            return None
+        if status is not None and status not in _RETRY_STATUSES:
+            return None
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        return max(delay, _parse_retry_after(retry_after))
+
+def _parse_retry_after(value: str) -> float:
+    """Returns the seconds a Retry-After header asks to wait, or 0"""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+def main():
+    """ Only needed by convention """
+    pass
+
+if __name__ == '__main__':
+    main()